@@ -0,0 +1,347 @@
+"""
+Reporte de antigüedad de deuda (0-30 / 31-60 / 61-90 / 90+ días).
+
+Parte de los mismos datos que calcular_deuda_clientes (_cargar_datos_deuda:
+cierre mensual, reabiertos, exclusiones, OTs y pagos), así que la suma de
+los tramos de un cliente es su deuda. Los meses de plan posteriores al
+cierre se expanden, se restan pagos y se clasifican por tramo en arreglos
+de NumPy, sin recorrer cliente por cliente; los saldos congelados en el
+cierre y las OTs son una fila cada uno. Los montos se manejan en céntimos
+(int64) para reproducir exactamente el redondeo de monto_primer_mes.
+
+Cada periodo de plan vence el día de cobranza del ClientePlan (acotado al
+último día del mes); una OT vence en su fecha de creación.
+"""
+import calendar
+from decimal import Decimal
+from django.utils import timezone
+from .dependencias import numpy
+from .models import Cliente, Distrito, Plan, Sector, Servicio
+from .utils import _cargar_datos_deuda
+
+TRAMOS = ['0-30', '31-60', '61-90', '90+']
+DIMENSIONES = [
+    ('distrito', 'Distrito'),
+    ('sector', 'Sector'),
+    ('servicio', 'Servicio'),
+    ('plan', 'Plan'),
+]
+SIN_DATO = 0
+COLUMNAS = ['saldo', 'dias', 'cliente', 'distrito', 'sector', 'servicio',
+            'plan']
+
+
+def _numpy():
+    return numpy('el reporte de antigüedad')
+
+
+def _centimos(valor):
+    return int((Decimal(str(valor or 0)) * 100).to_integral_value())
+
+
+def _indice_mes(np, fechas):
+    """Meses desde 1970-01 para un arreglo datetime64[D]."""
+    return fechas.astype('datetime64[M]').astype(np.int64)
+
+
+def _mes(fecha):
+    """Lo mismo que _indice_mes para una sola fecha."""
+    return (fecha.year - 1970) * 12 + fecha.month - 1
+
+
+def _cierre_del_cliente(datos, cliente_id):
+    """El cierre del que parte el cliente, o None si se recalcula completo."""
+    if cliente_id in datos['reabiertos']:
+        return None
+    return datos['cierre']
+
+
+def _vencimiento(mes, cobranza):
+    dias_mes = calendar.monthrange(mes.year, mes.month)[1]
+    return mes.replace(day=min(max(cobranza or 1, 1), dias_mes))
+
+
+def _claves_plan_mes(plan_ids, meses):
+    # Clave única (plan, mes): los meses desde 1970 caben holgados en 2^20.
+    return plan_ids * (1 << 20) + meses
+
+
+def _buscar(np, claves_ordenadas, valores, claves):
+    """Valor asociado a cada clave, o 0 si no existe."""
+    if not len(claves_ordenadas):
+        return np.zeros(len(claves), dtype=np.int64)
+    pos = np.searchsorted(claves_ordenadas, claves)
+    pos = np.minimum(pos, len(claves_ordenadas) - 1)
+    encontrado = claves_ordenadas[pos] == claves
+    return np.where(encontrado, valores[pos], 0)
+
+
+def _planes(datos):
+    """(cliente_id, ClientePlan) con fecha de inicio, como los recorre
+    _periodos_deuda_cliente."""
+    return [
+        (cliente_id, cp)
+        for cliente_id in datos['cliente_ids']
+        for cp in datos['planes'].get(cliente_id, [])
+        if cp.fecha_inicio
+    ]
+
+
+def _periodos_planes(np, datos, ubicacion):
+    """Expande los meses de plan posteriores al cierre con su antigüedad."""
+    planes = _planes(datos)
+    n = len(planes)
+    hoy_d = np.datetime64(datos['hoy'], 'D')
+    mes_hoy = _mes(datos['hoy'])
+
+    def columna(valores):
+        return np.fromiter(valores, np.int64, n)
+
+    cp_id = columna(cp.id for _, cp in planes)
+    cliente = columna(cliente_id for cliente_id, _ in planes)
+    inicio = np.array(
+        [cp.fecha_inicio for _, cp in planes], dtype='datetime64[D]'
+    )
+    mes_inicio = _indice_mes(np, inicio)
+    # Los clientes que parten del cierre sólo facturan los meses siguientes
+    cierres = [_cierre_del_cliente(datos, c) for c, _ in planes]
+    despues = columna(_mes(c.periodo) + 1 if c else 0 for c in cierres)
+    desde = np.maximum(mes_inicio, despues)
+    cantidad = np.clip(mes_hoy - desde + 1, 0, None)
+
+    # Expansión de rangos: fila i se repite cantidad[i] veces
+    fila = np.repeat(np.arange(n), cantidad)
+    desplazamiento = np.cumsum(cantidad) - cantidad
+    mes = desde[fila] + (np.arange(len(fila)) - desplazamiento[fila])
+
+    primer_dia = mes.astype('datetime64[M]').astype('datetime64[D]')
+    dias_mes = (
+        (mes + 1).astype('datetime64[M]').astype('datetime64[D]')
+        - primer_dia
+    ).astype(np.int64)
+
+    # Cargo del mes, prorrateando el primero (ROUND_HALF_UP en céntimos)
+    precio = columna(_centimos(cp.plan.precio) for _, cp in planes)[fila]
+    dia_inicio = (
+        inicio - inicio.astype('datetime64[M]')
+    ).astype(np.int64)[fila] + 1
+    es_primero = (mes == mes_inicio[fila]) & (dia_inicio > 1)
+    restantes = dias_mes - dia_inicio + 1
+    prorrateo = (2 * precio * restantes + dias_mes) // (2 * dias_mes)
+    cargo = np.where(es_primero, prorrateo, precio)
+
+    claves = _claves_plan_mes(cp_id[fila], mes)
+
+    # Exclusiones como diferencia de conjuntos
+    claves_excluidas = np.array([
+        _claves_plan_mes(plan_id, _mes(periodo))
+        for por_plan in datos['exclusiones_plan'].values()
+        for plan_id, periodos in por_plan.items()
+        for periodo in periodos
+    ], dtype=np.int64)
+    vigente = ~np.isin(claves, claves_excluidas)
+
+    # Como en calcular_meses_deuda, sólo cuentan los pagos imputados al
+    # primer día del mes.
+    pagos = sorted(
+        (_claves_plan_mes(plan_id, _mes(periodo)), _centimos(total))
+        for (plan_id, periodo), total in datos['pagos_plan'].items()
+        if periodo.day == 1
+    )
+    pagado = _buscar(
+        np,
+        np.array([x[0] for x in pagos], dtype=np.int64),
+        np.array([x[1] for x in pagos], dtype=np.int64),
+        claves
+    )
+
+    saldo = cargo - pagado
+    con_deuda = vigente & (cargo > 0) & (saldo > 0)
+
+    cobranza = columna(cp.fecha_cobranza or 1 for _, cp in planes)
+    vencimiento = primer_dia + np.minimum(
+        np.clip(cobranza[fila], 1, None), dias_mes
+    ) - 1
+    dias = (hoy_d - vencimiento).astype(np.int64)
+
+    sel = fila[con_deuda]
+    return {
+        'saldo': saldo[con_deuda],
+        'dias': dias[con_deuda],
+        'cliente': cliente[sel],
+        'distrito': columna(
+            ubicacion.get(c, (SIN_DATO, SIN_DATO))[1] for c, _ in planes
+        )[sel],
+        'sector': columna(
+            ubicacion.get(c, (SIN_DATO, SIN_DATO))[0] for c, _ in planes
+        )[sel],
+        'servicio': columna(
+            cp.plan.servicio_id or SIN_DATO for _, cp in planes
+        )[sel],
+        'plan': columna(cp.plan_id for _, cp in planes)[sel],
+    }
+
+
+def _periodos_sueltos(np, datos, ubicacion):
+    """Saldos congelados en el cierre y OTs: una fila por periodo con saldo,
+    con las mismas reglas que _periodos_deuda_cliente."""
+    hoy = datos['hoy']
+    planes = {cp.id: cp for _, cp in _planes(datos)}
+    filas = []
+
+    def agregar(cargo, pagado, vence, cliente_id, plan_id, servicio_id):
+        cargo, pagado = _centimos(cargo), _centimos(pagado)
+        if cargo <= 0 or pagado >= cargo:
+            return
+        sector, distrito = ubicacion.get(cliente_id, (SIN_DATO, SIN_DATO))
+        filas.append((
+            cargo - pagado, (hoy - vence).days, cliente_id, distrito,
+            sector, servicio_id or SIN_DATO, plan_id or SIN_DATO
+        ))
+
+    def agregar_ot(ot, cargo, pagado):
+        cp = planes.get(ot.plan_asociado_id)
+        agregar(
+            cargo, pagado, timezone.localtime(ot.fecha_creacion).date(),
+            ot.cliente_id, cp.plan_id if cp else None,
+            (cp.plan.servicio_id if cp else None) or ot.servicio_afectado_id
+        )
+
+    for cliente_id in datos['cliente_ids']:
+        excluidos_ot = datos['exclusiones_ot'].get(cliente_id, set())
+        if _cierre_del_cliente(datos, cliente_id):
+            excluidos_plan = datos['exclusiones_plan'].get(cliente_id, {})
+            for saldo in datos['saldos_cierre'].get(cliente_id, []):
+                if saldo.ot_asociada_id:
+                    ot = saldo.ot_asociada
+                    if ot.exonerada or ot.id in excluidos_ot:
+                        continue
+                    posterior = datos['pagos_ot_posteriores'].get(ot.id)
+                    agregar_ot(
+                        ot, saldo.monto_cargado,
+                        saldo.monto_pagado + (posterior or 0)
+                    )
+                    continue
+                cp = planes.get(saldo.plan_asociado_id)
+                if cp is None or saldo.periodo_mes in excluidos_plan.get(
+                    cp.id, ()
+                ):
+                    continue
+                posterior = datos['pagos_plan_posteriores'].get(
+                    (cp.id, saldo.periodo_mes)
+                )
+                agregar(
+                    saldo.monto_cargado,
+                    saldo.monto_pagado + (posterior or 0),
+                    _vencimiento(saldo.periodo_mes, cp.fecha_cobranza),
+                    cliente_id, cp.plan_id, cp.plan.servicio_id
+                )
+        for ot in datos['ots'].get(cliente_id, []):
+            if ot.id not in excluidos_ot:
+                agregar_ot(ot, ot.monto, datos['pagos_ot'].get(ot.id))
+
+    n = len(filas)
+    return {
+        clave: np.fromiter((f[pos] for f in filas), np.int64, n)
+        for pos, clave in enumerate(COLUMNAS)
+    }
+
+
+def _tramo(np, dias):
+    """0: 0-30 (incluye lo aún no vencido), 1: 31-60, 2: 61-90, 3: 90+."""
+    return np.digitize(dias, [31, 61, 91])
+
+
+def _nombres(dimension):
+    if dimension == 'distrito':
+        return dict(Distrito.objects.values_list('id', 'nombre'))
+    if dimension == 'sector':
+        return {
+            s.id: str(s)
+            for s in Sector.objects.select_related('distrito')
+        }
+    if dimension == 'servicio':
+        return dict(Servicio.objects.values_list('id', 'nombre'))
+    return {
+        p.id: (
+            f"{p.servicio.nombre} - {p.nombre}" if p.servicio else p.nombre
+        )
+        for p in Plan.objects.select_related('servicio')
+    }
+
+
+def calcular_antiguedad(hoy=None, clientes=None):
+    """
+    Calcula la deuda de la cartera agrupada por tramo de antigüedad.
+
+    Args:
+        hoy: Fecha de corte (None = hoy), como en calcular_deuda_clientes
+        clientes: QuerySet de Cliente o None para toda la cartera
+
+    Returns:
+        dict: {
+            'hoy': fecha de corte,
+            'tramos': TRAMOS,
+            'resumen': [{'tramo', 'monto'}] por tramo,
+            'total': deuda total,
+            'dimensiones': {dimension: {'titulo', 'filas'}} donde cada fila
+                es {'nombre', 'tramos': [4 montos], 'total', 'clientes'}
+        }
+    """
+    np = _numpy()
+    cargados = _cargar_datos_deuda(clientes, fecha_corte=hoy)
+    hoy = cargados['hoy']
+    ubicacion = {
+        pk: (sector or SIN_DATO, distrito or SIN_DATO)
+        for pk, sector, distrito in Cliente.objects.filter(
+            id__in=cargados['cliente_ids']
+        ).values_list('id', 'via__sector_id', 'via__sector__distrito_id')
+    }
+    planes = _periodos_planes(np, cargados, ubicacion)
+    sueltos = _periodos_sueltos(np, cargados, ubicacion)
+    datos = {
+        clave: np.concatenate([planes[clave], sueltos[clave]])
+        for clave in COLUMNAS
+    }
+    tramo = _tramo(np, datos['dias'])
+    saldo = datos['saldo']
+
+    def a_soles(centimos):
+        return (Decimal(int(centimos)) / 100).quantize(Decimal('0.01'))
+
+    totales_tramo = np.zeros(4, dtype=np.int64)
+    np.add.at(totales_tramo, tramo, saldo)
+
+    resultado = {
+        'hoy': hoy,
+        'tramos': TRAMOS,
+        'resumen': [
+            {'tramo': nombre, 'monto': a_soles(monto)}
+            for nombre, monto in zip(TRAMOS, totales_tramo)
+        ],
+        'total': a_soles(totales_tramo.sum()),
+        'dimensiones': {},
+    }
+    for dimension, titulo in DIMENSIONES:
+        grupos, codigo = np.unique(datos[dimension], return_inverse=True)
+        montos = np.zeros((len(grupos), 4), dtype=np.int64)
+        np.add.at(montos, (codigo, tramo), saldo)
+        pares = np.unique(
+            np.stack([codigo, datos['cliente']]), axis=1
+        ) if len(codigo) else np.zeros((2, 0), dtype=np.int64)
+        clientes = np.bincount(pares[0], minlength=len(grupos))
+        nombres = _nombres(dimension)
+        filas = []
+        for idx in np.argsort(-montos.sum(axis=1), kind='stable'):
+            grupo_id = int(grupos[idx])
+            filas.append({
+                'nombre': nombres.get(grupo_id, 'Sin asignar'),
+                'tramos': [a_soles(x) for x in montos[idx]],
+                'total': a_soles(montos[idx].sum()),
+                'clientes': int(clientes[idx]),
+            })
+        resultado['dimensiones'][dimension] = {
+            'titulo': titulo,
+            'filas': filas,
+        }
+    return resultado
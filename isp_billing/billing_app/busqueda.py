@@ -0,0 +1,227 @@
+"""
+Búsqueda de clientes y pagos sobre texto normalizado.
+
+Cada Cliente y Pago guarda en `busqueda` sus datos en minúsculas, sin
+tildes y separados en palabras ("nunez garcia juan 40000001"); las señales
+lo mantienen al día y el comando indexar_busqueda lo rellena de cero.
+
+- PostgreSQL: cada palabra buscada se filtra con LIKE '%palabra%' sobre
+  `busqueda`, resuelto con un índice GIN de trigramas (migración 0024).
+- Otras bases (SQLite): cada palabra se busca como prefijo en la tabla
+  TokenBusqueda, con un rango sobre un índice (tipo, token).
+
+Los resultados llevan `relevancia`: DNI o comprobante exacto, luego
+coincidencia desde el inicio, luego desde el inicio de una palabra y por
+último el resto.
+
+autocompletar_clientes() atiende el buscador rápido: pocas filas, sólo los
+campos del selector, y un caché corto para los prefijos más escritos.
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from .cache_deuda import incrementar_version, leer_version
+from .models import Cliente, Pago, TokenBusqueda
+from .texto import normalizar
+
+LARGO_TOKEN = 50
+LIMITE_AUTOCOMPLETAR = 10
+MAXIMO_AUTOCOMPLETAR = 20
+# Sólo se cachean los prefijos cortos: son los que más se repiten al
+# teclear y los que más filas recorren
+LARGO_PREFIJO_CACHE = 5
+TIMEOUT_AUTOCOMPLETAR = 60
+CLAVE_VERSION_AUTOCOMPLETAR = 'autocompletar:clientes:v'
+
+
+def tokens(texto):
+    """Palabras normalizadas y sin repetir, en orden de aparición."""
+    return list(dict.fromkeys(
+        token[:LARGO_TOKEN] for token in normalizar(texto).split()
+    ))
+
+
+def texto_cliente(cliente):
+    return normalizar(
+        f'{cliente.apellidos} {cliente.nombres} {cliente.dni}'
+    )
+
+
+def texto_pago(pago, cliente=None):
+    cliente = cliente or pago.cliente
+    return normalizar(
+        f'{pago.serie_numero} {pago.tipo_comprobante} '
+        f'{texto_cliente(cliente)}'
+    )
+
+
+def _usa_trigramas():
+    return connection.vendor == 'postgresql'
+
+
+def _guardar_tokens(tipo, textos):
+    """Reemplaza los tokens de los objetos de `textos` ({id: texto})."""
+    if _usa_trigramas() or not textos:
+        return
+    TokenBusqueda.objects.filter(
+        tipo=tipo, objeto_id__in=list(textos)
+    ).delete()
+    TokenBusqueda.objects.bulk_create([
+        TokenBusqueda(tipo=tipo, objeto_id=objeto_id, token=token)
+        for objeto_id, texto in textos.items()
+        for token in tokens(texto)
+    ])
+
+
+def borrar_tokens(tipo, objeto_id):
+    TokenBusqueda.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+
+
+def indexar_pagos(pagos):
+    """Recalcula `busqueda` de los pagos dados (con su cliente cargado)."""
+    textos = {}
+    for pago in pagos:
+        texto = texto_pago(pago)
+        textos[pago.pk] = texto
+        if pago.busqueda != texto:
+            Pago.objects.filter(pk=pago.pk).update(busqueda=texto)
+            pago.busqueda = texto
+    _guardar_tokens(TokenBusqueda.TIPO_PAGO, textos)
+
+
+def indexar_clientes(clientes, con_pagos=True):
+    """Recalcula `busqueda` de los clientes dados y, si se pide, la de los
+    pagos de aquellos cuyo nombre o DNI cambió."""
+    textos = {}
+    cambiados = []
+    for cliente in clientes:
+        texto = texto_cliente(cliente)
+        textos[cliente.pk] = texto
+        if cliente.busqueda != texto:
+            Cliente.objects.filter(pk=cliente.pk).update(busqueda=texto)
+            cliente.busqueda = texto
+            cambiados.append(cliente.pk)
+    _guardar_tokens(TokenBusqueda.TIPO_CLIENTE, textos)
+    if con_pagos and cambiados:
+        indexar_pagos(
+            Pago.objects.filter(cliente_id__in=cambiados)
+            .select_related('cliente')
+        )
+
+
+def _coincide(tipo, palabras):
+    """Q que exige que cada palabra aparezca en el objeto."""
+    filtro = Q()
+    for palabra in palabras:
+        if _usa_trigramas():
+            filtro &= Q(busqueda__contains=palabra)
+        else:
+            filtro &= Q(pk__in=TokenBusqueda.objects.filter(
+                tipo=tipo,
+                token__gte=palabra,
+                token__lt=palabra + '\uffff'
+            ).values('objeto_id'))
+    return filtro
+
+
+def _relevancia(frase, exacto):
+    return Case(
+        When(exacto, then=Value(3)),
+        When(busqueda__startswith=frase, then=Value(2)),
+        When(busqueda__contains=f' {frase}', then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def buscar_clientes(queryset, consulta):
+    """Filtra `queryset` (de Cliente) por `consulta` y anota `relevancia`;
+    si la consulta no tiene palabras lo devuelve sin cambios."""
+    palabras = tokens(consulta)
+    if not palabras:
+        return queryset
+    frase = ' '.join(palabras)
+    return queryset.filter(
+        _coincide(TokenBusqueda.TIPO_CLIENTE, palabras)
+    ).annotate(relevancia=_relevancia(frase, Q(dni=consulta.strip())))
+
+
+def buscar_pagos(queryset, consulta):
+    """Como buscar_clientes, para un queryset de Pago."""
+    palabras = tokens(consulta)
+    if not palabras:
+        return queryset
+    frase = ' '.join(palabras)
+    return queryset.filter(
+        _coincide(TokenBusqueda.TIPO_PAGO, palabras)
+    ).annotate(relevancia=_relevancia(
+        frase, Q(serie_numero__iexact=consulta.strip())
+    ))
+
+
+def invalidar_autocompletar():
+    incrementar_version(CLAVE_VERSION_AUTOCOMPLETAR)
+
+
+def _sugerencias(consulta, limite):
+    palabras = tokens(consulta)
+    if not palabras:
+        return []
+    campos = ('id', 'dni', 'apellidos', 'nombres', 'estado_activo')
+    if len(palabras) == 1 and palabras[0].isdigit():
+        # DNI: rango sobre el índice único en lugar de LIKE
+        filas = (
+            Cliente.objects.filter(
+                dni__gte=palabras[0], dni__lt=palabras[0] + '\uffff'
+            )
+            .order_by('dni')
+            .values(*campos)[:limite]
+        )
+    else:
+        # Primero los que empiezan por lo escrito (rango sobre el índice de
+        # `busqueda`); sólo si faltan se recurre a la búsqueda por palabras
+        frase = ' '.join(palabras)
+        filas = list(
+            Cliente.objects.filter(
+                busqueda__gte=frase, busqueda__lt=frase + '\uffff'
+            )
+            .order_by('busqueda', 'id')
+            .values(*campos)[:limite]
+        )
+        if len(filas) < limite:
+            filas += list(
+                buscar_clientes(Cliente.objects.all(), consulta)
+                .exclude(pk__in=[fila['id'] for fila in filas])
+                .order_by('-relevancia', 'apellidos', 'nombres', 'id')
+                .values(*campos)[:limite - len(filas)]
+            )
+    return [
+        {
+            'id': fila['id'],
+            'dni': fila['dni'],
+            'nombre': f"{fila['apellidos']}, {fila['nombres']}",
+            'activo': fila['estado_activo'],
+        }
+        for fila in filas
+    ]
+
+
+def autocompletar_clientes(consulta, limite=LIMITE_AUTOCOMPLETAR):
+    """
+    Primeros `limite` clientes cuyo DNI empieza por `consulta` o cuyas
+    palabras empiezan por las de `consulta`.
+
+    Returns:
+        list: dicts {'id', 'dni', 'nombre', 'activo'}
+    """
+    limite = max(1, min(int(limite), MAXIMO_AUTOCOMPLETAR))
+    normalizada = ' '.join(tokens(consulta))
+    if len(normalizada) > LARGO_PREFIJO_CACHE:
+        return _sugerencias(consulta, limite)
+    version = leer_version(CLAVE_VERSION_AUTOCOMPLETAR)
+    clave = f'autocompletar:{version}:{limite}:{normalizada}'
+    sugerencias = cache.get(clave)
+    if sugerencias is None:
+        sugerencias = _sugerencias(consulta, limite)
+        cache.set(clave, sugerencias, timeout=TIMEOUT_AUTOCOMPLETAR)
+    return sugerencias
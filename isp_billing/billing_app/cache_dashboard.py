@@ -0,0 +1,88 @@
+"""
+Caché de los indicadores del dashboard.
+
+Cada familia (pagos, egresos, clientes, planes, OTs y los listados de
+últimos registros) se guarda por separado bajo una clave que incluye el día
+local y la versión de los modelos de los que depende. Las señales de
+signals.py incrementan la versión del modelo que cambia, de modo que un
+pago nuevo sólo recalcula los widgets de pagos. El TTL corto cubre los
+cambios que no pasan por señales (update() masivos, scripts).
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .cache_deuda import incrementar_version, leer_version
+from .estadisticas import (
+    Estadisticas, resumen_clientes, resumen_egresos, resumen_ordenes,
+    resumen_pagos, resumen_planes
+)
+from .models import Cliente, OrdenTecnica, Pago
+
+TIMEOUT_DASHBOARD = 60 * 5
+
+
+def _clave_version(grupo):
+    return f'dashboard:{grupo}:v'
+
+
+def _cacheado(nombre, grupos, calcular):
+    hoy = timezone.localdate()
+    versiones = ':'.join(
+        str(leer_version(_clave_version(grupo))) for grupo in grupos
+    )
+    clave = f'dashboard:{nombre}:{versiones}:{hoy.isoformat()}'
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular(hoy)
+        cache.set(clave, valor, timeout=TIMEOUT_DASHBOARD)
+    return valor
+
+
+def estadisticas_dashboard_cacheadas():
+    """Igual que estadisticas_dashboard, leyendo cada familia del caché."""
+    return Estadisticas(
+        hoy=timezone.localdate(),
+        pagos=_cacheado('pagos', ['pagos'], resumen_pagos),
+        egresos=_cacheado('egresos', ['egresos'], resumen_egresos),
+        clientes=_cacheado(
+            'clientes', ['clientes'], lambda hoy: resumen_clientes()
+        ),
+        planes=_cacheado('planes', ['planes'], lambda hoy: resumen_planes()),
+        ordenes=_cacheado(
+            'ordenes', ['ordenes'], lambda hoy: resumen_ordenes()
+        ),
+    )
+
+
+def ultimos_registros_cacheados():
+    """Últimos clientes, pagos y OTs del dashboard (5 de cada uno)."""
+    return {
+        'ultimos_clientes': _cacheado(
+            'ultimos_clientes', ['clientes'],
+            lambda hoy: list(
+                Cliente.objects.all().order_by('-fecha_registro')[:5]
+            )
+        ),
+        'ultimos_pagos': _cacheado(
+            'ultimos_pagos', ['pagos', 'clientes'],
+            lambda hoy: list(
+                Pago.objects.select_related('cliente')
+                .order_by('-fecha')[:5]
+            )
+        ),
+        'ultimas_ots': _cacheado(
+            'ultimas_ots', ['ordenes', 'clientes'],
+            lambda hoy: list(
+                OrdenTecnica.objects.select_related('cliente', 'concepto')
+                .order_by('-fecha_creacion')[:5]
+            )
+        ),
+    }
+
+
+def invalidar_dashboard(grupo):
+    """Invalida los indicadores que dependen de `grupo` al confirmarse la
+    transacción."""
+    transaction.on_commit(
+        lambda: incrementar_version(_clave_version(grupo))
+    )
@@ -0,0 +1,110 @@
+"""
+Caché de la deuda calculada por cliente.
+
+La clave combina el cliente, su versión de datos, una versión global del
+catálogo (precios y nombres de planes/conceptos), el estado de cuenta
+vigente y el mes en curso; cuando precalcular_deuda agrega los periodos del
+mes nuevo el estado de cuenta cambia y con él la clave. Las señales de
+signals.py incrementan las versiones cuando cambian los datos que
+intervienen en el cálculo. Los contadores de aciertos y fallos se guardan
+en el mismo caché.
+
+Funciona con los backends de memoria local y de archivos de Django. Con
+LocMemCache cada worker de gunicorn tiene su propio caché y no ve las
+versiones que incrementa otro; por eso la clave lleva además el id del
+EstadoCuenta del cliente, que se lee de la base: las señales lo borran en
+la misma transacción que cada pago y la siguiente lectura lo vuelve a
+crear, así que un pago registrado en otro worker cambia la clave también
+en éste.
+"""
+import logging
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .cuentas import estado_vigente, obtener_deuda_cliente
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_DEUDA = 60 * 60 * 24
+CLAVE_VERSION_CATALOGO = 'deuda:catalogo:v'
+CLAVE_HITS = 'deuda:stats:hits'
+CLAVE_MISSES = 'deuda:stats:misses'
+
+
+def _clave_version(cliente_id):
+    return f'deuda:cliente:{cliente_id}:v'
+
+
+def leer_version(clave):
+    # add() no pisa una versión existente
+    cache.add(clave, 1, timeout=None)
+    return cache.get(clave, 1)
+
+
+def incrementar_version(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 2, timeout=None)
+
+
+def _contar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 1, timeout=None)
+
+
+def clave_deuda(cliente_id, estado_id):
+    periodo = timezone.now().date().strftime('%Y-%m')
+    return (
+        f'deuda:{cliente_id}'
+        f':{leer_version(_clave_version(cliente_id))}'
+        f':{leer_version(CLAVE_VERSION_CATALOGO)}'
+        f':{estado_id}'
+        f':{periodo}'
+    )
+
+
+def obtener_deuda_cacheada(cliente):
+    """Deuda del cliente (estructura de calcular_meses_deuda), desde caché
+    si la versión y el estado de cuenta siguen vigentes."""
+    estado_id = estado_vigente(cliente)
+    if estado_id is not None:
+        deuda = cache.get(clave_deuda(cliente.pk, estado_id))
+        if deuda is not None:
+            _contar(CLAVE_HITS)
+            return deuda
+    _contar(CLAVE_MISSES)
+    # Recalcula las cuentas vencidas, con lo que el estado pasa a vigente
+    deuda = obtener_deuda_cliente(cliente)
+    estado_id = estado_id or estado_vigente(cliente)
+    cache.set(clave_deuda(cliente.pk, estado_id), deuda, timeout=TIMEOUT_DEUDA)
+    return deuda
+
+
+def invalidar_deuda_cliente(cliente_id):
+    """Incrementa la versión del cliente al confirmarse la transacción, para
+    que ninguna lectura concurrente guarde datos previos al commit con la
+    versión nueva."""
+    if not cliente_id:
+        return
+    transaction.on_commit(
+        lambda: incrementar_version(_clave_version(cliente_id))
+    )
+
+
+def invalidar_deuda_catalogo():
+    """Invalida la deuda cacheada de todos los clientes."""
+    transaction.on_commit(lambda: incrementar_version(CLAVE_VERSION_CATALOGO))
+
+
+def estadisticas_cache_deuda():
+    hits = cache.get(CLAVE_HITS, 0)
+    misses = cache.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio': round(hits / total, 4) if total else 0,
+    }
@@ -0,0 +1,105 @@
+"""
+Cierres mensuales de cartera.
+
+Un cierre guarda los saldos pendientes de cada cliente al último día de un
+mes. calcular_meses_deuda parte del último cierre anterior a la fecha de
+corte y sólo recorre lo posterior (pagos nuevos, meses siguientes y OTs
+creadas después), en lugar de reprocesar todo el historial.
+
+Los cambios retroactivos (un plan con fecha de inicio anterior al cierre,
+un pago antiguo eliminado o una exclusión quitada) marcan al cliente como
+reabierto en los cierres afectados; para esos clientes se recalcula todo
+el historial.
+"""
+import calendar
+import logging
+from datetime import datetime
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from .models import CierreMensual, CierreSaldo, Cliente
+from .utils import calcular_deuda_clientes
+
+logger = logging.getLogger(__name__)
+
+
+def fin_de_mes(periodo):
+    """Último día del mes de `periodo`."""
+    return periodo.replace(
+        day=calendar.monthrange(periodo.year, periodo.month)[1]
+    )
+
+
+def cerrar_mes(periodo, reemplazar=False):
+    """
+    Genera el cierre del mes de `periodo` con la deuda a su último día.
+
+    Args:
+        periodo: Fecha cualquiera del mes a cerrar
+        reemplazar: Si el mes ya está cerrado, rehace el cierre
+
+    Returns:
+        CierreMensual: Cierre creado
+
+    Raises:
+        ValueError: Si el mes no ha terminado o ya está cerrado
+    """
+    periodo = periodo.replace(day=1)
+    fecha_corte = fin_de_mes(periodo)
+    if fecha_corte >= timezone.now().date():
+        raise ValueError(
+            f'El mes {periodo:%Y-%m} aún no termina; no se puede cerrar.'
+        )
+
+    with transaction.atomic():
+        existente = CierreMensual.objects.filter(periodo=periodo).first()
+        if existente:
+            if not reemplazar:
+                raise ValueError(f'El mes {periodo:%Y-%m} ya está cerrado.')
+            existente.delete()
+
+        deudas = calcular_deuda_clientes(
+            Cliente.objects.all(), fecha_corte=fecha_corte
+        )
+        cierre = CierreMensual.objects.create(
+            periodo=periodo,
+            fecha_corte=fecha_corte
+        )
+        saldos = []
+        total = Decimal('0')
+        for cliente_id, periodos in deudas.items():
+            for item in periodos:
+                es_ot = item['tipo'] == 'OT'
+                saldos.append(CierreSaldo(
+                    cierre=cierre,
+                    cliente_id=cliente_id,
+                    plan_asociado_id=None if es_ot else item['id'],
+                    periodo_mes=item['mes'],
+                    ot_asociada_id=item['id'] if es_ot else None,
+                    monto_cargado=item['monto_original'],
+                    monto_pagado=item['pagado'],
+                    saldo=item['saldo']
+                ))
+                total += Decimal(str(item['saldo']))
+        CierreSaldo.objects.bulk_create(saldos, batch_size=500)
+        cierre.total_deuda = total
+        cierre.save(update_fields=['total_deuda'])
+
+    logger.info(
+        'Cierre %s generado: %s saldos, total %s',
+        periodo.strftime('%Y-%m'), len(saldos), total
+    )
+    return cierre
+
+
+def reabrir_cliente(cliente_id, desde):
+    """
+    Marca al cliente como reabierto en los cierres con fecha de corte igual
+    o posterior a `desde`, para que su deuda se recalcule completa.
+    """
+    if not cliente_id or desde is None:
+        return
+    if isinstance(desde, datetime):
+        desde = timezone.localtime(desde).date()
+    for cierre in CierreMensual.objects.filter(fecha_corte__gte=desde):
+        cierre.reabiertos.add(cliente_id)
@@ -0,0 +1,268 @@
+"""
+Cola de reportes en segundo plano sobre la base de datos.
+
+Las vistas encolan un TrabajoReporte y responden de inmediato; el comando
+run_report_worker toma los pendientes, genera el archivo con las mismas
+funciones de reportes.py y lo guarda en MEDIA_ROOT/reportes/. Los archivos
+vencen a las REPORTES_EXPIRACION_HORAS (24 por defecto) y se borran en la
+limpieza periódica del worker.
+
+El mismo worker genera de antemano los PDF de comprobantes (trabajos de
+tipo TIPO_COMPROBANTE, ver comprobantes.py); esos no dejan archivo en el
+trabajo sino en ComprobantePDF. Los lotes de impresión que no entran en el
+timeout de una petición (TIPO_IMPRESION, ver impresion.py) sí dejan el PDF
+unido en el trabajo, para descargarlo como un reporte más.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .comprobantes import (
+    FORMATO_PDF, formato_pdf, obtener_comprobante, pago_para_comprobante
+)
+from .exportacion import FORMATOS, guardar_reporte, nombre_archivo
+from .impresion import imprimir_comprobantes, pagos_a_imprimir
+from .models import TrabajoReporte
+from .reportes import REPORTES
+
+logger = logging.getLogger(__name__)
+
+# Mientras procesa un trabajo el worker renueva su `latido` cada
+# LATIDO_CADA segundos. Uno PROCESANDO sin latido reciente se da por
+# abandonado (el worker murió a mitad) y vuelve a la cola; los que siguen
+# latiendo se dejan terminar aunque tarden horas.
+LATIDO_CADA = 30
+LATIDO_VENCIDO = timedelta(seconds=4 * LATIDO_CADA)
+TIPO_COMPROBANTE = 'comprobante'
+TIPO_IMPRESION = 'impresion'
+
+
+def _horas_expiracion():
+    return getattr(settings, 'REPORTES_EXPIRACION_HORAS', 24)
+
+
+def encolar_reporte(tipo, formato='xlsx', hoja=0, usuario=None):
+    """
+    Encola un reporte, o devuelve el trabajo idéntico que ya está en curso.
+
+    Raises:
+        ValueError: Si el tipo o el formato no existen
+    """
+    if tipo not in REPORTES:
+        raise ValueError(f'Reporte desconocido: {tipo}')
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato no soportado: {formato}')
+    hoja = hoja if formato == 'csv' else 0
+    return _encolar(
+        clave=f'{tipo}:{formato}:{hoja}',
+        tipo=tipo,
+        formato=formato,
+        hoja=hoja,
+        solicitado_por=usuario
+    )
+
+
+def _encolar(clave, **campos):
+    existente = TrabajoReporte.objects.filter(
+        clave=clave, estado__in=TrabajoReporte.EN_CURSO
+    ).first()
+    if existente:
+        return existente
+    try:
+        with transaction.atomic():
+            return TrabajoReporte.objects.create(clave=clave, **campos)
+    except IntegrityError:
+        # Otro pedido idéntico se encoló entre la consulta y el insert
+        return TrabajoReporte.objects.get(
+            clave=clave, estado__in=TrabajoReporte.EN_CURSO
+        )
+
+
+def encolar_impresion(desde=None, hasta=None, sector=None, ids=None,
+                      formato=FORMATO_PDF, usuario=None):
+    """
+    Encola un lote de comprobantes (mismos criterios que pagos_a_imprimir)
+    para imprimirlo en un solo PDF; un pedido idéntico del mismo usuario en
+    curso devuelve el mismo trabajo.
+    """
+    formato = formato_pdf(formato)
+    parametros = {
+        'desde': desde.isoformat() if desde else None,
+        'hasta': hasta.isoformat() if hasta else None,
+        'sector': sector or None,
+        'ids': sorted(ids or []),
+    }
+    huella = hashlib.sha256(
+        json.dumps(parametros, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:32]
+    usuario_id = usuario.pk if usuario else ''
+    return _encolar(
+        clave=f'{TIPO_IMPRESION}:{formato}:{usuario_id}:{huella}',
+        tipo=TIPO_IMPRESION,
+        formato=formato,
+        parametros=parametros,
+        solicitado_por=usuario
+    )
+
+
+def encolar_comprobante(pago_id, formato=FORMATO_PDF):
+    """Encola la generación del PDF del pago, salvo que ya esté en cola."""
+    formato = formato_pdf(formato)
+    clave = f'{TIPO_COMPROBANTE}:{pago_id}:{formato}'
+    try:
+        with transaction.atomic():
+            return TrabajoReporte.objects.create(
+                tipo=TIPO_COMPROBANTE,
+                formato=formato,
+                clave=clave,
+                pago_id=pago_id
+            )
+    except IntegrityError:
+        return TrabajoReporte.objects.filter(
+            clave=clave, estado__in=TrabajoReporte.EN_CURSO
+        ).first()
+
+
+def _procesar_comprobante(trabajo):
+    pago = pago_para_comprobante(trabajo.pago_id).first()
+    if pago is not None:
+        obtener_comprobante(pago, trabajo.formato)
+
+
+def _generar_impresion(trabajo):
+    parametros = trabajo.parametros
+    pagos = pagos_a_imprimir(
+        desde=parse_date(parametros.get('desde') or ''),
+        hasta=parse_date(parametros.get('hasta') or ''),
+        sector=parametros.get('sector'),
+        ids=parametros.get('ids')
+    )
+    with tempfile.TemporaryFile() as salida:
+        imprimir_comprobantes(pagos, salida, trabajo.formato)
+        salida.seek(0)
+        trabajo.archivo.save(
+            f'comprobantes-{trabajo.pk}.pdf', File(salida), save=False
+        )
+
+
+def tomar_trabajo():
+    """Marca como PROCESANDO el pendiente más antiguo y lo devuelve; None si
+    no hay. El update condicional evita que dos workers tomen el mismo."""
+    while True:
+        trabajo = (
+            TrabajoReporte.objects.filter(
+                estado=TrabajoReporte.ESTADO_PENDIENTE
+            )
+            .order_by('creado', 'id')
+            .first()
+        )
+        if trabajo is None:
+            return None
+        ahora = timezone.now()
+        tomado = TrabajoReporte.objects.filter(
+            pk=trabajo.pk, estado=TrabajoReporte.ESTADO_PENDIENTE
+        ).update(
+            estado=TrabajoReporte.ESTADO_PROCESANDO,
+            iniciado=ahora,
+            latido=ahora
+        )
+        if tomado:
+            trabajo.estado = TrabajoReporte.ESTADO_PROCESANDO
+            trabajo.iniciado = trabajo.latido = ahora
+            return trabajo
+
+
+@contextmanager
+def _latiendo(trabajo):
+    """Renueva el latido del trabajo desde un hilo mientras dura el bloque."""
+    detener = threading.Event()
+
+    def latir():
+        try:
+            while not detener.wait(LATIDO_CADA):
+                TrabajoReporte.objects.filter(
+                    pk=trabajo.pk, estado=TrabajoReporte.ESTADO_PROCESANDO
+                ).update(latido=timezone.now())
+        finally:
+            # La conexión del hilo no la cierra nadie más
+            connection.close()
+
+    hilo = threading.Thread(
+        target=latir, name=f'latido-{trabajo.pk}', daemon=True
+    )
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join()
+
+
+def _generar_reporte(trabajo):
+    _, construir = REPORTES[trabajo.tipo]
+    filename, sheets = construir()
+    nombre = nombre_archivo(filename, sheets, trabajo.formato, trabajo.hoja)
+    with tempfile.TemporaryFile() as salida:
+        guardar_reporte(
+            salida, filename, sheets, trabajo.formato, trabajo.hoja
+        )
+        salida.seek(0)
+        trabajo.archivo.save(nombre, File(salida), save=False)
+
+
+def procesar_trabajo(trabajo):
+    """Genera el archivo del trabajo y lo deja LISTO (o en ERROR)."""
+    try:
+        with _latiendo(trabajo):
+            if trabajo.tipo == TIPO_COMPROBANTE:
+                _procesar_comprobante(trabajo)
+            elif trabajo.tipo == TIPO_IMPRESION:
+                _generar_impresion(trabajo)
+            else:
+                _generar_reporte(trabajo)
+    except Exception as exc:
+        logger.exception('Error generando el reporte %s', trabajo.pk)
+        trabajo.estado = TrabajoReporte.ESTADO_ERROR
+        trabajo.error = str(exc)
+    else:
+        trabajo.estado = TrabajoReporte.ESTADO_LISTO
+    trabajo.terminado = timezone.now()
+    trabajo.expira = trabajo.terminado + timedelta(hours=_horas_expiracion())
+    trabajo.save()
+    return trabajo
+
+
+def limpiar_reportes():
+    """
+    Borra los trabajos vencidos con su archivo y devuelve a la cola los
+    PROCESANDO cuyo worker dejó de latir.
+
+    Returns:
+        int: Trabajos borrados
+    """
+    ahora = timezone.now()
+    limite = ahora - LATIDO_VENCIDO
+    TrabajoReporte.objects.filter(
+        Q(latido__lt=limite)
+        | Q(latido__isnull=True, iniciado__lt=limite),
+        estado=TrabajoReporte.ESTADO_PROCESANDO
+    ).update(
+        estado=TrabajoReporte.ESTADO_PENDIENTE, iniciado=None, latido=None
+    )
+
+    borrados = 0
+    for trabajo in TrabajoReporte.objects.filter(expira__lt=ahora):
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+        borrados += 1
+    return borrados
@@ -0,0 +1,235 @@
+"""
+PDF de comprobantes de pago.
+
+Cada PDF se genera una sola vez por (pago, formato) y se guarda en
+MEDIA_ROOT/comprobantes/<pago>/ con una fila ComprobantePDF; las visitas
+siguientes sirven el archivo tal cual, con ETag y Last-Modified para que el
+navegador pueda revalidar sin descargarlo de nuevo.
+
+La `huella` del PDF resume todo lo que se imprime: datos del pago, del
+cliente y sus detalles, la fecha de actualización de CompanySettings y
+VERSION_PLANTILLA. Si algo cambia la huella deja de coincidir y el PDF se
+regenera en la siguiente visita (y el archivo anterior se borra), así que
+no hace falta recorrer los PDF al editar la empresa o un pago.
+
+La configuración de la empresa y la ruta del logo se cachean
+TIMEOUT_EMPRESA segundos; la señal de CompanySettings borra la entrada.
+xhtml2pdf se importa recién al renderizar (ver dependencias.py).
+Con COMPROBANTES_PRERENDER = True procesar_pago encola el PDF A5 para
+run_report_worker al confirmar el pago.
+"""
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from .dependencias import pisa
+from .models import CompanySettings, ComprobantePDF, Pago
+
+PLANTILLA = 'billing_app/pdf/comprobante.html'
+# Subir al cambiar la plantilla: invalida todos los PDF guardados
+VERSION_PLANTILLA = 1
+FORMATOS_PDF = ('a5', 'a4', 'carta')
+FORMATO_PDF = 'a5'
+ALIAS_FORMATO = {'letter': 'carta'}
+FORMATOS_TICKET = ('80mm', 'ticket80', 'termico80', '58mm', 'ticket58',
+                   'termico58')
+CLAVE_EMPRESA = 'comprobantes:empresa'
+TIMEOUT_EMPRESA = 60
+
+
+class ErrorPDF(Exception):
+    """xhtml2pdf no pudo generar el comprobante."""
+
+
+def formato_pdf(valor):
+    """Formato de página válido para el PDF (A5 si no se reconoce)."""
+    formato = (valor or FORMATO_PDF).lower()
+    formato = ALIAS_FORMATO.get(formato, formato)
+    return formato if formato in FORMATOS_PDF else FORMATO_PDF
+
+
+def prerender_activo():
+    return getattr(settings, 'COMPROBANTES_PRERENDER', False)
+
+
+def _logo_uri(company_settings):
+    if not company_settings.logo:
+        return None
+    try:
+        return Path(company_settings.logo.path).as_uri()
+    except (ValueError, OSError):
+        return None
+
+
+def datos_empresa():
+    """(CompanySettings, URI del logo o None), desde el caché."""
+    datos = cache.get(CLAVE_EMPRESA)
+    if datos is None:
+        company_settings = CompanySettings.get_settings()
+        datos = (company_settings, _logo_uri(company_settings))
+        cache.set(CLAVE_EMPRESA, datos, timeout=TIMEOUT_EMPRESA)
+    return datos
+
+
+def invalidar_empresa():
+    transaction.on_commit(lambda: cache.delete(CLAVE_EMPRESA))
+
+
+def pago_para_comprobante(pago_id):
+    """Queryset con lo que usa la plantilla en dos consultas."""
+    return (
+        Pago.objects.select_related('cliente__via')
+        .prefetch_related('items')
+        .filter(pk=pago_id)
+    )
+
+
+def _medidas(formato):
+    if formato == 'a4':
+        return 'A4', '12mm', '180mm', '10pt'
+    if formato in ('carta', 'letter'):
+        return 'Letter', '12mm', '180mm', '10pt'
+    if formato in ('80mm', 'ticket80', 'termico80'):
+        return '80mm auto', '4mm', '72mm', '9pt'
+    if formato in ('58mm', 'ticket58', 'termico58'):
+        return '58mm auto', '4mm', '52mm', '8pt'
+    return 'A5', '12mm', '160mm', '10pt'
+
+
+def contexto_comprobante(pago, format_key=FORMATO_PDF, empresa=None):
+    company_settings, logo_path = empresa or datos_empresa()
+
+    serie = None
+    numero = pago.serie_numero
+    if pago.serie_numero and '-' in pago.serie_numero:
+        serie, numero = pago.serie_numero.split('-', 1)
+
+    detalles = pago.detalles or ''
+    if not detalles:
+        detalles = ', '.join(
+            item.descripcion for item in pago.items.all()
+        )
+
+    fmt = (format_key or FORMATO_PDF).lower()
+    page_size, page_margin, content_width, font_base = _medidas(fmt)
+    return {
+        'pago': pago,
+        'company_settings': company_settings,
+        'logo_path': logo_path,
+        'serie': serie or '',
+        'numero': numero or '',
+        'detalles_comp': detalles or 'Pago registrado',
+        'payment_method': 'Efectivo',
+        'format_key': fmt,
+        'page_size': page_size,
+        'page_margin': page_margin,
+        'content_width': content_width,
+        'font_base': font_base,
+        'is_ticket': fmt in FORMATOS_TICKET,
+        'color_main': '#111827',
+        'color_muted': '#6b7280',
+        'color_line': '#e5e7eb',
+        'color_panel': '#f9fafb'
+    }
+
+
+def huella_comprobante(pago, formato):
+    company_settings, logo_path = datos_empresa()
+    cliente = pago.cliente
+    partes = [
+        VERSION_PLANTILLA, formato,
+        company_settings.fecha_actualizacion.isoformat(), logo_path,
+        pago.pk, pago.monto, pago.fecha.isoformat(), pago.tipo_comprobante,
+        pago.serie_numero, pago.detalles,
+        cliente.apellidos, cliente.nombres, cliente.dni, cliente.celular,
+        cliente.referencia, str(cliente.via),
+    ]
+    partes += [
+        (item.descripcion, item.periodo_mes, item.monto_parcial)
+        for item in pago.items.all()
+    ]
+    return hashlib.sha256(repr(partes).encode('utf-8')).hexdigest()
+
+
+def renderizar_pdf(pago, formato, empresa=None):
+    """
+    Args:
+        empresa: Resultado de datos_empresa(), para renderizar sin tocar la
+            base ni el caché (p. ej. en otro proceso)
+
+    Raises:
+        ErrorPDF: Si xhtml2pdf reporta errores
+    """
+    html = render_to_string(
+        PLANTILLA, contexto_comprobante(pago, formato, empresa)
+    )
+    contenido = BytesIO()
+    if pisa('generar el PDF').CreatePDF(html, dest=contenido).err:
+        raise ErrorPDF(f'No se pudo generar el PDF del pago {pago.pk}')
+    return contenido.getvalue()
+
+
+def _archivo_disponible(comprobante):
+    try:
+        return comprobante.archivo.storage.exists(comprobante.archivo.name)
+    except (ValueError, OSError):
+        return False
+
+
+def es_vigente(comprobante, huella):
+    return (
+        comprobante is not None
+        and comprobante.huella == huella
+        and _archivo_disponible(comprobante)
+    )
+
+
+def guardar_comprobante(pago, formato, huella, contenido, comprobante=None):
+    """Guarda el PDF `contenido` del pago, reemplazando el archivo de
+    `comprobante` (la fila anterior, si la hay)."""
+    anterior = comprobante.archivo.name if comprobante else None
+    if comprobante is None:
+        comprobante = ComprobantePDF(pago=pago, formato=formato)
+    comprobante.huella = huella
+    comprobante.archivo.save(
+        f'{formato}-{huella[:16]}.pdf', ContentFile(contenido), save=False
+    )
+    try:
+        with transaction.atomic():
+            comprobante.save()
+    except IntegrityError:
+        # Otra petición lo generó al mismo tiempo: se usa el suyo
+        comprobante.archivo.delete(save=False)
+        return ComprobantePDF.objects.get(pago=pago, formato=formato)
+    if anterior and anterior != comprobante.archivo.name:
+        comprobante.archivo.storage.delete(anterior)
+    if formato == FORMATO_PDF:
+        Pago.objects.filter(pk=pago.pk).update(
+            pdf_comprobante=comprobante.archivo.name
+        )
+    return comprobante
+
+
+def obtener_comprobante(pago, formato=FORMATO_PDF):
+    """
+    ComprobantePDF vigente de `pago` en `formato`, generándolo si no existe
+    o si su huella ya no coincide. `pago` debería venir de
+    pago_para_comprobante().
+
+    Raises:
+        ErrorPDF: Si xhtml2pdf reporta errores
+    """
+    formato = formato_pdf(formato)
+    huella = huella_comprobante(pago, formato)
+    comprobante = ComprobantePDF.objects.filter(
+        pago=pago, formato=formato
+    ).first()
+    if es_vigente(comprobante, huella):
+        return comprobante
+    return guardar_comprobante(
+        pago, formato, huella, renderizar_pdf(pago, formato), comprobante
+    )
@@ -0,0 +1,289 @@
+"""
+Asignación de correlativos de comprobantes.
+
+Antes cada pago bloqueaba la fila de SerieCorrelativo hasta confirmar, así
+que en las horas de cobro todas las cajas se atendían una detrás de otra.
+Ahora:
+
+- Cada hilo de cada worker reserva un bloque de números de la serie
+  (BloqueCorrelativo, TAMANO_BLOQUE por defecto) en una transacción corta
+  propia: es el único momento en que se bloquea la fila de la serie.
+- Los números del bloque se entregan dentro de la transacción del pago
+  avanzando `siguiente` en la fila del bloque, que sólo usa ese hilo. Si el
+  pago se revierte, `siguiente` vuelve atrás y el número no se pierde.
+- Antes que el bloque se usan los números liberados (SerieCorrelativoLibre)
+  de menor a mayor; en PostgreSQL con SKIP LOCKED, para que dos cajas no
+  esperen por el mismo número.
+
+Los bloques quedan como registro: todo número de 1 a `ultimo_numero` está
+emitido (menor que `siguiente` de su bloque), libre o pendiente en un
+bloque abierto. Si un worker muere, su bloque deja de actualizarse y
+recuperar_bloques() (comando recuperar_correlativos) devuelve lo no
+emitido a la lista de libres; auditar() comprueba que no haya huecos ni
+duplicados.
+"""
+import os
+import socket
+import threading
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from .models import (
+    BloqueCorrelativo, Pago, SerieCorrelativo, SerieCorrelativoLibre
+)
+
+# Minutos sin actividad tras los que un bloque abierto se da por abandonado
+VIGENCIA_BLOQUE = 30
+
+_local = threading.local()
+
+
+def tamano_bloque():
+    return max(1, getattr(settings, 'CORRELATIVOS_BLOQUE', 10))
+
+
+def formatear(serie, numero):
+    return f"{serie}-{str(numero).zfill(8)}"
+
+
+def _dueno():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def _bloques():
+    """Bloque en uso por este hilo: {(alias, serie_id): [pk, siguiente,
+    fin]}."""
+    if not hasattr(_local, 'bloques'):
+        _local.bloques = {}
+    return _local.bloques
+
+
+def olvidar_bloques():
+    """Descarta los bloques recordados por este hilo (los números que
+    queden en ellos se recuperan con recuperar_bloques)."""
+    _bloques().clear()
+
+
+def _nuevo_bloque(correlativo, alias):
+    tamano = tamano_bloque()
+    with transaction.atomic(using=alias):
+        serie = (
+            SerieCorrelativo.objects.using(alias)
+            .select_for_update()
+            .get(pk=correlativo.pk)
+        )
+        inicio = serie.ultimo_numero + 1
+        serie.ultimo_numero += tamano
+        serie.save(update_fields=['ultimo_numero'])
+        bloque = BloqueCorrelativo.objects.using(alias).create(
+            serie_correlativo=serie,
+            inicio=inicio,
+            fin=serie.ultimo_numero,
+            siguiente=inicio,
+            dueno=_dueno(),
+            actualizado=timezone.now()
+        )
+    return [bloque.pk, bloque.siguiente, bloque.fin]
+
+
+def _bloque_vigente(correlativo, alias):
+    """Relee el bloque del hilo (tras un rollback la memoria puede ir por
+    delante de la base); None si ya no se puede usar."""
+    estado = _bloques().get((alias, correlativo.pk))
+    if estado is None:
+        return None
+    fila = (
+        BloqueCorrelativo.objects.using(alias)
+        .filter(pk=estado[0], cerrado__isnull=True)
+        .values_list('siguiente', 'fin')
+        .first()
+    )
+    if fila is None or fila[0] > fila[1]:
+        return None
+    estado[1], estado[2] = fila
+    return estado
+
+
+def reservar_bloque(correlativo, using=None):
+    """
+    Se asegura de que el hilo tenga números disponibles de la serie. Se
+    llama antes de abrir la transacción del pago, para que el bloqueo de la
+    serie dure sólo lo que dura la reserva.
+    """
+    alias = using or 'default'
+    estado = _bloques().get((alias, correlativo.pk))
+    if estado is None or estado[1] > estado[2]:
+        _bloques()[(alias, correlativo.pk)] = _nuevo_bloque(
+            correlativo, alias
+        )
+
+
+def _tomar_libre(correlativo, alias):
+    while True:
+        libre = (
+            SerieCorrelativoLibre.objects.using(alias)
+            .select_for_update(skip_locked=True)
+            .filter(serie_correlativo=correlativo)
+            .order_by('numero')
+            .values_list('pk', 'numero')
+            .first()
+        )
+        if libre is None:
+            return None
+        borrados, _ = (
+            SerieCorrelativoLibre.objects.using(alias)
+            .filter(pk=libre[0])
+            .delete()
+        )
+        if borrados:
+            return libre[1]
+
+
+def _tomar_del_bloque(correlativo, alias):
+    clave = (alias, correlativo.pk)
+    for _ in range(3):
+        estado = _bloques().get(clave)
+        if estado is None or estado[1] > estado[2]:
+            estado = _nuevo_bloque(correlativo, alias)
+            _bloques()[clave] = estado
+        pk, numero, fin = estado
+        ahora = timezone.now()
+        tomado = (
+            BloqueCorrelativo.objects.using(alias)
+            .filter(pk=pk, siguiente=numero, cerrado__isnull=True)
+            .update(
+                siguiente=numero + 1,
+                actualizado=ahora,
+                cerrado=ahora if numero == fin else None
+            )
+        )
+        if tomado:
+            estado[1] = numero + 1
+            return numero
+        if _bloque_vigente(correlativo, alias) is None:
+            _bloques().pop(clave, None)
+    raise RuntimeError(
+        f'No se pudo asignar un correlativo de {correlativo.serie}'
+    )
+
+
+def tomar_correlativo(correlativo, using=None):
+    """
+    Siguiente número de la serie: el menor liberado o, si no hay, el
+    siguiente del bloque del hilo. Debe llamarse dentro de la transacción
+    que guarda el comprobante; si ésta se revierte el número vuelve a estar
+    disponible.
+
+    Returns:
+        str: Número formateado, p. ej. 'R001-00000042'
+    """
+    alias = using or 'default'
+    with transaction.atomic(using=alias):
+        numero = _tomar_libre(correlativo, alias)
+        if numero is None:
+            numero = _tomar_del_bloque(correlativo, alias)
+    return formatear(correlativo.serie, numero)
+
+
+def proximos_numeros():
+    """{serie_id: número} que se mostraría como próximo en cada serie: el
+    menor libre, si no el menor pendiente de un bloque abierto, si no el
+    siguiente a `ultimo_numero`."""
+    libres = dict(
+        SerieCorrelativoLibre.objects.values('serie_correlativo_id')
+        .annotate(numero=Min('numero'))
+        .values_list('serie_correlativo_id', 'numero')
+    )
+    pendientes = dict(
+        BloqueCorrelativo.objects.filter(cerrado__isnull=True)
+        .values('serie_correlativo_id')
+        .annotate(numero=Min('siguiente'))
+        .values_list('serie_correlativo_id', 'numero')
+    )
+    return {
+        serie.pk: (
+            libres.get(serie.pk)
+            or pendientes.get(serie.pk)
+            or serie.ultimo_numero + 1
+        )
+        for serie in SerieCorrelativo.objects.all()
+    }
+
+
+def recuperar_bloques(minutos=VIGENCIA_BLOQUE):
+    """
+    Cierra los bloques abiertos sin uso en los últimos `minutos` y pasa sus
+    números no emitidos a SerieCorrelativoLibre.
+
+    Returns:
+        int: Números devueltos a la lista de libres
+    """
+    limite = timezone.now() - timedelta(minutes=minutos)
+    devueltos = 0
+    abandonados = BloqueCorrelativo.objects.filter(
+        cerrado__isnull=True, actualizado__lt=limite
+    ).values_list('pk', 'serie_correlativo_id', 'siguiente', 'fin')
+    for pk, serie_id, siguiente, fin in abandonados:
+        with transaction.atomic():
+            # Sólo si nadie lo tocó desde la lectura: el hilo dueño pudo
+            # haber emitido un número mientras tanto
+            cerrado = BloqueCorrelativo.objects.filter(
+                pk=pk, siguiente=siguiente, cerrado__isnull=True
+            ).update(cerrado=timezone.now())
+            if not cerrado:
+                continue
+            SerieCorrelativoLibre.objects.bulk_create(
+                [
+                    SerieCorrelativoLibre(
+                        serie_correlativo_id=serie_id, numero=numero
+                    )
+                    for numero in range(siguiente, fin + 1)
+                ],
+                ignore_conflicts=True
+            )
+            devueltos += fin + 1 - siguiente
+    return devueltos
+
+
+def auditar(correlativo):
+    """
+    Contrasta los números de la serie (1 a `ultimo_numero`) con los pagos,
+    los libres y los bloques abiertos.
+
+    Returns:
+        dict: 'huecos' (ni emitidos, ni libres, ni pendientes) y
+            'duplicados' (en más de un pago, o en un pago y libres)
+    """
+    prefijo = f'{correlativo.serie}-'
+    emitidos = Counter()
+    numeros = Pago.objects.filter(
+        tipo_comprobante__iexact=correlativo.tipo,
+        serie_numero__startswith=prefijo
+    ).values_list('serie_numero', flat=True)
+    for serie_numero in numeros.iterator():
+        try:
+            emitidos[int(serie_numero[len(prefijo):])] += 1
+        except ValueError:
+            continue
+    libres = set(
+        correlativo.libres.values_list('numero', flat=True)
+    )
+    pendientes = set()
+    for siguiente, fin in correlativo.bloques.filter(
+        cerrado__isnull=True
+    ).values_list('siguiente', 'fin'):
+        pendientes.update(range(siguiente, fin + 1))
+    huecos = [
+        numero for numero in range(1, correlativo.ultimo_numero + 1)
+        if numero not in emitidos
+        and numero not in libres
+        and numero not in pendientes
+    ]
+    duplicados = sorted(
+        numero for numero, veces in emitidos.items()
+        if veces > 1 or numero in libres
+    )
+    return {'huecos': huecos, 'duplicados': duplicados}
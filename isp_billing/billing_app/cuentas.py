@@ -0,0 +1,240 @@
+"""
+Cuentas por cobrar materializadas.
+
+Guarda por cliente los mismos periodos que devuelve calcular_meses_deuda
+(ClientePlan + periodo_mes, u OrdenTecnica) para que leer la deuda de un
+cliente o de toda la cartera sea una lectura indexada. Las señales de
+signals.py invalidan las cuentas del cliente en la misma transacción que
+cualquier cambio de pagos, planes, OTs o exclusiones (y las de todos los
+clientes de un Plan cuando cambia su precio); la siguiente lectura las
+recalcula.
+
+Al cambiar de mes no se recalcula en la lectura: el comando
+precalcular_deuda, programado de madrugada, reconstruye toda la cartera y
+agrega los periodos del mes nuevo.
+"""
+import logging
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Cliente, CuentaPorCobrar, EstadoCuenta
+from .utils import calcular_deuda_clientes, nombre_deuda_ot, nombre_mes
+
+logger = logging.getLogger(__name__)
+
+
+def _periodo_actual():
+    return timezone.now().date().replace(day=1)
+
+
+def _clientes_vencidos(clientes):
+    """Clientes sin estado de cuenta: invalidados o nunca calculados."""
+    return clientes.exclude(
+        id__in=EstadoCuenta.objects.values('cliente_id')
+    )
+
+
+def sincronizar_cuentas(clientes=None):
+    """
+    Recalcula y reemplaza las cuentas por cobrar de los clientes dados.
+
+    Args:
+        clientes: QuerySet de Cliente; None reconstruye toda la cartera
+
+    Returns:
+        int: Cantidad de clientes sincronizados
+    """
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    periodo = _periodo_actual()
+    with transaction.atomic():
+        # Bloquea los clientes para que dos sincronizaciones simultáneas
+        # no intenten insertar las mismas filas.
+        cliente_ids = list(
+            clientes.order_by('id')
+            .select_for_update()
+            .values_list('id', flat=True)
+        )
+        if not cliente_ids:
+            return 0
+        deudas = calcular_deuda_clientes(
+            Cliente.objects.filter(id__in=cliente_ids)
+        )
+
+        filas = []
+        estados = []
+        for cliente_id in cliente_ids:
+            total = Decimal('0')
+            for orden, item in enumerate(deudas.get(cliente_id, [])):
+                es_ot = item['tipo'] == 'OT'
+                filas.append(CuentaPorCobrar(
+                    cliente_id=cliente_id,
+                    plan_asociado_id=None if es_ot else item['id'],
+                    periodo_mes=item['mes'],
+                    ot_asociada_id=item['id'] if es_ot else None,
+                    orden=orden,
+                    monto_cargado=item['monto_original'],
+                    monto_pagado=item['pagado'],
+                    saldo=item['saldo']
+                ))
+                total += Decimal(str(item['saldo']))
+            estados.append(EstadoCuenta(
+                cliente_id=cliente_id,
+                saldo_total=total,
+                periodo_calculado=periodo
+            ))
+
+        CuentaPorCobrar.objects.filter(cliente_id__in=cliente_ids).delete()
+        EstadoCuenta.objects.filter(cliente_id__in=cliente_ids).delete()
+        CuentaPorCobrar.objects.bulk_create(filas, batch_size=500)
+        EstadoCuenta.objects.bulk_create(estados, batch_size=500)
+    return len(cliente_ids)
+
+
+def sincronizar_cuenta_cliente(cliente):
+    """Actualiza las cuentas por cobrar de un cliente."""
+    return sincronizar_cuentas(Cliente.objects.filter(pk=cliente.pk))
+
+
+def estado_vigente(cliente):
+    """Id del EstadoCuenta del cliente, o None si sus cuentas están
+    vencidas. Cambia con cada sincronización."""
+    return EstadoCuenta.objects.filter(
+        cliente_id=cliente.pk
+    ).values_list('pk', flat=True).first()
+
+
+def invalidar_cuentas(clientes):
+    """Marca como vencidas las cuentas de los clientes dados; se
+    recalcularán en la siguiente lectura."""
+    EstadoCuenta.objects.filter(
+        cliente_id__in=clientes.order_by().values('id')
+    ).delete()
+
+
+def invalidar_cuenta_cliente(cliente_id):
+    """invalidar_cuentas para un solo cliente."""
+    if cliente_id:
+        EstadoCuenta.objects.filter(cliente_id=cliente_id).delete()
+
+
+def _fila_a_periodo(fila):
+    if fila.ot_asociada_id:
+        return {
+            'id': fila.ot_asociada_id,
+            'plan_nombre': nombre_deuda_ot(fila.ot_asociada),
+            'mes': None,
+            'mes_nombre': "Costo ?nico",
+            'monto_original': fila.monto_cargado,
+            'pagado': fila.monto_pagado,
+            'saldo': fila.saldo,
+            'tipo': 'OT'
+        }
+    return {
+        'id': fila.plan_asociado_id,
+        'plan_nombre': fila.plan_asociado.plan.nombre,
+        'mes': fila.periodo_mes,
+        'mes_nombre': nombre_mes(fila.periodo_mes),
+        'monto_original': fila.monto_cargado,
+        'pagado': fila.monto_pagado,
+        'saldo': fila.saldo,
+        'tipo': 'plan'
+    }
+
+
+def obtener_deudas_clientes(clientes=None):
+    """
+    Lee la deuda de varios clientes desde las cuentas materializadas,
+    recalculando antes sólo a los clientes vencidos.
+
+    Returns:
+        dict: {cliente_id: lista de periodos} con la estructura de
+            calcular_meses_deuda
+    """
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    clientes = clientes.order_by()
+    if _clientes_vencidos(clientes).exists():
+        sincronizar_cuentas(_clientes_vencidos(clientes))
+
+    resultado = {
+        cliente_id: []
+        for cliente_id in clientes.values_list('id', flat=True)
+    }
+    filas = (
+        CuentaPorCobrar.objects.filter(cliente_id__in=clientes.values('id'))
+        .select_related('plan_asociado__plan', 'ot_asociada__concepto')
+        .order_by('cliente_id', 'orden')
+    )
+    for fila in filas:
+        resultado.setdefault(fila.cliente_id, []).append(
+            _fila_a_periodo(fila)
+        )
+    return resultado
+
+
+def obtener_deuda_cliente(cliente):
+    """Deuda de un cliente leída desde las cuentas materializadas."""
+    return obtener_deudas_clientes(
+        Cliente.objects.filter(pk=cliente.pk)
+    ).get(cliente.pk, [])
+
+
+def estados_cuenta(clientes=None):
+    """QuerySet de EstadoCuenta vigente para los clientes dados, útil para
+    totales y rankings de cartera."""
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    clientes = clientes.order_by()
+    if _clientes_vencidos(clientes).exists():
+        sincronizar_cuentas(_clientes_vencidos(clientes))
+    return EstadoCuenta.objects.filter(cliente_id__in=clientes.values('id'))
+
+
+def deuda_total_cartera(clientes=None):
+    return (
+        estados_cuenta(clientes).aggregate(total=Sum('saldo_total'))['total']
+        or Decimal('0')
+    )
+
+
+def verificar_cuentas(clientes=None):
+    """
+    Compara las cuentas materializadas con el cálculo actual.
+
+    Returns:
+        list: IDs de clientes cuyas cuentas no coinciden
+    """
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    esperado = calcular_deuda_clientes(clientes)
+    guardado = {cliente_id: [] for cliente_id in esperado}
+    for fila in (
+        CuentaPorCobrar.objects.filter(
+            cliente_id__in=clientes.order_by().values('id')
+        )
+        .order_by('cliente_id', 'orden')
+    ):
+        guardado.setdefault(fila.cliente_id, []).append((
+            fila.ot_asociada_id or fila.plan_asociado_id,
+            fila.periodo_mes,
+            fila.monto_cargado,
+            fila.monto_pagado,
+            fila.saldo
+        ))
+    diferencias = []
+    for cliente_id, periodos in esperado.items():
+        claves = [
+            (
+                item['id'],
+                item['mes'],
+                Decimal(str(item['monto_original'])),
+                Decimal(str(item['pagado'])),
+                Decimal(str(item['saldo']))
+            )
+            for item in periodos
+        ]
+        if claves != guardado.get(cliente_id, []):
+            diferencias.append(cliente_id)
+    return diferencias
@@ -0,0 +1,55 @@
+"""
+Carga diferida de las dependencias pesadas u opcionales.
+
+urls.py importa todas las vistas, así que cualquier import a nivel de
+módulo lo paga cada worker de gunicorn al arrancar, aunque nunca genere un
+PDF ni un Excel. xhtml2pdf por sí solo arrastra reportlab, html5lib, svglib,
+pypdf y Pillow (cerca de medio segundo). Por eso estos paquetes sólo se
+importan desde aquí, dentro de la función que los usa: la primera llamada
+los importa y las siguientes los toman de sys.modules.
+
+Si el paquete no está instalado se lanza DependenciaFaltante con un mensaje
+para mostrar al usuario. El test ArranqueTests verifica que ninguno se
+cargue al arrancar; para revisar qué cuesta el arranque:
+
+    python -X importtime manage.py check 2> importtime.log
+"""
+import importlib
+
+
+class DependenciaFaltante(RuntimeError):
+    """El paquete opcional no está instalado."""
+
+
+def _importar(modulos, paquete, para=None):
+    try:
+        cargados = [importlib.import_module(modulo) for modulo in modulos]
+    except ImportError as exc:
+        mensaje = f'Falta instalar {paquete}'
+        if para:
+            mensaje += f' para {para}.'
+        raise DependenciaFaltante(mensaje) from exc
+    return cargados[0]
+
+
+def pisa(para=None):
+    """xhtml2pdf.pisa"""
+    return _importar(['xhtml2pdf.pisa'], 'xhtml2pdf', para)
+
+
+def pypdf(para=None):
+    """pypdf, con pypdf.generic cargado"""
+    return _importar(['pypdf', 'pypdf.generic'], 'pypdf', para)
+
+
+def openpyxl(para=None):
+    """openpyxl, con openpyxl.utils cargado"""
+    return _importar(['openpyxl', 'openpyxl.utils'], 'openpyxl', para)
+
+
+def routeros_api(para=None):
+    return _importar(['routeros_api'], 'routeros-api', para)
+
+
+def numpy(para=None):
+    return _importar(['numpy'], 'numpy', para)
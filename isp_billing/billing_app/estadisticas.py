@@ -0,0 +1,151 @@
+"""
+Contadores del dashboard y de reportes.
+
+Cada familia de contadores (pagos, egresos, clientes, planes, OTs) se
+resuelve en una sola consulta con agregados filtrados en lugar de un
+count() o Sum() por indicador.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .models import (
+    Cliente, ClientePlan, Egreso, MikrotikConfig, OrdenTecnica, Pago,
+    Servicio
+)
+
+CERO = Decimal('0')
+
+
+@dataclass(frozen=True)
+class ResumenPagos:
+    total: Decimal
+    hoy: Decimal
+    semana: Decimal
+    mes: Decimal
+
+
+@dataclass(frozen=True)
+class ResumenEgresos:
+    total: Decimal
+    mes: Decimal
+
+
+@dataclass(frozen=True)
+class ResumenClientes:
+    total: int
+    activos: int
+
+
+@dataclass(frozen=True)
+class ResumenPlanes:
+    total: int
+    activos: int
+
+
+@dataclass(frozen=True)
+class ResumenOrdenes:
+    pendientes: int
+    completadas: int
+    pagadas: int
+    instalaciones: int
+    cortes: int
+    averias: int
+
+
+@dataclass(frozen=True)
+class Estadisticas:
+    hoy: date
+    pagos: ResumenPagos
+    egresos: ResumenEgresos
+    clientes: ResumenClientes
+    planes: ResumenPlanes
+    ordenes: ResumenOrdenes
+
+    @property
+    def balance_mes(self) -> Decimal:
+        return self.pagos.mes - self.egresos.mes
+
+
+@dataclass(frozen=True)
+class EstadisticasReportes(Estadisticas):
+    servicios: int
+    nodos: int
+
+
+def _montos(valores):
+    return {clave: valor or CERO for clave, valor in valores.items()}
+
+
+def resumen_pagos(hoy) -> ResumenPagos:
+    semana = hoy - timedelta(days=hoy.weekday())
+    mes = hoy.replace(day=1)
+    return ResumenPagos(**_montos(Pago.objects.aggregate(
+        total=Sum('monto'),
+        hoy=Sum('monto', filter=Q(fecha__date=hoy)),
+        semana=Sum(
+            'monto', filter=Q(fecha__date__gte=semana, fecha__date__lte=hoy)
+        ),
+        mes=Sum('monto', filter=Q(fecha__date__gte=mes, fecha__date__lte=hoy)),
+    )))
+
+
+def resumen_egresos(hoy) -> ResumenEgresos:
+    return ResumenEgresos(**_montos(Egreso.objects.aggregate(
+        total=Sum('monto'),
+        mes=Sum(
+            'monto', filter=Q(fecha__gte=hoy.replace(day=1), fecha__lte=hoy)
+        ),
+    )))
+
+
+def resumen_clientes() -> ResumenClientes:
+    return ResumenClientes(**Cliente.objects.aggregate(
+        total=Count('id'),
+        activos=Count('id', filter=Q(estado_activo=True)),
+    ))
+
+
+def resumen_planes() -> ResumenPlanes:
+    return ResumenPlanes(**ClientePlan.objects.aggregate(
+        total=Count('id'),
+        activos=Count('id', filter=Q(activo=True)),
+    ))
+
+
+def resumen_ordenes() -> ResumenOrdenes:
+    return ResumenOrdenes(**OrdenTecnica.objects.aggregate(
+        pendientes=Count('id', filter=Q(completada=False)),
+        completadas=Count('id', filter=Q(completada=True)),
+        pagadas=Count('id', filter=Q(pagada=True)),
+        instalaciones=Count(
+            'id', filter=Q(concepto__categoria='INSTALACION')
+        ),
+        cortes=Count('id', filter=Q(concepto__categoria='CORTES')),
+        averias=Count('id', filter=Q(concepto__categoria='AVERIAS')),
+    ))
+
+
+def estadisticas_dashboard(hoy=None) -> Estadisticas:
+    """Contadores del dashboard (5 consultas)."""
+    hoy = hoy or timezone.localdate()
+    return Estadisticas(
+        hoy=hoy,
+        pagos=resumen_pagos(hoy),
+        egresos=resumen_egresos(hoy),
+        clientes=resumen_clientes(),
+        planes=resumen_planes(),
+        ordenes=resumen_ordenes(),
+    )
+
+
+def estadisticas_reportes(hoy=None) -> EstadisticasReportes:
+    """Contadores de reportes_index (los del dashboard más servicios y
+    nodos; 7 consultas)."""
+    base = estadisticas_dashboard(hoy)
+    return EstadisticasReportes(
+        **vars(base),
+        servicios=Servicio.objects.count(),
+        nodos=MikrotikConfig.objects.count(),
+    )
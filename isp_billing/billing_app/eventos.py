@@ -0,0 +1,264 @@
+"""
+Historial de eventos del cliente.
+
+Todo lo que aparece en la línea de tiempo del cliente se guarda como una
+fila de EventoCliente (cliente, ocurrido, tipo, datos) en el momento en que
+pasa: registrar_movimiento() agrega el movimiento y, si se le pasa el
+objeto, el evento del plan, pago u OT. Las filas no se modifican; leer el
+historial es un recorrido del índice (cliente, -ocurrido, -id).
+
+`datos` guarda lo que se muestra (titulo, detalle, icono, clase) y el id
+del objeto de origen. Borrar un plan, pago u OT agrega un evento más con la
+referencia del objeto (evento_borrado); el evento original se conserva.
+La migración 0033 copia los eventos anteriores a esta tabla (el comando
+rellenar_eventos hace lo mismo tras una carga masiva) y los muy antiguos se
+mueven a EventoClienteArchivo con archivar_eventos.
+
+Dentro de una transacción los eventos no se insertan al registrarlos: se
+juntan en un lote por transacción (y por savepoint) que se guarda con un
+solo bulk_create en transaction.on_commit. Si la transacción o el savepoint
+se revierten, Django descarta el on_commit y con él el lote. Fuera de una
+transacción se guardan en el acto; agrupar_eventos() permite juntar varios
+registros en ese caso.
+"""
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, time
+from django.apps import apps as apps_globales
+from django.db import transaction
+from django.utils import timezone
+from .models import ClientePlan, EventoCliente, OrdenTecnica, Pago
+from .texto import normalizar
+
+logger = logging.getLogger(__name__)
+
+
+def _a_datetime(valor):
+    if isinstance(valor, datetime):
+        return valor if timezone.is_aware(valor) else timezone.make_aware(valor)
+    return timezone.make_aware(datetime.combine(valor, time.min))
+
+
+def evento_movimiento(cliente, tipo, detalle, icono, clase, ocurrido=None,
+                      referencia=''):
+    return EventoCliente(
+        cliente_id=cliente.pk,
+        ocurrido=ocurrido or timezone.now(),
+        tipo=EventoCliente.TIPO_MOVIMIENTO,
+        datos={
+            'titulo': tipo,
+            'detalle': detalle,
+            'icono': icono,
+            'clase': clase,
+        },
+        referencia=referencia
+    )
+
+
+def evento_plan(cliente_plan):
+    """El plan figura en la fecha de inicio del servicio. Cada edición que
+    cambia plan o fecha agrega un evento nuevo."""
+    plan = cliente_plan.plan
+    return EventoCliente(
+        cliente_id=cliente_plan.cliente_id,
+        ocurrido=_a_datetime(cliente_plan.fecha_inicio),
+        tipo=EventoCliente.TIPO_PLAN,
+        datos={
+            'titulo': 'Plan asignado / Instalación',
+            'detalle': (
+                f"{plan.nombre} (S/ {plan.precio}), "
+                f"cobranza día {cliente_plan.fecha_cobranza}"
+            ),
+            'icono': 'fa-wifi',
+            'clase': 'success',
+            'cliente_plan_id': cliente_plan.pk,
+        },
+        referencia=(
+            f'plan:{cliente_plan.pk}:{plan.pk}:'
+            f'{cliente_plan.fecha_inicio:%Y%m%d}'
+        )
+    )
+
+
+def evento_pago(pago):
+    return EventoCliente(
+        cliente_id=pago.cliente_id,
+        ocurrido=pago.fecha,
+        tipo=EventoCliente.TIPO_PAGO,
+        datos={
+            'titulo': 'Pago',
+            'detalle': (
+                f"{pago.tipo_comprobante} {pago.serie_numero} - S/ {pago.monto}"
+            ),
+            'icono': 'fa-money-bill-wave',
+            'clase': 'primary',
+            'pago_id': pago.pk,
+        },
+        referencia=f'pago:{pago.pk}'
+    )
+
+
+def _etiqueta_ot(concepto):
+    if concepto.categoria == 'CORTES':
+        return 'Corte', 'fa-ban', 'danger'
+    nombre = normalizar(concepto.nombre)
+    if 'corte' in nombre:
+        return 'Corte', 'fa-ban', 'danger'
+    if 'reconexion' in nombre:
+        return 'Reconexión', 'fa-plug', 'success'
+    return 'Orden técnica', 'fa-tools', 'warning'
+
+
+def evento_ot(ot, creacion=False):
+    """OT completada si ya tiene fecha de finalización (salvo que se pida
+    el evento de `creacion`), o creada."""
+    titulo, icono, clase = _etiqueta_ot(ot.concepto)
+    if ot.completada and ot.fecha_finalizacion and not creacion:
+        ocurrido, estado, sufijo = ot.fecha_finalizacion, 'completada', ':fin'
+    else:
+        ocurrido, estado, sufijo = ot.fecha_creacion, 'pendiente', ''
+    return EventoCliente(
+        cliente_id=ot.cliente_id,
+        ocurrido=ocurrido,
+        tipo=EventoCliente.TIPO_OT,
+        datos={
+            'titulo': titulo,
+            'detalle': f"{ot.concepto.nombre} - S/ {ot.monto} ({estado})",
+            'icono': icono,
+            'clase': clase,
+            'ot_id': ot.pk,
+        },
+        referencia=f'ot:{ot.pk}{sufijo}'
+    )
+
+
+def evento_de(objeto):
+    """Evento propio de un ClientePlan, Pago u OrdenTecnica."""
+    if isinstance(objeto, ClientePlan):
+        return evento_plan(objeto)
+    if isinstance(objeto, Pago):
+        return evento_pago(objeto)
+    if isinstance(objeto, OrdenTecnica):
+        return evento_ot(objeto)
+    raise TypeError(f'Sin evento para {type(objeto).__name__}')
+
+
+# Tipo de evento, prefijo de la referencia y clave del id en `datos`
+_ORIGENES = {
+    ClientePlan: (EventoCliente.TIPO_PLAN, 'plan', 'cliente_plan_id'),
+    Pago: (EventoCliente.TIPO_PAGO, 'pago', 'pago_id'),
+    OrdenTecnica: (EventoCliente.TIPO_OT, 'ot', 'ot_id'),
+}
+
+
+def evento_borrado(objeto, titulo, detalle, icono, clase):
+    """Borrado de un ClientePlan, Pago u OrdenTecnica. Se arma antes de
+    delete(), que deja el pk en None."""
+    tipo, prefijo, campo = _ORIGENES[type(objeto)]
+    return EventoCliente(
+        cliente_id=objeto.cliente_id,
+        ocurrido=timezone.now(),
+        tipo=tipo,
+        datos={
+            'titulo': titulo,
+            'detalle': detalle,
+            'icono': icono,
+            'clase': clase,
+            campo: objeto.pk,
+            'borrado': True,
+        },
+        referencia=f'{prefijo}:{objeto.pk}:borrado'
+    )
+
+
+def eventos_historicos(cliente_ids, apps=apps_globales):
+    """
+    Eventos de los movimientos, planes, pagos y OTs de los clientes dados,
+    para copiar lo que existía antes de EventoCliente.
+
+    Args:
+        cliente_ids: IDs de Cliente
+        apps: Registro de modelos; la migración pasa el histórico
+    """
+    def modelo(nombre):
+        return apps.get_model('billing_app', nombre)
+
+    for mov in modelo('MovimientoHistorial').objects.filter(
+        cliente_id__in=cliente_ids
+    ).select_related('cliente'):
+        yield evento_movimiento(
+            mov.cliente, mov.tipo, mov.detalle, mov.icono, mov.clase,
+            ocurrido=mov.fecha, referencia=f'movimiento:{mov.pk}'
+        )
+    for cp in modelo('ClientePlan').objects.filter(
+        cliente_id__in=cliente_ids
+    ).select_related('plan'):
+        yield evento_plan(cp)
+    for pago in modelo('Pago').objects.filter(cliente_id__in=cliente_ids):
+        yield evento_pago(pago)
+    for ot in modelo('OrdenTecnica').objects.filter(
+        cliente_id__in=cliente_ids
+    ).select_related('concepto'):
+        yield evento_ot(ot, creacion=True)
+        if ot.completada and ot.fecha_finalizacion:
+            yield evento_ot(ot)
+
+
+def guardar_eventos(eventos):
+    """Inserta los eventos; los de una referencia ya registrada se
+    ignoran."""
+    return EventoCliente.objects.bulk_create(eventos, ignore_conflicts=True)
+
+
+class _LoteEventos:
+    """Eventos pendientes de un nivel de transacción. La única referencia
+    fuerte es el on_commit registrado: si se revierte, el lote desaparece
+    también de _lotes."""
+
+    def __init__(self, clave):
+        self.clave = clave
+        self.eventos = []
+
+    def guardar(self):
+        if _lotes.get(self.clave) is self:
+            del _lotes[self.clave]
+        try:
+            guardar_eventos(self.eventos)
+        except Exception:
+            logger.exception(
+                "No se pudieron guardar %s eventos de clientes",
+                len(self.eventos)
+            )
+
+
+_lotes = weakref.WeakValueDictionary()
+
+
+def encolar_eventos(eventos, using=None):
+    """Guarda los eventos al confirmar la transacción en curso (o ya, si no
+    hay ninguna)."""
+    conexion = transaction.get_connection(using)
+    if not conexion.in_atomic_block:
+        lote = _LoteEventos(None)
+        lote.eventos.extend(eventos)
+        lote.guardar()
+        return
+    clave = (
+        threading.get_ident(), conexion.alias, tuple(conexion.savepoint_ids)
+    )
+    lote = _lotes.get(clave)
+    if lote is None:
+        lote = _LoteEventos(clave)
+        _lotes[clave] = lote
+        transaction.on_commit(lote.guardar, using=using)
+    lote.eventos.extend(eventos)
+
+
+@contextmanager
+def agrupar_eventos(using=None):
+    """Para código fuera de una transacción: los movimientos registrados
+    en el bloque se guardan juntos al salir, o ninguno si hay error."""
+    with transaction.atomic(using=using):
+        yield
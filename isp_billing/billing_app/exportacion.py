@@ -0,0 +1,212 @@
+"""
+Exportación de reportes a XLSX, CSV y NDJSON sin cargar todo en memoria.
+
+Las filas de cada hoja pueden venir de un generador. Para XLSX se vuelcan a
+un archivo temporal mientras se calcula el ancho de cada columna, y luego se
+escriben con openpyxl en modo write-only (que exige fijar los anchos antes
+de la primera fila); el libro se guarda en otro archivo temporal que se
+entrega con FileResponse. CSV y NDJSON se emiten fila a fila con
+StreamingHttpResponse.
+"""
+import csv
+import json
+import pickle
+import tempfile
+from datetime import datetime
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from . import dependencias
+
+CONTENT_TYPE_XLSX = (
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+)
+ANCHO_MAXIMO = 50
+ANCHO_VACIO = 12
+
+
+def normalizar_valor(value):
+    """Excel no admite fechas con zona horaria; se pasan a hora local."""
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localtime(value).replace(tzinfo=None)
+        return value
+    return value
+
+
+class _HojaVolcada:
+    """Filas de una hoja guardadas en disco junto con el largo máximo de
+    cada columna."""
+
+    def __init__(self, headers, rows):
+        self.anchos = []
+        self.archivo = tempfile.TemporaryFile()
+        self._volcar(headers)
+        for row in rows:
+            self._volcar([normalizar_valor(cell) for cell in row])
+        self.archivo.seek(0)
+
+    def _volcar(self, valores):
+        for idx, valor in enumerate(valores):
+            if idx == len(self.anchos):
+                self.anchos.append(0)
+            if valor is not None:
+                self.anchos[idx] = max(self.anchos[idx], len(str(valor)))
+        pickle.dump(valores, self.archivo, pickle.HIGHEST_PROTOCOL)
+
+    def filas(self):
+        try:
+            while True:
+                yield pickle.load(self.archivo)
+        except EOFError:
+            pass
+        finally:
+            self.archivo.close()
+
+
+def guardar_xlsx(salida, sheets):
+    """
+    Escribe en `salida` (archivo binario) un XLSX con una hoja por elemento
+    de `sheets`: lista de dicts {'title', 'headers', 'rows'}, donde 'rows'
+    puede ser cualquier iterable de filas.
+    """
+    openpyxl = dependencias.openpyxl('exportar a Excel')
+    get_column_letter = openpyxl.utils.get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet in sheets:
+        hoja = _HojaVolcada(sheet['headers'], sheet['rows'])
+        ws = wb.create_sheet(title=sheet['title'])
+        for idx, largo in enumerate(hoja.anchos, start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = (
+                min(largo + 2, ANCHO_MAXIMO) if largo else ANCHO_VACIO
+            )
+        for fila in hoja.filas():
+            ws.append(fila)
+    wb.save(salida)
+
+
+def respuesta_xlsx(filename, sheets):
+    """Descarga del XLSX de `sheets` desde un archivo temporal."""
+    salida = tempfile.TemporaryFile()
+    guardar_xlsx(salida, sheets)
+    salida.seek(0)
+    return FileResponse(
+        salida,
+        as_attachment=True,
+        filename=filename,
+        content_type=CONTENT_TYPE_XLSX
+    )
+
+
+class _Eco:
+    """Buffer mínimo para csv.writer: devuelve lo escrito en vez de
+    guardarlo."""
+
+    def write(self, value):
+        return value
+
+
+def _valor_texto(value):
+    value = normalizar_valor(value)
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+def lineas_csv(sheet):
+    """Una hoja como CSV (UTF-8 con BOM para que Excel respete tildes)."""
+    writer = csv.writer(_Eco())
+    yield '\ufeff' + writer.writerow(sheet['headers'])
+    for row in sheet['rows']:
+        yield writer.writerow([_valor_texto(cell) for cell in row])
+
+
+def lineas_ndjson(sheets):
+    """Una línea JSON por fila; con varias hojas cada línea lleva 'hoja'."""
+    varias = len(sheets) > 1
+    for sheet in sheets:
+        headers = sheet['headers']
+        for row in sheet['rows']:
+            registro = dict(zip(
+                headers, (normalizar_valor(cell) for cell in row)
+            ))
+            if varias:
+                registro = {'hoja': sheet['title'], **registro}
+            yield json.dumps(
+                registro, cls=DjangoJSONEncoder, ensure_ascii=False
+            ) + '\n'
+
+
+def respuesta_csv(filename, sheet):
+    response = StreamingHttpResponse(
+        lineas_csv(sheet), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def respuesta_ndjson(filename, sheets):
+    response = StreamingHttpResponse(
+        lineas_ndjson(sheets),
+        content_type='application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+FORMATOS = ('xlsx', 'csv', 'ndjson')
+
+
+def _hoja_csv(filename, sheets, hoja):
+    """Hoja elegida para CSV (índice desde 0; la primera si no es válido)
+    y el nombre de archivo que le corresponde."""
+    try:
+        sheet = sheets[int(hoja or 0)]
+    except (ValueError, IndexError):
+        sheet = sheets[0]
+    base = filename.rsplit('.', 1)[0]
+    if len(sheets) > 1:
+        base = f"{base}_{sheet['title'].lower().replace(' ', '_')}"
+    return sheet, f'{base}.csv'
+
+
+def nombre_archivo(filename, sheets, formato, hoja=None):
+    if formato == 'csv':
+        return _hoja_csv(filename, sheets, hoja)[1]
+    if formato == 'ndjson':
+        return f"{filename.rsplit('.', 1)[0]}.ndjson"
+    return filename
+
+
+def guardar_reporte(salida, filename, sheets, formato, hoja=None):
+    """Escribe el reporte en `salida` (archivo binario) en el formato
+    indicado."""
+    if formato == 'csv':
+        sheet = _hoja_csv(filename, sheets, hoja)[0]
+        for linea in lineas_csv(sheet):
+            salida.write(linea.encode('utf-8'))
+    elif formato == 'ndjson':
+        for linea in lineas_ndjson(sheets):
+            salida.write(linea.encode('utf-8'))
+    else:
+        guardar_xlsx(salida, sheets)
+
+
+def respuesta_reporte(request, filename, sheets):
+    """
+    Entrega el reporte en el formato pedido con ?format= (xlsx por
+    defecto, csv o ndjson). En CSV sólo va una hoja: la indicada con
+    ?hoja= (índice desde 0) o la primera.
+    """
+    formato = (request.GET.get('format') or 'xlsx').lower()
+    if formato == 'csv':
+        sheet, nombre = _hoja_csv(filename, sheets, request.GET.get('hoja'))
+        return respuesta_csv(nombre, sheet)
+    if formato == 'ndjson':
+        return respuesta_ndjson(
+            nombre_archivo(filename, sheets, formato), sheets
+        )
+    return respuesta_xlsx(filename, sheets)
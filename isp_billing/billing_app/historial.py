@@ -0,0 +1,88 @@
+"""
+Línea de tiempo del detalle del cliente.
+
+Se lee de EventoCliente (ver eventos.py) con un único recorrido del índice
+(cliente, -ocurrido, -id), limitado a una página. El cursor es la clave
+(ocurrido, id) del último evento entregado; "cargar anteriores" continúa
+desde ahí.
+
+Reemplaza a la mezcla con heapq.merge de las consultas de movimientos,
+planes, pagos y OTs: de aquella versión quedan el endpoint
+cliente/<pk>/historial/?antes=, el cursor opaco y el botón "Cargar
+anteriores" del detalle.
+"""
+import base64
+import binascii
+import json
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import EventoCliente
+
+TAMANO_HISTORIAL = 50
+MAXIMO_HISTORIAL = 200
+
+
+def codificar_cursor(clave):
+    ocurrido, pk = clave
+    crudo = json.dumps([ocurrido.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        ocurrido, pk = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        ocurrido = parse_datetime(ocurrido)
+        if ocurrido is None or timezone.is_naive(ocurrido):
+            raise ValueError(cursor)
+        return ocurrido, int(pk)
+    except (TypeError, binascii.Error, json.JSONDecodeError) as exc:
+        raise ValueError(f'Cursor inválido: {cursor}') from exc
+
+
+def _evento(fila):
+    datos = fila.datos
+    return {
+        'clave': (fila.ocurrido, fila.pk),
+        'fecha': timezone.localtime(fila.ocurrido).date(),
+        'fecha_dt': fila.ocurrido,
+        'tipo': fila.tipo,
+        'titulo': datos.get('titulo', ''),
+        'detalle': datos.get('detalle', ''),
+        'icono': datos.get('icono', 'fa-info-circle'),
+        'clase': datos.get('clase', 'secondary'),
+    }
+
+
+def linea_de_tiempo(cliente, cursor=None, limite=TAMANO_HISTORIAL):
+    """
+    Eventos del cliente de más reciente a más antiguo.
+
+    Args:
+        cursor: Valor devuelto por una llamada anterior (o None para
+            empezar por lo más reciente)
+
+    Returns:
+        tuple: (eventos, cursor de la página siguiente o None)
+    """
+    limite = max(1, min(limite, MAXIMO_HISTORIAL))
+    filas = EventoCliente.objects.filter(cliente=cliente)
+    if cursor:
+        ocurrido, pk = decodificar_cursor(cursor)
+        filas = filas.filter(
+            Q(ocurrido__lt=ocurrido) | Q(ocurrido=ocurrido, id__lt=pk)
+        )
+    eventos = [
+        _evento(fila)
+        for fila in filas.order_by('-ocurrido', '-id')[:limite + 1]
+    ]
+    siguiente = None
+    if len(eventos) > limite:
+        eventos = eventos[:limite]
+        siguiente = codificar_cursor(eventos[-1]['clave'])
+    return eventos, siguiente
@@ -0,0 +1,275 @@
+"""
+Impresión masiva de comprobantes en un solo PDF.
+
+pagos_a_imprimir() arma la selección (rango de fechas, sector o ids) e
+imprimir_comprobantes() escribe el PDF unido en un archivo abierto:
+
+- Los pagos se recorren por lotes de TAMANO_LOTE; de cada lote sólo se
+  renderizan los comprobantes que no tienen un ComprobantePDF vigente (ver
+  comprobantes.py), repartidos en un pool de procesos porque xhtml2pdf usa
+  un solo núcleo. Los PDF nuevos quedan guardados para la próxima vez.
+- UnionPDF copia los objetos de cada comprobante al archivo de salida a
+  medida que los lee, sin armar el documento en memoria: sólo conserva la
+  posición de cada objeto y la lista de páginas para el índice final.
+
+Así la memoria depende del tamaño del lote y no de la cantidad de pagos.
+"""
+import os
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+import django
+from django.db.models import Q
+from .comprobantes import (
+    datos_empresa, es_vigente, formato_pdf, guardar_comprobante,
+    huella_comprobante, renderizar_pdf
+)
+from .dependencias import pypdf
+from .models import ComprobantePDF, Pago
+
+TAMANO_LOTE = 50
+MAXIMO_PROCESOS = 4
+MINIMO_POOL = 8
+# Atributos de página que pueden venir heredados del árbol de páginas
+HEREDABLES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+class UnionPDF:
+    """
+    Concatena documentos PDF en `salida` (archivo binario abierto) objeto
+    por objeto. Los objetos 1 y 2 quedan reservados para el catálogo y el
+    árbol de páginas, que se escriben en cerrar().
+    """
+
+    def __init__(self, salida):
+        self.salida = salida
+        self.posiciones = array('Q', [0, 0])
+        self.paginas = array('Q')
+        self._escribir(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _escribir(self, datos):
+        self.salida.write(datos)
+
+    def _nuevo_numero(self):
+        self.posiciones.append(0)
+        return len(self.posiciones)
+
+    def _abrir_objeto(self, numero):
+        self.posiciones[numero - 1] = self.salida.tell()
+        self._escribir(f'{numero} 0 obj\n'.encode('ascii'))
+
+    def agregar(self, origen):
+        """Agrega todas las páginas de `origen` (ruta o archivo)."""
+        pdf = pypdf('unir los comprobantes')
+        ArrayObject = pdf.generic.ArrayObject
+        DictionaryObject = pdf.generic.DictionaryObject
+        IndirectObject = pdf.generic.IndirectObject
+        NameObject = pdf.generic.NameObject
+        lector = pdf.PdfReader(origen)
+        numeros = {}
+        pendientes = deque()
+
+        def referencia(indirecto):
+            clave = (indirecto.idnum, indirecto.generation)
+            if clave not in numeros:
+                numeros[clave] = self._nuevo_numero()
+                pendientes.append(indirecto)
+            return IndirectObject(numeros[clave], 0, None)
+
+        def renumerar(objeto):
+            if isinstance(objeto, IndirectObject):
+                return referencia(objeto)
+            if isinstance(objeto, DictionaryObject):
+                for clave, valor in list(objeto.items()):
+                    objeto[clave] = renumerar(valor)
+            elif isinstance(objeto, ArrayObject):
+                for i, valor in enumerate(objeto):
+                    objeto[i] = renumerar(valor)
+            return objeto
+
+        for pagina in lector.pages:
+            self.paginas.append(
+                referencia(pagina.indirect_reference).idnum
+            )
+        while pendientes:
+            indirecto = pendientes.popleft()
+            numero = numeros[(indirecto.idnum, indirecto.generation)]
+            objeto = indirecto.get_object()
+            if (
+                isinstance(objeto, DictionaryObject)
+                and objeto.get('/Type') == '/Page'
+            ):
+                for clave in HEREDABLES:
+                    if clave not in objeto:
+                        valor = _heredado(objeto, clave)
+                        if valor is not None:
+                            objeto[NameObject(clave)] = valor
+                # Sin seguir /Parent: se enlaza al árbol de páginas propio
+                objeto[NameObject('/Parent')] = IndirectObject(2, 0, None)
+                for clave, valor in list(objeto.items()):
+                    if clave != '/Parent':
+                        objeto[clave] = renumerar(valor)
+            else:
+                renumerar(objeto)
+            self._abrir_objeto(numero)
+            objeto.write_to_stream(self.salida)
+            self._escribir(b'\nendobj\n')
+
+    def cerrar(self):
+        kids = ' '.join(f'{numero} 0 R' for numero in self.paginas)
+        self._abrir_objeto(2)
+        self._escribir(
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(self.paginas)} >>'
+            '\nendobj\n'.encode('ascii')
+        )
+        self._abrir_objeto(1)
+        self._escribir(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+        inicio_xref = self.salida.tell()
+        total = len(self.posiciones) + 1
+        self._escribir(
+            f'xref\n0 {total}\n0000000000 65535 f \n'.encode('ascii')
+        )
+        for posicion in self.posiciones:
+            self._escribir(f'{posicion:010d} 00000 n \n'.encode('ascii'))
+        self._escribir(
+            f'trailer\n<< /Size {total} /Root 1 0 R >>\n'
+            f'startxref\n{inicio_xref}\n%%EOF\n'.encode('ascii')
+        )
+
+
+def _heredado(pagina, clave):
+    nodo = pagina.get('/Parent')
+    while nodo is not None:
+        nodo = nodo.get_object()
+        if clave in nodo:
+            return nodo[clave]
+        nodo = nodo.get('/Parent')
+    return None
+
+
+def pagos_a_imprimir(desde=None, hasta=None, sector=None, ids=None):
+    """
+    Pagos de la selección, del más antiguo al más reciente.
+
+    Args:
+        desde, hasta: Fechas (inclusive) del pago
+        sector: id del Sector de la vía del cliente
+        ids: ids de Pago
+
+    Raises:
+        ValueError: Si no se indicó ningún criterio
+    """
+    if not (desde or hasta or sector or ids):
+        raise ValueError(
+            'Indique un rango de fechas, un sector o los pagos a imprimir'
+        )
+    filtro = Q()
+    if desde:
+        filtro &= Q(fecha__date__gte=desde)
+    if hasta:
+        filtro &= Q(fecha__date__lte=hasta)
+    if sector:
+        filtro &= Q(cliente__via__sector_id=sector)
+    if ids:
+        filtro &= Q(pk__in=ids)
+    return (
+        Pago.objects.filter(filtro)
+        .select_related('cliente__via')
+        .prefetch_related('items')
+        .order_by('fecha', 'id')
+    )
+
+
+def _renderizar(argumentos):
+    pago, formato, empresa = argumentos
+    return renderizar_pdf(pago, formato, empresa)
+
+
+def procesos_por_defecto():
+    return max(1, min(os.cpu_count() or 1, MAXIMO_PROCESOS))
+
+
+class _Renderizador:
+    """Renderiza en este proceso hasta que un lote trae al menos
+    MINIMO_POOL comprobantes pendientes; recién ahí arranca el pool (cada
+    proceso tarda en importar Django y xhtml2pdf)."""
+
+    def __init__(self, procesos):
+        self.procesos = procesos
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+        return False
+
+    def map(self, argumentos):
+        if (
+            self.pool is None
+            and self.procesos > 1
+            and len(argumentos) >= MINIMO_POOL
+        ):
+            # spawn: los procesos no heredan las conexiones a la base (no
+            # la usan: reciben el pago ya cargado). django.setup() tiene que
+            # correr antes de importar este módulo, que importa los modelos
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=get_context('spawn'),
+                initializer=django.setup
+            )
+        if self.pool is not None:
+            return self.pool.map(_renderizar, argumentos)
+        return map(_renderizar, argumentos)
+
+
+def imprimir_comprobantes(pagos, salida, formato='a5', procesos=None):
+    """
+    Escribe en `salida` un PDF con el comprobante de cada pago de `pagos`
+    (un queryset de pagos_a_imprimir()).
+
+    Returns:
+        int: Comprobantes incluidos
+
+    Raises:
+        ErrorPDF: Si xhtml2pdf no pudo generar alguno
+    """
+    formato = formato_pdf(formato)
+    procesos = procesos or procesos_por_defecto()
+    empresa = datos_empresa()
+    union = UnionPDF(salida)
+    total = 0
+    filas = pagos.iterator(chunk_size=TAMANO_LOTE)
+    with _Renderizador(procesos) as renderizador:
+        for lote in iter(lambda: list(islice(filas, TAMANO_LOTE)), []):
+            guardados = {
+                comprobante.pago_id: comprobante
+                for comprobante in ComprobantePDF.objects.filter(
+                    pago__in=lote, formato=formato
+                )
+            }
+            huellas = {
+                pago.pk: huella_comprobante(pago, formato) for pago in lote
+            }
+            faltan = [
+                pago for pago in lote
+                if not es_vigente(guardados.get(pago.pk), huellas[pago.pk])
+            ]
+            renderizados = renderizador.map(
+                [(pago, formato, empresa) for pago in faltan]
+            )
+            for pago, contenido in zip(faltan, renderizados):
+                guardados[pago.pk] = guardar_comprobante(
+                    pago, formato, huellas[pago.pk], contenido,
+                    guardados.get(pago.pk)
+                )
+            for pago in lote:
+                with guardados[pago.pk].archivo.open('rb') as archivo:
+                    union.agregar(archivo)
+                total += 1
+    union.cerrar()
+    return total
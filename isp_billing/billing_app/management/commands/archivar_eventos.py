@@ -0,0 +1,99 @@
+"""
+Mueve a EventoClienteArchivo los eventos de clientes más antiguos que N
+años.
+Uso: python manage.py archivar_eventos [--anios 5] [--lote 5000]
+
+Se procesa un mes calendario por transacción, del más antiguo al límite
+(que siempre cae en un día 1). Así cada paso copia y borra un rango
+contiguo del índice por fecha, y si la tabla se particiona por mes en
+PostgreSQL cada paso vacía una partición entera.
+"""
+
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from billing_app.models import EventoCliente, EventoClienteArchivo
+
+CAMPOS = ('id', 'cliente_id', 'ocurrido', 'tipo', 'datos', 'referencia')
+
+
+def _inicio_mes(anio, mes):
+    return timezone.make_aware(datetime(anio, mes, 1))
+
+
+def _mes_siguiente(fecha):
+    local = timezone.localtime(fecha)
+    if local.month == 12:
+        return _inicio_mes(local.year + 1, 1)
+    return _inicio_mes(local.year, local.month + 1)
+
+
+class Command(BaseCommand):
+    help = 'Archiva los eventos de clientes anteriores a N años'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--anios', type=int, default=5,
+            help='Antigüedad mínima (en años) de los eventos a archivar'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=5000,
+            help='Filas por inserción'
+        )
+
+    def _archivar_rango(self, desde, hasta, lote):
+        filas = EventoCliente.objects.filter(
+            ocurrido__gte=desde, ocurrido__lt=hasta
+        )
+        movidos = 0
+        with transaction.atomic():
+            bloque = []
+            for valores in filas.order_by('ocurrido', 'id').values(
+                *CAMPOS
+            ).iterator(chunk_size=lote):
+                bloque.append(EventoClienteArchivo(**valores))
+                if len(bloque) >= lote:
+                    EventoClienteArchivo.objects.bulk_create(
+                        bloque, ignore_conflicts=True
+                    )
+                    movidos += len(bloque)
+                    bloque = []
+            if bloque:
+                EventoClienteArchivo.objects.bulk_create(
+                    bloque, ignore_conflicts=True
+                )
+                movidos += len(bloque)
+            filas.delete()
+        return movidos
+
+    def handle(self, *args, **options):
+        if options['anios'] < 1:
+            raise CommandError('--anios debe ser al menos 1')
+        hoy = timezone.localdate()
+        limite = _inicio_mes(hoy.year - options['anios'], hoy.month)
+
+        primero = (
+            EventoCliente.objects.filter(ocurrido__lt=limite)
+            .order_by('ocurrido')
+            .values_list('ocurrido', flat=True)
+            .first()
+        )
+        total = 0
+        if primero is not None:
+            local = timezone.localtime(primero)
+            desde = _inicio_mes(local.year, local.month)
+            while desde < limite:
+                hasta = _mes_siguiente(desde)
+                movidos = self._archivar_rango(desde, hasta, options['lote'])
+                if movidos:
+                    self.stdout.write(
+                        f'  {timezone.localtime(desde):%Y-%m}: '
+                        f'{movidos} eventos'
+                    )
+                total += movidos
+                desde = hasta
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total} eventos anteriores a {limite:%d/%m/%Y} archivados'
+        ))
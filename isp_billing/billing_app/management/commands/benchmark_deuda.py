@@ -0,0 +1,82 @@
+"""
+Micro-benchmark del motor de periodos de deuda (sin base de datos).
+Uso: python manage.py benchmark_deuda --planes 10000 --anios 5
+"""
+
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from billing_app.models import ClientePlan, Plan
+from billing_app.utils import _periodos_deuda_cliente, meses_facturables
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el cálculo de deuda sobre planes sintéticos en memoria '
+        '(no lee ni escribe la base de datos)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--planes', type=int, default=10000)
+        parser.add_argument('--anios', type=int, default=5)
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        hoy = timezone.now().date()
+        inicio = hoy - timedelta(days=365 * options['anios'])
+        catalogo = [
+            Plan(id=i + 1, nombre=f'Plan {precio}', precio=Decimal(precio))
+            for i, precio in enumerate(['50.00', '80.00', '120.00'])
+        ]
+
+        datos = {
+            'exclusiones_plan': defaultdict(lambda: defaultdict(set)),
+            'exclusiones_ot': {},
+            'planes': defaultdict(list),
+            'ots': {},
+            'pagos_plan': {},
+            'pagos_ot': {},
+        }
+        for plan_id in range(1, options['planes'] + 1):
+            # Un cliente por plan; fechas de inicio en los primeros días
+            # del rango para que todos tengan ~N años de historia.
+            cp = ClientePlan(
+                id=plan_id,
+                cliente_id=plan_id,
+                plan=rnd.choice(catalogo),
+                fecha_inicio=inicio + timedelta(days=rnd.randint(0, 27)),
+                fecha_cobranza=5,
+            )
+            datos['planes'][plan_id].append(cp)
+            meses = meses_facturables(cp.fecha_inicio, hoy)
+            for mes in meses:
+                if rnd.random() < 0.7:
+                    datos['pagos_plan'][(plan_id, mes)] = cp.plan.precio
+            if rnd.random() < 0.2:
+                datos['exclusiones_plan'][plan_id][plan_id].add(
+                    rnd.choice(meses)
+                )
+
+        tiempos = []
+        filas = 0
+        for _ in range(max(options['repeticiones'], 1)):
+            t0 = time.perf_counter()
+            filas = 0
+            for cliente_id in datos['planes']:
+                filas += len(_periodos_deuda_cliente(cliente_id, datos, hoy))
+            tiempos.append(time.perf_counter() - t0)
+
+        mejor = min(tiempos)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {options['planes']} planes x {options['anios']} años: "
+            f"{filas} periodos con deuda\n"
+            f"  mejor: {mejor * 1000:.1f} ms "
+            f"({options['planes'] / mejor:,.0f} planes/s), "
+            f"promedio: {sum(tiempos) / len(tiempos) * 1000:.1f} ms"
+        ))
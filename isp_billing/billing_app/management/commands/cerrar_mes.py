@@ -0,0 +1,46 @@
+"""
+Genera el cierre mensual con los saldos de cartera al fin de mes.
+Uso: python manage.py cerrar_mes [--mes 2024-05] [--reemplazar]
+"""
+
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing_app.cierres import cerrar_mes
+
+
+class Command(BaseCommand):
+    help = (
+        'Guarda los saldos pendientes de todos los clientes al último día '
+        'del mes (por defecto, el mes anterior)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mes', type=str,
+            help='Mes a cerrar en formato AAAA-MM'
+        )
+        parser.add_argument(
+            '--reemplazar', action='store_true',
+            help='Rehace el cierre si el mes ya estaba cerrado'
+        )
+
+    def handle(self, *args, **options):
+        if options['mes']:
+            try:
+                periodo = datetime.strptime(options['mes'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--mes debe tener el formato AAAA-MM')
+        else:
+            inicio_mes = timezone.now().date().replace(day=1)
+            periodo = (inicio_mes - timedelta(days=1)).replace(day=1)
+
+        try:
+            cierre = cerrar_mes(periodo, reemplazar=options['reemplazar'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Cierre {cierre.periodo:%Y-%m} generado: '
+            f'{cierre.saldos.count()} saldos, total S/ {cierre.total_deuda}'
+        ))
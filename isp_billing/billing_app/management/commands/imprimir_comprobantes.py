@@ -0,0 +1,69 @@
+"""
+Genera un solo PDF con los comprobantes de un rango de fechas, un sector o
+una lista de pagos.
+Uso: python manage.py imprimir_comprobantes --salida lote.pdf
+     [--desde 2024-01-01] [--hasta 2024-01-31] [--sector 3]
+     [--ids 10,11,12] [--formato a5] [--procesos 4]
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from billing_app.comprobantes import FORMATOS_PDF
+from billing_app.impresion import (
+    imprimir_comprobantes, pagos_a_imprimir, procesos_por_defecto
+)
+
+
+def _fecha(valor):
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValueError(f'Fecha inválida: {valor}')
+    return fecha
+
+
+def _ids(valor):
+    return [int(pk) for pk in valor.split(',') if pk.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Une en un PDF los comprobantes de los pagos seleccionados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--salida', required=True, help='Archivo PDF a escribir'
+        )
+        parser.add_argument('--desde', type=_fecha, help='AAAA-MM-DD')
+        parser.add_argument('--hasta', type=_fecha, help='AAAA-MM-DD')
+        parser.add_argument('--sector', type=int, help='id del sector')
+        parser.add_argument(
+            '--ids', type=_ids, help='ids de pago separados por comas'
+        )
+        parser.add_argument(
+            '--formato', choices=FORMATOS_PDF, default='a5'
+        )
+        parser.add_argument(
+            '--procesos', type=int, default=procesos_por_defecto(),
+            help='Procesos para renderizar en paralelo'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            pagos = pagos_a_imprimir(
+                desde=options['desde'],
+                hasta=options['hasta'],
+                sector=options['sector'],
+                ids=options['ids']
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        inicio = time.perf_counter()
+        with open(options['salida'], 'wb') as salida:
+            total = imprimir_comprobantes(
+                pagos, salida, options['formato'], options['procesos']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {total} comprobantes en {options['salida']} "
+            f"({time.perf_counter() - inicio:.1f} s)"
+        ))
@@ -0,0 +1,48 @@
+"""
+Rellena el texto normalizado de búsqueda de clientes y pagos.
+Uso: python manage.py indexar_busqueda [--lote 1000]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from billing_app.busqueda import indexar_clientes, indexar_pagos
+from billing_app.models import Cliente, Pago
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el campo busqueda y el índice de palabras de todos los '
+        'clientes y pagos (tras migrar o importar datos en bloque)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=1000,
+            help='Registros por transacción'
+        )
+
+    def _por_lotes(self, queryset, lote, indexar):
+        total = 0
+        ultimo = 0
+        while True:
+            bloque = list(queryset.filter(pk__gt=ultimo).order_by('pk')[:lote])
+            if not bloque:
+                return total
+            with transaction.atomic():
+                indexar(bloque)
+            total += len(bloque)
+            ultimo = bloque[-1].pk
+            self.stdout.write(f'  {total} registros indexados')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        clientes = self._por_lotes(
+            Cliente.objects.all(), lote,
+            lambda bloque: indexar_clientes(bloque, con_pagos=False)
+        )
+        pagos = self._por_lotes(
+            Pago.objects.select_related('cliente'), lote, indexar_pagos
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Búsqueda indexada: {clientes} clientes y {pagos} pagos'
+        ))
@@ -0,0 +1,175 @@
+"""
+Precalcula en paralelo las cuentas por cobrar de toda la cartera.
+Uso: python manage.py precalcular_deuda [--workers 4] [--lote 500] [--reanudar]
+
+Pensado para ejecutarse de noche: reportes_index y reportes_deuda leen
+EstadoCuenta y quedan al día sin recalcular en la petición. Las lecturas no
+recalculan al cambiar de mes, así que la corrida del día 1 es la que agrega
+los periodos del mes nuevo. Los clientes se
+reparten en lotes por rango de id; cada lote terminado se anota en el
+archivo de checkpoint para poder retomar una corrida interrumpida.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+# Los modelos se importan dentro de las funciones: con spawn los procesos
+# hijos importan este módulo antes de configurar Django.
+
+
+def _iniciar_worker():
+    # Con fork el hijo hereda las conexiones del padre, que no deben
+    # compartirse.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _sincronizar_lote(desde, hasta):
+    """Sincroniza los clientes con id en [desde, hasta]; devuelve
+    (desde, hasta, cantidad)."""
+    from billing_app.cuentas import sincronizar_cuentas
+    from billing_app.models import Cliente
+    cantidad = sincronizar_cuentas(
+        Cliente.objects.filter(id__gte=desde, id__lte=hasta)
+    )
+    return desde, hasta, cantidad
+
+
+def _procesar_lote(desde, hasta):
+    """_sincronizar_lote en un proceso del pool, con su propia conexión."""
+    try:
+        return _sincronizar_lote(desde, hasta)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula en paralelo las cuentas por cobrar de todos los '
+        'clientes para que los reportes de deuda lean totales listos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Procesos en paralelo (por defecto, uno por CPU)'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Clientes por lote'
+        )
+        parser.add_argument(
+            '--reanudar', action='store_true',
+            help='Retoma la última corrida desde el checkpoint'
+        )
+        parser.add_argument(
+            '--checkpoint', type=str,
+            default=str(settings.BASE_DIR / '.precalculo_deuda.json'),
+            help='Archivo donde se anotan los lotes terminados'
+        )
+
+    def _lotes(self, tamanio):
+        from billing_app.models import Cliente
+        ids = list(Cliente.objects.order_by('id').values_list('id', flat=True))
+        return [
+            [ids[i], ids[min(i + tamanio, len(ids)) - 1]]
+            for i in range(0, len(ids), tamanio)
+        ]
+
+    def _resultados(self, pendientes, workers):
+        """Resultado de cada lote a medida que termina, o la excepción si
+        falló."""
+        if workers == 1:
+            # Sin pool: en este proceso y con su conexión
+            for desde, hasta in pendientes:
+                try:
+                    yield _sincronizar_lote(desde, hasta)
+                except Exception as exc:
+                    yield exc
+            return
+        # Cada worker abre su propia conexión a la base de datos
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_iniciar_worker
+        ) as pool:
+            futuros = [
+                pool.submit(_procesar_lote, desde, hasta)
+                for desde, hasta in pendientes
+            ]
+            for futuro in as_completed(futuros):
+                try:
+                    yield futuro.result()
+                except Exception as exc:
+                    yield exc
+
+    def _guardar(self, ruta, estado):
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo)
+        os.replace(temporal, ruta)
+
+    def handle(self, *args, **options):
+        ruta = options['checkpoint']
+        workers = max(options['workers'], 1)
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite no admite escrituras concurrentes; se usa 1 worker'
+            ))
+            workers = 1
+
+        if options['reanudar']:
+            if not os.path.exists(ruta):
+                raise CommandError(f'No existe el checkpoint {ruta}')
+            with open(ruta, encoding='utf-8') as archivo:
+                estado = json.load(archivo)
+        else:
+            estado = {
+                'lotes': self._lotes(max(options['lote'], 1)),
+                'completos': [],
+            }
+            self._guardar(ruta, estado)
+
+        completos = {tuple(lote) for lote in estado['completos']}
+        pendientes = [
+            lote for lote in estado['lotes'] if tuple(lote) not in completos
+        ]
+        total = len(estado['lotes'])
+        self.stdout.write(
+            f'Lotes: {total} ({len(pendientes)} pendientes), '
+            f'workers: {workers}'
+        )
+
+        inicio = time.perf_counter()
+        clientes = 0
+        errores = []
+        for resultado in self._resultados(pendientes, workers):
+            if isinstance(resultado, Exception):
+                errores.append(str(resultado))
+                continue
+            desde, hasta, cantidad = resultado
+            clientes += cantidad
+            estado['completos'].append([desde, hasta])
+            self._guardar(ruta, estado)
+            self.stdout.write(
+                f'  {len(estado["completos"])}/{total} lotes '
+                f'(clientes {desde}-{hasta}: {cantidad})'
+            )
+
+        if errores:
+            raise CommandError(
+                f'{len(errores)} lotes fallaron ({errores[0]}); '
+                'vuelva a ejecutar con --reanudar'
+            )
+        os.remove(ruta)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Deuda precalculada: {clientes} clientes en '
+            f'{time.perf_counter() - inicio:.1f} s'
+        ))
@@ -0,0 +1,57 @@
+"""
+Reconstruye y verifica las cuentas por cobrar materializadas.
+Uso: python manage.py reconstruir_cuentas [--solo-verificar] [--lote 500]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from billing_app.cuentas import sincronizar_cuentas, verificar_cuentas
+from billing_app.models import Cliente
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye las cuentas por cobrar de todos los clientes y las '
+        'verifica contra el cálculo de deuda actual'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-verificar', action='store_true',
+            help='No reconstruye; sólo reporta diferencias'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Clientes procesados por transacción'
+        )
+
+    def handle(self, *args, **options):
+        lote = max(options['lote'], 1)
+        cliente_ids = list(
+            Cliente.objects.order_by('id').values_list('id', flat=True)
+        )
+        total = len(cliente_ids)
+        sincronizados = 0
+        diferencias = []
+
+        for inicio in range(0, total, lote):
+            ids = cliente_ids[inicio:inicio + lote]
+            clientes = Cliente.objects.filter(id__in=ids)
+            if not options['solo_verificar']:
+                sincronizados += sincronizar_cuentas(clientes)
+            diferencias.extend(verificar_cuentas(clientes))
+            self.stdout.write(
+                f'  {min(inicio + lote, total)}/{total} clientes'
+            )
+
+        if not options['solo_verificar']:
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Cuentas reconstruidas: {sincronizados} clientes'
+            ))
+        if diferencias:
+            raise CommandError(
+                f'{len(diferencias)} clientes no coinciden: '
+                + ', '.join(str(cid) for cid in diferencias[:50])
+            )
+        self.stdout.write(self.style.SUCCESS(
+            '✓ Cuentas verificadas sin diferencias'
+        ))
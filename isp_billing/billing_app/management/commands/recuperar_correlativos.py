@@ -0,0 +1,59 @@
+"""
+Devuelve a la lista de libres los números de bloques de correlativos
+abandonados (workers caídos o reiniciados) y audita cada serie.
+Uso: python manage.py recuperar_correlativos [--minutos 30] [--auditar]
+
+Conviene programarlo cada hora: un bloque sólo se recupera si lleva más de
+--minutos sin entregar números.
+"""
+
+from django.core.management.base import BaseCommand
+from billing_app.correlativos import (
+    VIGENCIA_BLOQUE, auditar, recuperar_bloques
+)
+from billing_app.models import SerieCorrelativo
+
+
+def _resumen(numeros, limite=10):
+    texto = ', '.join(str(numero) for numero in numeros[:limite])
+    if len(numeros) > limite:
+        texto += f' … (+{len(numeros) - limite})'
+    return texto
+
+
+class Command(BaseCommand):
+    help = (
+        'Recupera los correlativos de bloques abandonados y verifica que no '
+        'haya huecos ni duplicados'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutos', type=int, default=VIGENCIA_BLOQUE,
+            help='Minutos sin uso tras los que un bloque se da por abandonado'
+        )
+        parser.add_argument(
+            '--auditar', action='store_true',
+            help='Contrasta cada serie con los pagos registrados'
+        )
+
+    def handle(self, *args, **options):
+        devueltos = recuperar_bloques(minutos=options['minutos'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {devueltos} correlativos devueltos a la lista de libres'
+        ))
+        if not options['auditar']:
+            return
+        for serie in SerieCorrelativo.objects.order_by('tipo'):
+            resultado = auditar(serie)
+            if resultado['huecos']:
+                self.stdout.write(self.style.WARNING(
+                    f"  {serie}: huecos {_resumen(resultado['huecos'])}"
+                ))
+            if resultado['duplicados']:
+                self.stdout.write(self.style.ERROR(
+                    f"  {serie}: duplicados "
+                    f"{_resumen(resultado['duplicados'])}"
+                ))
+            if not resultado['huecos'] and not resultado['duplicados']:
+                self.stdout.write(f'  {serie}: sin huecos ni duplicados')
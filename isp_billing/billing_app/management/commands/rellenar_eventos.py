@@ -0,0 +1,43 @@
+"""
+Copia al historial de eventos los movimientos, planes, pagos y OTs que ya
+existían antes de EventoCliente.
+Uso: python manage.py rellenar_eventos [--lote 500]
+
+La migración 0033 ya lo hace al actualizar; el comando sirve tras cargar
+datos sin pasar por registrar_movimiento. Se puede repetir sin duplicar:
+cada evento lleva la referencia de su origen y los ya registrados se
+ignoran.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from billing_app.eventos import eventos_historicos, guardar_eventos
+from billing_app.models import Cliente
+
+
+class Command(BaseCommand):
+    help = (
+        'Rellena EventoCliente desde MovimientoHistorial, ClientePlan, Pago '
+        'y OrdenTecnica'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Clientes por transacción'
+        )
+
+    def handle(self, *args, **options):
+        ids = list(Cliente.objects.order_by('pk').values_list('pk', flat=True))
+        lote = options['lote']
+        total = 0
+        for i in range(0, len(ids), lote):
+            bloque = ids[i:i + lote]
+            with transaction.atomic():
+                total += len(guardar_eventos(list(eventos_historicos(bloque))))
+            self.stdout.write(
+                f'  {min(i + lote, len(ids))}/{len(ids)} clientes'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total} eventos revisados para {len(ids)} clientes'
+        ))
@@ -0,0 +1,62 @@
+"""
+Worker local de reportes en segundo plano (sin broker externo).
+Uso: python manage.py run_report_worker [--intervalo 2] [--una-vez]
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from billing_app.cola_reportes import (
+    limpiar_reportes, procesar_trabajo, tomar_trabajo
+)
+
+LIMPIEZA_CADA = 300
+
+
+class Command(BaseCommand):
+    help = (
+        'Procesa la cola de reportes (TrabajoReporte) y borra los '
+        'archivos vencidos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=2,
+            help='Segundos de espera cuando la cola está vacía'
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Procesa lo pendiente y termina'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('✓ Worker de reportes iniciado'))
+        ultima_limpieza = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - ultima_limpieza > LIMPIEZA_CADA:
+                    borrados = limpiar_reportes()
+                    if borrados:
+                        self.stdout.write(
+                            f'  {borrados} reportes vencidos eliminados'
+                        )
+                    ultima_limpieza = time.monotonic()
+
+                trabajo = tomar_trabajo()
+                if trabajo is None:
+                    if options['una_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                inicio = time.perf_counter()
+                trabajo = procesar_trabajo(trabajo)
+                self.stdout.write(
+                    f'  #{trabajo.pk} {trabajo.tipo} ({trabajo.formato}): '
+                    f'{trabajo.get_estado_display()} en '
+                    f'{time.perf_counter() - inicio:.1f} s'
+                )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('✓ Worker de reportes detenido'))
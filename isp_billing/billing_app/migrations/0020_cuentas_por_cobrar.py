@@ -0,0 +1,53 @@
+# Generated by Django 4.2.8 on 2026-10-17 05:55
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0019_cliente_fecha_instalacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoCuenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saldo_total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12)),
+                ('periodo_calculado', models.DateField()),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='estado_cuenta', to='billing_app.cliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['saldo_total'], name='estado_cuenta_saldo_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CuentaPorCobrar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_mes', models.DateField(blank=True, null=True)),
+                ('orden', models.PositiveIntegerField(default=0)),
+                ('monto_cargado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('monto_pagado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cuentas_por_cobrar', to='billing_app.cliente')),
+                ('ot_asociada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='billing_app.ordentecnica')),
+                ('plan_asociado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='billing_app.clienteplan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cliente', 'orden'], name='cuenta_cliente_orden_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cuentaporcobrar',
+            constraint=models.UniqueConstraint(fields=('plan_asociado', 'periodo_mes'), name='uniq_cuenta_plan_periodo'),
+        ),
+        migrations.AddConstraint(
+            model_name='cuentaporcobrar',
+            constraint=models.UniqueConstraint(fields=('ot_asociada',), name='uniq_cuenta_ot'),
+        ),
+    ]
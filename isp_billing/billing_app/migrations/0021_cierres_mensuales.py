@@ -0,0 +1,46 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:01
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0020_cuentas_por_cobrar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes cerrado', unique=True)),
+                ('fecha_corte', models.DateField(help_text='Último día del mes cerrado')),
+                ('total_deuda', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('reabiertos', models.ManyToManyField(blank=True, related_name='cierres_reabiertos', to='billing_app.cliente')),
+            ],
+            options={
+                'ordering': ['-periodo'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CierreSaldo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_mes', models.DateField(blank=True, null=True)),
+                ('monto_cargado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('monto_pagado', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cierre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='billing_app.cierremensual')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_cierre', to='billing_app.cliente')),
+                ('ot_asociada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='billing_app.ordentecnica')),
+                ('plan_asociado', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='billing_app.clienteplan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cierre', 'cliente'], name='cierre_saldo_cliente_idx')],
+            },
+        ),
+    ]
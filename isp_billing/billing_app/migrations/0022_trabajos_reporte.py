@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billing_app', '0021_cierres_mensuales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=30)),
+                ('formato', models.CharField(default='xlsx', max_length=10)),
+                ('hoja', models.PositiveSmallIntegerField(default=0)),
+                ('clave', models.CharField(max_length=80)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('LISTO', 'Listo'), ('ERROR', 'Error')], default='PENDIENTE', max_length=12)),
+                ('archivo', models.FileField(blank=True, upload_to='reportes/')),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('expira', models.DateTimeField(blank=True, null=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['estado', 'creado'], name='trabajo_reporte_estado_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trabajoreporte',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['PENDIENTE', 'PROCESANDO'])), fields=('clave',), name='uniq_trabajo_reporte_en_curso'),
+        ),
+    ]
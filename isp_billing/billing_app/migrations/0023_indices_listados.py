@@ -0,0 +1,25 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0022_trabajos_reporte'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['apellidos', 'nombres', 'id'], name='cliente_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='egreso',
+            index=models.Index(fields=['-fecha', '-id'], name='egreso_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['-fecha', '-id'], name='pago_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:15
+
+from django.db import migrations, models
+
+INDICES_TRIGRAMA = (
+    ('cliente_busqueda_trgm', 'billing_app_cliente'),
+    ('pago_busqueda_trgm', 'billing_app_pago'),
+)
+
+
+def crear_indices_trigrama(apps, schema_editor):
+    """En PostgreSQL la búsqueda usa LIKE '%...%' sobre `busqueda`, que un
+    índice GIN de trigramas resuelve sin recorrer la tabla."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for indice, tabla in INDICES_TRIGRAMA:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {indice} ON {tabla} '
+            'USING gin (busqueda gin_trgm_ops)'
+        )
+
+
+def borrar_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for indice, _ in INDICES_TRIGRAMA:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {indice}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0023_indices_listados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='busqueda',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.CreateModel(
+            name='TokenBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cliente', 'Cliente'), ('pago', 'Pago')], max_length=10)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('token', models.CharField(max_length=50)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tipo', 'token', 'objeto_id'], name='token_busqueda_idx'), models.Index(fields=['tipo', 'objeto_id'], name='token_busqueda_objeto_idx')],
+            },
+        ),
+        migrations.RunPython(crear_indices_trigrama, borrar_indices_trigrama),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0024_busqueda_normalizada'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['busqueda', 'id'], name='cliente_busqueda_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0025_indice_autocompletar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoClienteArchivo',
+            fields=[
+                ('ocurrido', models.DateTimeField()),
+                ('tipo', models.CharField(max_length=20)),
+                ('datos', models.JSONField(default=dict)),
+                ('referencia', models.CharField(blank=True, default='', max_length=40)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_archivados', to='billing_app.cliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cliente', '-ocurrido', '-id'], name='evento_archivo_linea_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventoCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ocurrido', models.DateTimeField()),
+                ('tipo', models.CharField(max_length=20)),
+                ('datos', models.JSONField(default=dict)),
+                ('referencia', models.CharField(blank=True, default='', max_length=40)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos', to='billing_app.cliente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cliente', '-ocurrido', '-id'], name='evento_cliente_linea_idx'), models.Index(fields=['ocurrido'], name='evento_cliente_fecha_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='eventocliente',
+            constraint=models.UniqueConstraint(condition=models.Q(('referencia', ''), _negated=True), fields=('referencia',), name='uniq_evento_cliente_referencia'),
+        ),
+    ]
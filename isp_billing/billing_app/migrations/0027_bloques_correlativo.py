@@ -0,0 +1,31 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0026_eventos_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueCorrelativo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.PositiveIntegerField()),
+                ('fin', models.PositiveIntegerField()),
+                ('siguiente', models.PositiveIntegerField()),
+                ('dueno', models.CharField(max_length=100)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField()),
+                ('cerrado', models.DateTimeField(blank=True, null=True)),
+                ('serie_correlativo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloques', to='billing_app.seriecorrelativo')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['serie_correlativo', 'cerrado'], name='bloque_serie_abierto_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0027_bloques_correlativo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('huella', models.CharField(max_length=64)),
+                ('respuesta', models.JSONField(default=dict)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='billing_app.cliente')),
+                ('pago', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='billing_app.pago')),
+            ],
+        ),
+    ]
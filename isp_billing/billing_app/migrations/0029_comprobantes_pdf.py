@@ -0,0 +1,35 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:32
+
+import billing_app.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0028_solicitud_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoreporte',
+            name='pago',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='billing_app.pago'),
+        ),
+        migrations.CreateModel(
+            name='ComprobantePDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formato', models.CharField(max_length=10)),
+                ('huella', models.CharField(max_length=64)),
+                ('archivo', models.FileField(upload_to=billing_app.models._ruta_comprobante)),
+                ('generado', models.DateTimeField(auto_now=True)),
+                ('pago', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pdfs', to='billing_app.pago')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='comprobantepdf',
+            constraint=models.UniqueConstraint(fields=('pago', 'formato'), name='uniq_comprobante_formato'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-17 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0029_comprobantes_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoreporte',
+            name='parametros',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
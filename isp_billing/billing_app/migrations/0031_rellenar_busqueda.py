@@ -0,0 +1,76 @@
+from django.db import migrations
+from billing_app.texto import normalizar
+
+LOTE = 1000
+LARGO_TOKEN = 50
+
+
+def _tokens(texto):
+    return list(dict.fromkeys(
+        token[:LARGO_TOKEN] for token in texto.split()
+    ))
+
+
+def _texto_cliente(apellidos, nombres, dni):
+    return normalizar(f'{apellidos} {nombres} {dni}')
+
+
+def _rellenar(modelo, columnas, texto, TokenBusqueda, tipo, con_tokens):
+    """Completa `busqueda` de las filas que la tienen vacía, por lotes."""
+    ultimo = 0
+    while True:
+        filas = list(
+            modelo.objects.filter(pk__gt=ultimo, busqueda='')
+            .order_by('pk')
+            .values_list('pk', *columnas)[:LOTE]
+        )
+        if not filas:
+            return
+        textos = {}
+        for pk, *valores in filas:
+            textos[pk] = texto(*valores)
+            modelo.objects.filter(pk=pk).update(busqueda=textos[pk])
+        if con_tokens:
+            TokenBusqueda.objects.filter(
+                tipo=tipo, objeto_id__in=list(textos)
+            ).delete()
+            TokenBusqueda.objects.bulk_create([
+                TokenBusqueda(tipo=tipo, objeto_id=pk, token=token)
+                for pk, valor in textos.items()
+                for token in _tokens(valor)
+            ])
+        ultimo = filas[-1][0]
+
+
+def rellenar_busqueda(apps, schema_editor):
+    """Lo mismo que el comando indexar_busqueda, para que la búsqueda
+    encuentre los clientes y pagos anteriores a 0024 sin pasos manuales."""
+    Cliente = apps.get_model('billing_app', 'Cliente')
+    Pago = apps.get_model('billing_app', 'Pago')
+    TokenBusqueda = apps.get_model('billing_app', 'TokenBusqueda')
+    # En PostgreSQL se busca con trigramas sobre `busqueda`, sin tokens
+    con_tokens = schema_editor.connection.vendor != 'postgresql'
+    _rellenar(
+        Cliente, ('apellidos', 'nombres', 'dni'), _texto_cliente,
+        TokenBusqueda, 'cliente', con_tokens
+    )
+    _rellenar(
+        Pago,
+        ('serie_numero', 'tipo_comprobante', 'cliente__apellidos',
+         'cliente__nombres', 'cliente__dni'),
+        lambda serie, tipo, apellidos, nombres, dni: normalizar(
+            f'{serie} {tipo} {_texto_cliente(apellidos, nombres, dni)}'
+        ),
+        TokenBusqueda, 'pago', con_tokens
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0030_trabajoreporte_parametros'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_busqueda, migrations.RunPython.noop),
+    ]
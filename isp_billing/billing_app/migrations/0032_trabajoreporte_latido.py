@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-17 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0031_rellenar_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoreporte',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+from billing_app.eventos import eventos_historicos
+
+LOTE = 500
+
+
+def rellenar_eventos(apps, schema_editor):
+    """Lo mismo que el comando rellenar_eventos, para que el historial de
+    los clientes anteriores a 0026 no quede vacío sin pasos manuales."""
+    Cliente = apps.get_model('billing_app', 'Cliente')
+    EventoCliente = apps.get_model('billing_app', 'EventoCliente')
+    ids = list(Cliente.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(ids), LOTE):
+        EventoCliente.objects.bulk_create(
+            [
+                EventoCliente(
+                    cliente_id=evento.cliente_id,
+                    ocurrido=evento.ocurrido,
+                    tipo=evento.tipo,
+                    datos=evento.datos,
+                    referencia=evento.referencia,
+                )
+                for evento in eventos_historicos(ids[i:i + LOTE], apps)
+            ],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing_app', '0032_trabajoreporte_latido'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_eventos, migrations.RunPython.noop),
+    ]
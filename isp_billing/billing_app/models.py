@@ -153,6 +153,19 @@ class Cliente(models.Model):
         'MikrotikConfig', on_delete=models.SET_NULL,
         null=True, blank=True
     )
+    # Apellidos, nombres y DNI normalizados (ver busqueda.py)
+    busqueda = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['apellidos', 'nombres', 'id'],
+                name='cliente_nombre_idx'
+            ),
+            models.Index(
+                fields=['busqueda', 'id'], name='cliente_busqueda_idx'
+            ),
+        ]
 
     def set_pppoe_password(self, raw_password: str):
         """Encripta y almacena la contraseña PPPoE"""
@@ -267,6 +280,11 @@ class Egreso(models.Model):
     observaciones = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='egreso_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.concepto.nombre} - S/ {self.monto}"
 
@@ -380,6 +398,13 @@ class Pago(models.Model):
     pdf_comprobante = models.FileField(
         upload_to='comprobantes/', null=True, blank=True
     )
+    # Comprobante y datos del cliente normalizados (ver busqueda.py)
+    busqueda = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='pago_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.serie_numero} - {self.monto}"
@@ -452,7 +477,56 @@ class PagoDetalle(models.Model):
         return f"Pago {cast(Any, self.pago).id} - {self.descripcion}"
 
 
+class SolicitudPago(models.Model):
+    """Clave de idempotencia de un envío a procesar_pago y la respuesta que
+    se dio, para repetirla si el navegador reintenta."""
+    clave = models.CharField(max_length=64, unique=True)
+    # sha256 del cuerpo enviado: la misma clave con otros datos se rechaza
+    huella = models.CharField(max_length=64)
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.CASCADE, related_name='+'
+    )
+    pago = models.ForeignKey(
+        Pago, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+'
+    )
+    respuesta = models.JSONField(default=dict)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.clave
+
+
+def _ruta_comprobante(instance, filename):
+    return f'comprobantes/{instance.pago_id}/{filename}'
+
+
+class ComprobantePDF(models.Model):
+    """PDF ya generado de un pago en un formato (ver comprobantes.py).
+    `huella` resume los datos con que se generó: si cambian, el archivo se
+    vuelve a generar."""
+    pago = models.ForeignKey(
+        Pago, on_delete=models.CASCADE, related_name='pdfs'
+    )
+    formato = models.CharField(max_length=10)
+    huella = models.CharField(max_length=64)
+    archivo = models.FileField(upload_to=_ruta_comprobante)
+    generado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['pago', 'formato'], name='uniq_comprobante_formato'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{cast(Any, self).pago_id} ({self.formato})"
+
+
 class MovimientoHistorial(models.Model):
+    """Historial anterior a EventoCliente; ya no se escribe y sólo se lee
+    en rellenar_eventos."""
     cliente = models.ForeignKey(
         Cliente, on_delete=models.CASCADE, related_name='movimientos_historial'
     )
@@ -466,6 +540,67 @@ class MovimientoHistorial(models.Model):
         return f"{self.cliente} - {self.tipo} - {self.fecha:%Y-%m-%d %H:%M}"
 
 
+class EventoClienteBase(models.Model):
+    """Campos comunes del historial de eventos y de su archivo."""
+    ocurrido = models.DateTimeField()
+    tipo = models.CharField(max_length=20)
+    datos = models.JSONField(default=dict)
+    # Origen del evento ('pago:15', 'movimiento:3'...), para no duplicarlo
+    # al rellenar desde las tablas antiguas; vacío si no aplica
+    referencia = models.CharField(max_length=40, blank=True, default='')
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        cliente_id = cast(Any, self).cliente_id
+        return f"{cliente_id} - {self.tipo} - {self.ocurrido:%Y-%m-%d %H:%M}"
+
+
+class EventoCliente(EventoClienteBase):
+    """Historial del cliente: sólo se agregan filas (ver eventos.py)."""
+    TIPO_MOVIMIENTO = 'movimiento'
+    TIPO_PLAN = 'plan'
+    TIPO_PAGO = 'pago'
+    TIPO_OT = 'ot'
+
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.CASCADE, related_name='eventos'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['referencia'],
+                condition=~models.Q(referencia=''),
+                name='uniq_evento_cliente_referencia'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['cliente', '-ocurrido', '-id'],
+                name='evento_cliente_linea_idx'
+            ),
+            models.Index(fields=['ocurrido'], name='evento_cliente_fecha_idx'),
+        ]
+
+
+class EventoClienteArchivo(EventoClienteBase):
+    """Eventos antiguos movidos por el comando archivar_eventos."""
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.CASCADE, related_name='eventos_archivados'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['cliente', '-ocurrido', '-id'],
+                name='evento_archivo_linea_idx'
+            ),
+        ]
+
+
 class DeudaExcluida(models.Model):
     cliente = models.ForeignKey(
         Cliente, on_delete=models.CASCADE, related_name='deudas_excluidas'
@@ -515,3 +650,253 @@ class SerieCorrelativoLibre(models.Model):
 
     def __str__(self):
         return f"{self.serie_correlativo.serie}-{str(self.numero).zfill(8)}"
+
+
+class BloqueCorrelativo(models.Model):
+    """Rango [inicio, fin] de una serie reservado por un hilo de un worker
+    (ver correlativos.py). Los números menores que `siguiente` ya se
+    emitieron; el resto se devuelve a SerieCorrelativoLibre si el bloque
+    queda abandonado."""
+    serie_correlativo = models.ForeignKey(
+        SerieCorrelativo, on_delete=models.CASCADE, related_name='bloques'
+    )
+    inicio = models.PositiveIntegerField()
+    fin = models.PositiveIntegerField()
+    siguiente = models.PositiveIntegerField()
+    dueno = models.CharField(max_length=100)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField()
+    cerrado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['serie_correlativo', 'cerrado'],
+                name='bloque_serie_abierto_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.serie_correlativo.serie} {self.inicio}-{self.fin}"
+
+
+# --- Cuentas por cobrar (materializadas) ---
+
+class CuentaPorCobrar(models.Model):
+    """Periodo pendiente de un cliente, tal como lo calcula
+    calcular_meses_deuda: un ClientePlan + periodo_mes, o una OT."""
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.CASCADE, related_name='cuentas_por_cobrar'
+    )
+    plan_asociado = models.ForeignKey(
+        ClientePlan, on_delete=models.CASCADE, null=True, blank=True
+    )
+    periodo_mes = models.DateField(null=True, blank=True)
+    ot_asociada = models.ForeignKey(
+        OrdenTecnica, on_delete=models.CASCADE, null=True, blank=True
+    )
+    orden = models.PositiveIntegerField(default=0)
+    monto_cargado = models.DecimalField(max_digits=10, decimal_places=2)
+    monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
+    saldo = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['plan_asociado', 'periodo_mes'],
+                name='uniq_cuenta_plan_periodo'
+            ),
+            models.UniqueConstraint(
+                fields=['ot_asociada'],
+                name='uniq_cuenta_ot'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['cliente', 'orden'], name='cuenta_cliente_orden_idx'
+            ),
+        ]
+
+    def __str__(self):
+        ot_id = cast(Any, self).ot_asociada_id
+        if ot_id:
+            return f"OT {ot_id} - S/ {self.saldo}"
+        return (
+            f"Plan {cast(Any, self).plan_asociado_id} {self.periodo_mes}"
+            f" - S/ {self.saldo}"
+        )
+
+
+class EstadoCuenta(models.Model):
+    """Resumen de deuda por cliente; periodo_calculado indica el mes en que
+    se materializaron sus cuentas por cobrar."""
+    cliente = models.OneToOneField(
+        Cliente, on_delete=models.CASCADE, related_name='estado_cuenta'
+    )
+    saldo_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0')
+    )
+    periodo_calculado = models.DateField()
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['saldo_total'], name='estado_cuenta_saldo_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.cliente} - S/ {self.saldo_total}"
+
+
+# --- Cierres mensuales ---
+
+class CierreMensual(models.Model):
+    """Foto de la deuda de la cartera al último día de un mes. Los cálculos
+    posteriores parten del último cierre en lugar de recorrer todo el
+    historial; los clientes en `reabiertos` tuvieron cambios anteriores al
+    corte y se recalculan completos."""
+    periodo = models.DateField(
+        unique=True, help_text="Primer día del mes cerrado"
+    )
+    fecha_corte = models.DateField(help_text="Último día del mes cerrado")
+    total_deuda = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0')
+    )
+    fecha = models.DateTimeField(auto_now_add=True)
+    reabiertos = models.ManyToManyField(
+        Cliente, blank=True, related_name='cierres_reabiertos'
+    )
+
+    class Meta:
+        ordering = ['-periodo']
+
+    def __str__(self):
+        return f"Cierre {self.periodo:%m/%Y} - S/ {self.total_deuda}"
+
+
+class CierreSaldo(models.Model):
+    cierre = models.ForeignKey(
+        CierreMensual, on_delete=models.CASCADE, related_name='saldos'
+    )
+    cliente = models.ForeignKey(
+        Cliente, on_delete=models.CASCADE, related_name='saldos_cierre'
+    )
+    plan_asociado = models.ForeignKey(
+        ClientePlan, on_delete=models.CASCADE, null=True, blank=True
+    )
+    periodo_mes = models.DateField(null=True, blank=True)
+    ot_asociada = models.ForeignKey(
+        OrdenTecnica, on_delete=models.CASCADE, null=True, blank=True
+    )
+    monto_cargado = models.DecimalField(max_digits=10, decimal_places=2)
+    monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
+    saldo = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['cierre', 'cliente'], name='cierre_saldo_cliente_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.cierre} - {self.cliente} - S/ {self.saldo}"
+
+
+# --- Reportes en segundo plano ---
+
+class TrabajoReporte(models.Model):
+    """Reporte pedido desde la web y generado por run_report_worker. Dos
+    pedidos idénticos en curso comparten el mismo trabajo (`clave`)."""
+    ESTADO_PENDIENTE = 'PENDIENTE'
+    ESTADO_PROCESANDO = 'PROCESANDO'
+    ESTADO_LISTO = 'LISTO'
+    ESTADO_ERROR = 'ERROR'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_PROCESANDO, 'Procesando'),
+        (ESTADO_LISTO, 'Listo'),
+        (ESTADO_ERROR, 'Error'),
+    ]
+    EN_CURSO = [ESTADO_PENDIENTE, ESTADO_PROCESANDO]
+
+    tipo = models.CharField(max_length=30)
+    formato = models.CharField(max_length=10, default='xlsx')
+    hoja = models.PositiveSmallIntegerField(default=0)
+    clave = models.CharField(max_length=80)
+    estado = models.CharField(
+        max_length=12, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE
+    )
+    archivo = models.FileField(upload_to='reportes/', blank=True)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL,
+        null=True, blank=True
+    )
+    # Sólo en los trabajos de tipo 'comprobante' (PDF de un pago)
+    pago = models.ForeignKey(
+        Pago, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='+'
+    )
+    # Sólo en los de tipo 'impresion': selección de pagos_a_imprimir()
+    parametros = models.JSONField(default=dict, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    # Lo renueva el worker mientras el trabajo está PROCESANDO
+    latido = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+    expira = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=models.Q(estado__in=['PENDIENTE', 'PROCESANDO']),
+                name='uniq_trabajo_reporte_en_curso'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['estado', 'creado'], name='trabajo_reporte_estado_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.tipo} ({self.formato}) - "
+            f"{cast(Any, self).get_estado_display()}"
+        )
+
+
+# --- Búsqueda ---
+
+class TokenBusqueda(models.Model):
+    """Índice de prefijos para la búsqueda en bases sin pg_trgm: una fila
+    por palabra normalizada de cada cliente o pago."""
+    TIPO_CLIENTE = 'cliente'
+    TIPO_PAGO = 'pago'
+    TIPO_CHOICES = [
+        (TIPO_CLIENTE, 'Cliente'),
+        (TIPO_PAGO, 'Pago'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    objeto_id = models.PositiveBigIntegerField()
+    token = models.CharField(max_length=50)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['tipo', 'token', 'objeto_id'],
+                name='token_busqueda_idx'
+            ),
+            models.Index(
+                fields=['tipo', 'objeto_id'], name='token_busqueda_objeto_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.objeto_id}: {self.token}"
@@ -0,0 +1,218 @@
+"""
+Paginación por cursor (keyset) para los listados grandes.
+
+En lugar de OFFSET, cada página se pide a partir de las claves de orden de
+la última (o primera) fila mostrada, así el costo no crece con el número de
+página y las filas nuevas no desplazan a las ya vistas. El orden debe ser
+estable: la última clave tiene que ser única (normalmente el id).
+
+El total es aproximado: en PostgreSQL y sin filtros se lee la estimación
+del planificador (pg_class.reltuples); en otro caso se cuenta con un tope
+de LIMITE_CONTEO filas.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+
+TAMANOS_PAGINA = (25, 50, 100)
+TAMANO_PAGINA = 50
+LIMITE_CONTEO = 1000
+
+
+@dataclass
+class Pagina:
+    objetos: list
+    por_pagina: int
+    total: int
+    total_exacto: bool
+    total_tope: bool
+    cursor_siguiente: str = None
+    cursor_anterior: str = None
+    parametros: str = ''
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+    @property
+    def tamanos(self):
+        return TAMANOS_PAGINA
+
+    @property
+    def total_texto(self):
+        if self.total_tope:
+            return f'{self.total}+'
+        if not self.total_exacto:
+            return f'≈ {self.total}'
+        return str(self.total)
+
+    @property
+    def url_siguiente(self):
+        if self.cursor_siguiente:
+            return self._url('despues', self.cursor_siguiente)
+        return None
+
+    @property
+    def url_anterior(self):
+        if self.cursor_anterior:
+            return self._url('antes', self.cursor_anterior)
+        return None
+
+    def _url(self, clave, cursor):
+        prefijo = f'{self.parametros}&' if self.parametros else ''
+        return f'?{prefijo}{clave}={cursor}'
+
+
+def _campos(orden):
+    """('-fecha', 'id') -> [('fecha', True), ('id', False)]"""
+    return [(campo.lstrip('-'), campo.startswith('-')) for campo in orden]
+
+
+def _codificar(obj, campos):
+    valores = [getattr(obj, campo) for campo, _ in campos]
+    valores = [
+        valor if isinstance(valor, (int, str)) else str(valor)
+        for valor in valores
+    ]
+    crudo = json.dumps(valores, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def _decodificar(cursor, modelo, campos):
+    """Valores del cursor convertidos al tipo de cada campo (las anotaciones
+    quedan como vienen en el JSON); None si el cursor no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            return None
+        convertidos = []
+        for (campo, _), valor in zip(campos, valores):
+            try:
+                valor = modelo._meta.get_field(campo).to_python(valor)
+            except FieldDoesNotExist:
+                pass
+            convertidos.append(valor)
+        return convertidos
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def _filtro_keyset(campos, valores, hacia_atras):
+    """Filas estrictamente posteriores (o anteriores) a `valores` en el
+    orden dado: (a > x) OR (a = x AND b > y) OR ..."""
+    filtro = Q()
+    for i, (campo, descendente) in enumerate(campos):
+        operador = 'gt' if descendente == hacia_atras else 'lt'
+        condicion = Q(**{f'{campo}__{operador}': valores[i]})
+        for j, (previo, _) in enumerate(campos[:i]):
+            condicion &= Q(**{previo: valores[j]})
+        filtro |= condicion
+    return filtro
+
+
+def _estimacion_tabla(modelo):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE relname = %s',
+            [modelo._meta.db_table]
+        )
+        fila = cursor.fetchone()
+    return int(fila[0]) if fila else -1
+
+
+def total_aproximado(queryset, filtrado):
+    """
+    Returns:
+        tuple: (total, exacto, tope)
+    """
+    if not filtrado and connection.vendor == 'postgresql':
+        estimado = _estimacion_tabla(queryset.model)
+        if estimado > LIMITE_CONTEO:
+            return estimado, False, False
+    total = queryset.order_by()[:LIMITE_CONTEO + 1].count()
+    if total > LIMITE_CONTEO:
+        return LIMITE_CONTEO, False, True
+    return total, True, False
+
+
+def tamano_pagina(request):
+    try:
+        tamano = int(request.GET.get('por_pagina', TAMANO_PAGINA))
+    except (TypeError, ValueError):
+        return TAMANO_PAGINA
+    return tamano if tamano in TAMANOS_PAGINA else TAMANO_PAGINA
+
+
+def paginar(request, queryset, orden, filtrado=False, anotaciones=None):
+    """
+    Página de `queryset` según ?despues= / ?antes= y ?por_pagina=.
+
+    Args:
+        orden: Campos de orden, p. ej. ('-fecha', '-id'); el último único
+        filtrado: Si el queryset tiene filtros de búsqueda (para el total)
+        anotaciones: annotate() que sólo se aplica a las filas de la
+            página, no al conteo
+    """
+    campos = _campos(orden)
+    por_pagina = tamano_pagina(request)
+    parametros = request.GET.copy()
+    for clave in ('despues', 'antes'):
+        parametros.pop(clave, None)
+
+    total, exacto, tope = total_aproximado(queryset, filtrado)
+    if anotaciones:
+        queryset = queryset.annotate(**anotaciones)
+
+    cursor = request.GET.get('antes') or request.GET.get('despues')
+    hacia_atras = bool(request.GET.get('antes'))
+    valores = (
+        _decodificar(cursor, queryset.model, campos) if cursor else None
+    )
+    if valores is None:
+        hacia_atras = False
+
+    filas = None
+    if hacia_atras:
+        invertido = [
+            campo[1:] if campo.startswith('-') else f'-{campo}'
+            for campo in orden
+        ]
+        filas = list(
+            queryset.filter(_filtro_keyset(campos, valores, True))
+            .order_by(*invertido)[:por_pagina + 1]
+        )
+        if len(filas) > por_pagina:
+            filas = filas[:por_pagina][::-1]
+            hay_anterior = hay_siguiente = True
+        else:
+            # Se llegó al inicio: se muestra la primera página completa
+            filas, valores = None, None
+    if filas is None:
+        if valores is not None:
+            queryset = queryset.filter(_filtro_keyset(campos, valores, False))
+        filas = list(queryset.order_by(*orden)[:por_pagina + 1])
+        hay_siguiente = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        hay_anterior = valores is not None
+
+    return Pagina(
+        objetos=filas,
+        por_pagina=por_pagina,
+        total=total,
+        total_exacto=exacto,
+        total_tope=tope,
+        cursor_siguiente=(
+            _codificar(filas[-1], campos) if filas and hay_siguiente else None
+        ),
+        cursor_anterior=(
+            _codificar(filas[0], campos) if filas and hay_anterior else None
+        ),
+        parametros=parametros.urlencode(),
+    )
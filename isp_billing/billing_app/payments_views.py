@@ -1,26 +1,54 @@
-from django.shortcuts import redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
-from django.template.loader import render_to_string
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import (
+    FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+)
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from django.contrib.auth.decorators import (
     login_required as django_login_required
 )
 from django.views.decorators.http import require_http_methods
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
 from .models import (
     Cliente, Pago, PagoDetalle, SerieCorrelativo, ClientePlan, OrdenTecnica,
-    SerieCorrelativoLibre, DeudaExcluida, CompanySettings
+    SerieCorrelativoLibre, DeudaExcluida, SolicitudPago
+)
+from .utils import registrar_movimiento
+from .cuentas import obtener_deuda_cliente, obtener_deudas_clientes
+from .cache_dashboard import invalidar_dashboard
+from .cola_reportes import encolar_comprobante, encolar_impresion
+from .comprobantes import (
+    ErrorPDF, contexto_comprobante, obtener_comprobante, pago_para_comprobante,
+    prerender_activo
+)
+from .correlativos import (
+    formatear, proximos_numeros, reservar_bloque, tomar_correlativo
+)
+from .cache_deuda import estadisticas_cache_deuda, invalidar_deuda_cliente
+from .impresion import imprimir_comprobantes, pagos_a_imprimir
+from .permissions import (
+    can_cobrar, can_manage_caja, can_view_deuda, is_developer
 )
-from .utils import calcular_meses_deuda, registrar_movimiento
-from .permissions import can_cobrar, can_view_deuda
+import hashlib
 import json
+import tempfile
+from collections import defaultdict
 from datetime import datetime
 import logging
 from decimal import Decimal, InvalidOperation
-from xhtml2pdf import pisa
 
 logger = logging.getLogger(__name__)
 
+MAX_CLIENTES_LOTE = 500
+BLOQUE_DEUDA_LOTE = 200
+LARGO_CLAVE_IDEMPOTENCIA = 64
+# Lo que se renderiza dentro de una petición (~0.06 s por comprobante sin
+# PDF guardado, en un núcleo) sin pasar el timeout de 30 s de gunicorn;
+# los lotes más grandes van a run_report_worker
+MAXIMO_IMPRESION_WEB = 250
+
 
 def login_required(*args, **kwargs):
     kwargs['login_url'] = 'login'
@@ -34,36 +62,136 @@ def _to_decimal(value):
         return Decimal('0')
 
 
-def _formatear_numero(serie, numero):
-    return f"{serie}-{str(numero).zfill(8)}"
+def _correlativos_actuales():
+    """Próximo número de cada serie (orientativo: el definitivo lo asigna
+    correlativos.tomar_correlativo al registrar el pago)."""
+    proximos = proximos_numeros()
+    return {
+        c.tipo: formatear(c.serie, proximos[c.id])
+        for c in SerieCorrelativo.objects.all()
+    }
 
 
-def _proximo_correlativo(correlativo):
-    libre = (
-        correlativo.libres.order_by('numero')
-        .values_list('numero', flat=True)
-        .first()
-    )
-    if libre:
-        return _formatear_numero(correlativo.serie, libre)
-    return _formatear_numero(correlativo.serie, correlativo.ultimo_numero + 1)
-
-
-def _reservar_correlativo(correlativo):
-    libre = (
-        SerieCorrelativoLibre.objects
-        .select_for_update()
-        .filter(serie_correlativo=correlativo)
-        .order_by('numero')
-        .first()
+def _item_deuda(d):
+    # Formato para JS (plan_id es el id de ClientePlan u OT)
+    return {
+        'plan_id': d['id'],
+        'plan_nombre': d['plan_nombre'],
+        'mes_iso': d['mes'].isoformat() if d['mes'] else '',
+        'mes_nombre': d['mes_nombre'],
+        'monto': float(_to_decimal(d['saldo'])),
+        'monto_original': float(_to_decimal(d['monto_original'])),
+        'tipo': d.get('tipo', 'plan').upper(),
+        'pagado': float(_to_decimal(d.get('pagado', 0)))
+    }
+
+
+def _plan_cobrable(cp):
+    if not (cp.plan and cp.plan.precio and cp.plan.precio > 0):
+        return None
+    nombre = cp.plan.nombre
+    if cp.plan.servicio:
+        nombre = f"{nombre} ({cp.plan.servicio.nombre})"
+    return {
+        'id': cp.id,
+        'nombre': nombre,
+        'precio': float(_to_decimal(cp.plan.precio))
+    }
+
+
+def _id_item(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _periodo_item(item):
+    periodo = item.get('mes_iso')
+    if not periodo:
+        return None
+    try:
+        return datetime.strptime(periodo[:10], '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _objetivos_pago(cliente, items):
+    """OTs y planes del cliente citados en `items`, como dicts por id."""
+    ids_ot, ids_plan = set(), set()
+    for item in items:
+        item_id = _id_item(item.get('plan_id'))
+        if item_id is None:
+            continue
+        if (item.get('tipo') or 'plan').upper() == 'OT':
+            ids_ot.add(item_id)
+        else:
+            ids_plan.add(item_id)
+    ots = {}
+    if ids_ot:
+        ots = OrdenTecnica.objects.filter(
+            cliente=cliente, id__in=ids_ot
+        ).select_related('concepto').in_bulk()
+    planes = {}
+    if ids_plan:
+        planes = ClientePlan.objects.filter(
+            cliente=cliente, id__in=ids_plan
+        ).select_related('plan').in_bulk()
+    return ots, planes
+
+
+def _registrar_detalles(pago, items, ots, planes):
+    """Inserta los PagoDetalle del pago en un solo bulk_create y marca como
+    pagadas las OTs cuyo acumulado ya cubre el monto (un agregado agrupado
+    y un update)."""
+    detalles = []
+    for item in items:
+        item_id = _id_item(item.get('plan_id'))
+        monto_pagar = _to_decimal(item.get('monto_pagar', 0))
+        nota = item.get('nota', '')
+        if (item.get('tipo') or 'plan').upper() == 'OT':
+            ot = ots.get(item_id)
+            if ot is None:
+                continue
+            detalles.append(PagoDetalle(
+                pago=pago,
+                ot_asociada=ot,
+                monto_parcial=monto_pagar,
+                descripcion=nota or f"Pago de OT: {ot.concepto.nombre}"
+            ))
+        else:
+            plan = planes.get(item_id)
+            if plan is None:
+                continue
+            detalles.append(PagoDetalle(
+                pago=pago,
+                plan_asociado=plan,
+                periodo_mes=_periodo_item(item),
+                monto_parcial=monto_pagar,
+                descripcion=nota or 'Pago de mes'
+            ))
+    if not detalles:
+        return
+    # bulk_create no emite post_save: se invalida la deuda una sola vez
+    PagoDetalle.objects.bulk_create(detalles)
+    invalidar_deuda_cliente(pago.cliente_id)
+
+    ids_ot = {d.ot_asociada_id for d in detalles if d.ot_asociada_id}
+    if not ids_ot:
+        return
+    acumulados = (
+        PagoDetalle.objects.filter(ot_asociada_id__in=ids_ot)
+        .values('ot_asociada_id')
+        .annotate(total=Sum('monto_parcial'))
+        .values_list('ot_asociada_id', 'total')
     )
-    if libre:
-        numero = libre.numero
-        libre.delete()
-        return _formatear_numero(correlativo.serie, numero)
-    correlativo.ultimo_numero += 1
-    correlativo.save(update_fields=['ultimo_numero'])
-    return _formatear_numero(correlativo.serie, correlativo.ultimo_numero)
+    pagadas = [
+        ot_id for ot_id, total in acumulados
+        if total >= ots[ot_id].monto and not ots[ot_id].pagada
+    ]
+    if pagadas:
+        OrdenTecnica.objects.filter(id__in=pagadas).update(pagada=True)
+        invalidar_dashboard('ordenes')
 
 
 @login_required(login_url='admin:login')
@@ -74,47 +202,180 @@ def api_get_deuda(request, cliente_id):
             status=403
         )
     cliente = get_object_or_404(Cliente, id=cliente_id)
-    deuda = calcular_meses_deuda(cliente)
-    # Formatear para JS (plan_id es el id de ClientePlan u OT)
-    items = []
-    for d in deuda:
-        items.append({
-            'plan_id': d['id'],
-            'plan_nombre': d['plan_nombre'],
-            'mes_iso': d['mes'].isoformat() if d['mes'] else '',
-            'mes_nombre': d['mes_nombre'],
-            'monto': float(_to_decimal(d['saldo'])),
-            'monto_original': float(_to_decimal(d['monto_original'])),
-            'tipo': d.get('tipo', 'plan').upper(),
-            'pagado': float(_to_decimal(d.get('pagado', 0)))
-        })
-    
-    # Obtener correlativos actuales
-    correlativos = {}
-    for c in SerieCorrelativo.objects.all():
-        correlativos[c.tipo] = _proximo_correlativo(c)
+    # Lo que se va a cobrar se lee de la cuenta materializada, que se
+    # actualiza en la misma transacción que cada pago (el caché podría ir
+    # por detrás de otro worker)
+    deuda = obtener_deuda_cliente(cliente)
+    items = [_item_deuda(d) for d in deuda]
 
     planes = []
     for cp in cliente.planes.select_related('plan__servicio').all():
-        if cp.plan and cp.plan.precio and cp.plan.precio > 0:
-            nombre = cp.plan.nombre
-            if cp.plan.servicio:
-                nombre = f"{nombre} ({cp.plan.servicio.nombre})"
-            planes.append({
-                'id': cp.id,
-                'nombre': nombre,
-                'precio': float(_to_decimal(cp.plan.precio))
-            })
+        plan = _plan_cobrable(cp)
+        if plan:
+            planes.append(plan)
 
     return JsonResponse({
         'items': items,
-        'correlativos': correlativos,
+        'correlativos': _correlativos_actuales(),
         'planes': planes
     })
 
 
+def _parametros_lote(request):
+    if request.method == 'POST':
+        try:
+            return json.loads(request.body or '{}')
+        except json.JSONDecodeError:
+            raise ValueError('JSON inválido')
+    params = request.GET.dict()
+    if params.get('ids'):
+        params['ids'] = params['ids'].split(',')
+    return params
+
+
+def _clientes_lote(params):
+    """Clientes pedidos por IDs o por filtros (sector, via, plan,
+    activos)."""
+    if params.get('ids'):
+        try:
+            ids = {int(x) for x in params['ids']}
+        except (TypeError, ValueError):
+            raise ValueError('ids debe ser una lista de enteros')
+        if len(ids) > MAX_CLIENTES_LOTE:
+            raise ValueError(
+                f'Máximo {MAX_CLIENTES_LOTE} clientes por consulta'
+            )
+        return Cliente.objects.filter(id__in=ids)
+
+    filtros = {}
+    for campo, lookup in (
+        ('sector', 'via__sector_id'),
+        ('via', 'via_id'),
+        ('plan', 'planes__plan_id'),
+    ):
+        if params.get(campo):
+            try:
+                filtros[lookup] = int(params[campo])
+            except (TypeError, ValueError):
+                raise ValueError(f'{campo} debe ser un entero')
+    if str(params.get('activos', '')).lower() in ('1', 'true', 'si'):
+        filtros['estado_activo'] = True
+    if not filtros:
+        raise ValueError('Indique ids o al menos un filtro')
+    return Cliente.objects.filter(**filtros).distinct()
+
+
+def _json_deuda_lote(cliente_ids, correlativos):
+    """Genera la respuesta por bloques de clientes para no armar todo el
+    JSON en memoria."""
+    yield '{"correlativos": ' + json.dumps(correlativos) + ', "clientes": ['
+    separador = ''
+    for inicio in range(0, len(cliente_ids), BLOQUE_DEUDA_LOTE):
+        bloque = cliente_ids[inicio:inicio + BLOQUE_DEUDA_LOTE]
+        deudas = obtener_deudas_clientes(Cliente.objects.filter(id__in=bloque))
+        planes = defaultdict(list)
+        for cp in (
+            ClientePlan.objects.filter(cliente_id__in=bloque)
+            .select_related('plan__servicio')
+            .order_by('id')
+        ):
+            plan = _plan_cobrable(cp)
+            if plan:
+                planes[cp.cliente_id].append(plan)
+        for cliente_id in bloque:
+            yield separador + json.dumps({
+                'cliente_id': cliente_id,
+                'items': [_item_deuda(d) for d in deudas.get(cliente_id, [])],
+                'planes': planes.get(cliente_id, [])
+            })
+            separador = ', '
+    yield ']}'
+
+
+@login_required(login_url='admin:login')
+@require_http_methods(['GET', 'POST'])
+def api_deuda_lote(request):
+    """
+    Deuda de varios clientes en una sola respuesta.
+
+    Recibe `ids` (hasta MAX_CLIENTES_LOTE) o filtros `sector`, `via`, `plan`
+    y `activos`, por GET o como JSON por POST. Devuelve los mismos items y
+    planes que api_get_deuda para cada cliente, con los correlativos una
+    sola vez.
+    """
+    if not can_view_deuda(request.user):
+        return JsonResponse({'clientes': []}, status=403)
+    try:
+        clientes = _clientes_lote(_parametros_lote(request))
+    except ValueError as exc:
+        return JsonResponse(
+            {'status': 'error', 'message': str(exc)}, status=400
+        )
+    cliente_ids = list(
+        clientes.order_by('id').values_list('id', flat=True)
+    )
+    return StreamingHttpResponse(
+        _json_deuda_lote(cliente_ids, _correlativos_actuales()),
+        content_type='application/json'
+    )
+
+
+@login_required(login_url='admin:login')
+def api_deuda_cache_stats(request):
+    if not is_developer(request.user):
+        return JsonResponse({}, status=403)
+    return JsonResponse(estadisticas_cache_deuda())
+
+
+class _SolicitudRepetida(Exception):
+    """Otra petición con la misma clave de idempotencia se registró
+    primero."""
+
+
+def _huella_pago(data):
+    crudo = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+
+def _respuesta_repetida(clave, cliente, huella):
+    """Respuesta ya dada a `clave`, o None si la clave es nueva."""
+    solicitud = SolicitudPago.objects.filter(clave=clave).first()
+    if solicitud is None:
+        return None
+    if solicitud.cliente_id != cliente.id or solicitud.huella != huella:
+        return JsonResponse(
+            {
+                'status': 'error',
+                'message': (
+                    'La clave de idempotencia ya se usó con otros datos'
+                )
+            },
+            status=409
+        )
+    response = JsonResponse(solicitud.respuesta)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _registrar_solicitud(clave, cliente, huella):
+    """Primera escritura del pago: la restricción única de `clave` hace
+    que de dos envíos simultáneos sólo uno siga adelante."""
+    try:
+        with transaction.atomic():
+            return SolicitudPago.objects.create(
+                clave=clave, huella=huella, cliente=cliente
+            )
+    except IntegrityError as exc:
+        raise _SolicitudRepetida(clave) from exc
+
+
 @login_required(login_url='admin:login')
 def procesar_pago(request):
+    """
+    Registra un pago y/o exoneraciones. Con la cabecera Idempotency-Key un
+    reintento con la misma clave devuelve la respuesta original sin volver
+    a registrar nada.
+    """
     if request.method != 'POST':
         return JsonResponse(
             {'status': 'error', 'message': 'Método no permitido'},
@@ -139,6 +400,17 @@ def procesar_pago(request):
             status=400
         )
     cliente = get_object_or_404(Cliente, id=cliente_id)
+    clave = (request.headers.get('Idempotency-Key') or '').strip()
+    if len(clave) > LARGO_CLAVE_IDEMPOTENCIA:
+        return JsonResponse(
+            {'status': 'error', 'message': 'Clave de idempotencia inválida'},
+            status=400
+        )
+    huella = _huella_pago(data) if clave else ''
+    if clave:
+        repetida = _respuesta_repetida(clave, cliente, huella)
+        if repetida:
+            return repetida
     tipo_comp = (data.get('tipo_comprobante', 'RECIBO') or 'RECIBO').upper()
     items_pagados = data.get('items_pagados', [])
     items_exonerados = data.get('items_exonerados', [])
@@ -151,16 +423,25 @@ def procesar_pago(request):
             status=400
         )
     try:
+        if items_pagados:
+            correlativo_obj = SerieCorrelativo.objects.get(tipo=tipo_comp)
+            # Si hace falta un bloque de números nuevo se reserva aquí,
+            # fuera de la transacción del pago, así la serie queda
+            # bloqueada sólo lo que dura esa reserva
+            reservar_bloque(correlativo_obj)
         with transaction.atomic():
+            solicitud = (
+                _registrar_solicitud(clave, cliente, huella) if clave
+                else None
+            )
+            # Planes y OTs referenciados, en dos consultas
+            ots, planes = _objetivos_pago(
+                cliente, items_pagados + items_exonerados
+            )
             pago = None
             numero_comp = None
             if items_pagados:
-                correlativo_obj = (
-                    SerieCorrelativo.objects
-                    .select_for_update()
-                    .get(tipo=tipo_comp)
-                )
-                numero_comp = _reservar_correlativo(correlativo_obj)
+                numero_comp = tomar_correlativo(correlativo_obj)
                 resumen = data.get('resumen_detalles', '')
                 monto_total = _to_decimal(data.get('monto_total', 0))
                 pago = Pago.objects.create(
@@ -170,53 +451,11 @@ def procesar_pago(request):
                     serie_numero=numero_comp,
                     detalles=resumen or 'Pago registrado'
                 )
-
-            for item in items_pagados:
-                plan_id = item.get('plan_id')
-                tipo_item = (item.get('tipo') or 'plan').upper()
-                monto_pagar = _to_decimal(item.get('monto_pagar', 0))
-                nota = item.get('nota', '')
-                if tipo_item == 'OT' and plan_id and pago:
-                    try:
-                        ot = OrdenTecnica.objects.get(
-                            id=plan_id, cliente=cliente
-                        )
-                    except OrdenTecnica.DoesNotExist:
-                        continue
-                    PagoDetalle.objects.create(
-                        pago=pago,
-                        ot_asociada=ot,
-                        monto_parcial=monto_pagar,
-                        descripcion=nota or f"Pago de OT: {ot.concepto.nombre}"
-                    )
-                    pagado_ot = PagoDetalle.objects.filter(
-                        ot_asociada=ot
-                    ).aggregate(total=Sum('monto_parcial'))['total'] or 0
-                    if pagado_ot >= ot.monto:
-                        ot.pagada = True
-                        ot.save(update_fields=['pagada'])
-                elif plan_id and pago:
-                    try:
-                        plan = ClientePlan.objects.get(
-                            id=plan_id, cliente=cliente
-                        )
-                    except ClientePlan.DoesNotExist:
-                        continue
-                    periodo = item.get('mes_iso')
-                    periodo_date = None
-                    if periodo:
-                        try:
-                            periodo_date = datetime.strptime(
-                                periodo[:10], '%Y-%m-%d'
-                            ).date()
-                        except (ValueError, TypeError):
-                            pass
-                    PagoDetalle.objects.create(
-                        pago=pago,
-                        plan_asociado=plan,
-                        periodo_mes=periodo_date,
-                        monto_parcial=monto_pagar,
-                        descripcion=nota or 'Pago de mes'
+                _registrar_detalles(pago, items_pagados, ots, planes)
+                if prerender_activo():
+                    pago_id = pago.pk
+                    transaction.on_commit(
+                        lambda: encolar_comprobante(pago_id)
                     )
 
             for item in items_exonerados:
@@ -224,9 +463,7 @@ def procesar_pago(request):
                 tipo_item = (item.get('tipo') or 'plan').upper()
                 nota = item.get('nota') or 'Exonerado'
                 if tipo_item == 'OT' and plan_id:
-                    ot = OrdenTecnica.objects.filter(
-                        id=plan_id, cliente=cliente
-                    ).first()
+                    ot = ots.get(_id_item(plan_id))
                     if ot:
                         DeudaExcluida.objects.get_or_create(
                             cliente=cliente,
@@ -244,17 +481,9 @@ def procesar_pago(request):
                             clase='warning'
                         )
                 elif plan_id:
-                    plan = ClientePlan.objects.filter(
-                        id=plan_id, cliente=cliente
-                    ).first()
-                    periodo = item.get('mes_iso')
-                    if plan and periodo:
-                        try:
-                            periodo_date = datetime.strptime(
-                                periodo[:10], '%Y-%m-%d'
-                            ).date()
-                        except (ValueError, TypeError):
-                            periodo_date = None
+                    plan = planes.get(_id_item(plan_id))
+                    if plan:
+                        periodo_date = _periodo_item(item)
                         if periodo_date:
                             DeudaExcluida.objects.get_or_create(
                                 cliente=cliente,
@@ -282,8 +511,28 @@ def procesar_pago(request):
                         f" - S/ {pago.monto}"
                     ),
                     icono='fa-money-bill-wave',
-                    clase='primary'
+                    clase='primary',
+                    objeto=pago
                 )
+
+            if pago:
+                respuesta = {
+                    'status': 'success',
+                    'pago_id': pago.id,
+                    'numero': numero_comp
+                }
+            else:
+                respuesta = {'status': 'success', 'exonerado_only': True}
+            if solicitud:
+                solicitud.pago = pago
+                solicitud.respuesta = respuesta
+                solicitud.save(update_fields=['pago', 'respuesta'])
+    except _SolicitudRepetida:
+        # La otra petición ya confirmó (la inserción esperó por ella)
+        return _respuesta_repetida(clave, cliente, huella) or JsonResponse(
+            {'status': 'error', 'message': 'Pago en proceso, reintente'},
+            status=409
+        )
     except SerieCorrelativo.DoesNotExist:
         return JsonResponse(
             {
@@ -305,11 +554,7 @@ def procesar_pago(request):
             status=500
         )
 
-    if pago:
-        return JsonResponse(
-            {'status': 'success', 'pago_id': pago.id, 'numero': numero_comp}
-        )
-    return JsonResponse({'status': 'success', 'exonerado_only': True})
+    return JsonResponse(respuesta)
 
 
 @login_required(login_url='admin:login')
@@ -351,114 +596,106 @@ def pago_eliminar(request, pago_id):
                 f" - S/ {pago.monto}"
             ),
             icono='fa-trash-alt',
-            clase='danger'
+            clase='danger',
+            objeto=pago,
+            borrado=True
         )
         pago.delete()
 
     return redirect('cliente-detalle', pk=cliente.pk)
 
 
-def _build_comprobante_context(pago, format_key='a5'):
-    company_settings = CompanySettings.get_settings()
-    logo_path = None
-    if company_settings.logo:
-        try:
-            logo_path = company_settings.logo.path
-        except (ValueError, OSError):
-            logo_path = None
-    if logo_path:
-        try:
-            from pathlib import Path
-            logo_path = Path(logo_path).as_uri()
-        except Exception:
-            logo_path = None
-
-    serie = None
-    numero = pago.serie_numero
-    if pago.serie_numero and '-' in pago.serie_numero:
-        serie, numero = pago.serie_numero.split('-', 1)
-
-    detalles = pago.detalles or ''
-    if not detalles:
-        detalles = ', '.join(
-            item.descripcion for item in pago.items.all()
-        )
-
-    fmt = (format_key or 'a5').lower()
-    if fmt in ('a4',):
-        page_size = 'A4'
-        page_margin = '12mm'
-        content_width = '180mm'
-        font_base = '10pt'
-    elif fmt in ('carta', 'letter'):
-        page_size = 'Letter'
-        page_margin = '12mm'
-        content_width = '180mm'
-        font_base = '10pt'
-    elif fmt in ('80mm', 'ticket80', 'termico80'):
-        page_size = '80mm auto'
-        page_margin = '4mm'
-        content_width = '72mm'
-        font_base = '9pt'
-    elif fmt in ('58mm', 'ticket58', 'termico58'):
-        page_size = '58mm auto'
-        page_margin = '4mm'
-        content_width = '52mm'
-        font_base = '8pt'
-    else:
-        page_size = 'A5'
-        page_margin = '12mm'
-        content_width = '160mm'
-        font_base = '10pt'
-
-    return {
-        'pago': pago,
-        'company_settings': company_settings,
-        'logo_path': logo_path,
-        'serie': serie or '',
-        'numero': numero or '',
-        'detalles_comp': detalles or 'Pago registrado',
-        'payment_method': 'Efectivo',
-        'format_key': fmt,
-        'page_size': page_size,
-        'page_margin': page_margin,
-        'content_width': content_width,
-        'font_base': font_base,
-        'is_ticket': fmt in ('80mm', 'ticket80', 'termico80', '58mm', 'ticket58', 'termico58'),
-        'color_main': '#111827',
-        'color_muted': '#6b7280',
-        'color_line': '#e5e7eb',
-        'color_panel': '#f9fafb'
-    }
-
-
 @login_required(login_url='admin:login')
 def generar_pdf_pago(request, pago_id):
-    pago = get_object_or_404(Pago, id=pago_id)
-    template_path = 'billing_app/pdf/comprobante.html'
-    formato = (request.GET.get('formato') or 'a5').lower()
-    if formato not in ('a5', 'a4', 'carta', 'letter'):
-        formato = 'a5'
-    context = _build_comprobante_context(pago, format_key=formato)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = (
-        f'inline; filename="comp_{pago.serie_numero}.pdf"'
-    )
-    
-    html = render_to_string(template_path, context)
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    
-    if pisa_status.err:
+    """Sirve el PDF guardado del comprobante (generándolo si hace falta);
+    con If-None-Match / If-Modified-Since responde 304."""
+    pago = pago_para_comprobante(pago_id).first()
+    if pago is None:
+        raise Http404('Pago no encontrado')
+    try:
+        comprobante = obtener_comprobante(pago, request.GET.get('formato'))
+    except ErrorPDF:
+        logger.exception("Error al generar el PDF del pago %s", pago_id)
         return HttpResponse('Error al generar PDF', status=500)
+
+    etag = f'"{comprobante.huella}"'
+    modificado = int(comprobante.generado.timestamp())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=modificado
+    )
+    if response is None:
+        response = FileResponse(
+            comprobante.archivo.open('rb'), content_type='application/pdf'
+        )
+        response['Content-Disposition'] = (
+            f'inline; filename="comp_{pago.serie_numero}.pdf"'
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modificado)
+    # El navegador puede guardarlo, pero debe revalidar en cada visita
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 
 @login_required(login_url='admin:login')
 def generar_ticket_pago(request, pago_id):
-    pago = get_object_or_404(Pago, id=pago_id)
+    pago = get_object_or_404(pago_para_comprobante(pago_id))
     formato = (request.GET.get('formato') or '80mm').lower()
     if formato not in ('80mm', '58mm'):
         formato = '80mm'
-    context = _build_comprobante_context(pago, format_key=formato)
+    context = contexto_comprobante(pago, format_key=formato)
     return render(request, 'billing_app/pdf/comprobante.html', context)
+
+
+@login_required(login_url='admin:login')
+def imprimir_comprobantes_lote(request):
+    """
+    Un solo PDF con los comprobantes de ?desde=&hasta= (fechas), ?sector=
+    y/o ?ids=1,2,3 en ?formato=. Hasta MAXIMO_IMPRESION_WEB se arma en un
+    archivo temporal que se envía por partes; si son más se encola para
+    run_report_worker y se responde con la página que espera la descarga.
+    """
+    if not (can_manage_caja(request.user) or can_cobrar(request.user)):
+        return HttpResponse('Acceso no autorizado', status=403)
+    try:
+        seleccion = {
+            'desde': parse_date(request.GET.get('desde') or ''),
+            'hasta': parse_date(request.GET.get('hasta') or ''),
+            'sector': int(request.GET.get('sector') or 0),
+            'ids': [
+                int(valor) for valor in request.GET.get('ids', '').split(',')
+                if valor.strip()
+            ],
+        }
+        pagos = pagos_a_imprimir(**seleccion)
+    except ValueError as exc:
+        return HttpResponse(str(exc), status=400)
+    total = pagos.count()
+    if not total:
+        return HttpResponse('No hay comprobantes en la selección', status=404)
+    if total > MAXIMO_IMPRESION_WEB:
+        trabajo = encolar_impresion(
+            formato=request.GET.get('formato'), usuario=request.user,
+            **seleccion
+        )
+        return render(
+            request,
+            'billing_app/pagos/impresion_en_cola.html',
+            {'trabajo': trabajo, 'total': total},
+            status=202
+        )
+
+    salida = tempfile.TemporaryFile()
+    try:
+        # Sin pool de procesos dentro del worker de gunicorn
+        imprimir_comprobantes(
+            pagos, salida, request.GET.get('formato'), procesos=1
+        )
+    except ErrorPDF:
+        salida.close()
+        logger.exception("Error al imprimir %s comprobantes", total)
+        return HttpResponse('Error al generar PDF', status=500)
+    salida.seek(0)
+    return FileResponse(
+        salida, content_type='application/pdf', filename='comprobantes.pdf'
+    )
@@ -0,0 +1,298 @@
+"""
+Reportes descargables de la sección Reportes.
+
+Cada función hojas_* devuelve (nombre de archivo, hojas), donde cada hoja es
+{'title', 'headers', 'rows'} y 'rows' es un generador que recorre el
+queryset con iterator(); exportacion.py las convierte a XLSX, CSV o NDJSON.
+Las usan tanto las vistas como el worker de reportes en segundo plano.
+"""
+from typing import Any, cast
+from .cuentas import estados_cuenta
+from .models import Cliente, ClientePlan, Egreso, OrdenTecnica, Pago
+
+CHUNK_SIZE = 2000
+
+
+def hojas_ingresos_egresos():
+    pagos = (
+        Pago.objects.select_related('cliente')
+        .prefetch_related(
+            'items__plan_asociado__plan__servicio',
+            'items__ot_asociada__concepto'
+        )
+        .order_by('-fecha')
+    )
+    egresos = (
+        Egreso.objects.select_related('concepto')
+        .order_by('-fecha')
+    )
+
+    def ingresos_rows():
+        for pago in pagos.iterator(chunk_size=CHUNK_SIZE):
+            items = list(cast(Any, pago).items.all())
+            if not items:
+                yield [
+                    pago.fecha, str(pago.cliente), pago.cliente.dni,
+                    pago.tipo_comprobante, pago.serie_numero,
+                    pago.monto, pago.detalles, '', '', '', '', ''
+                ]
+                continue
+            for item in items:
+                plan = (
+                    item.plan_asociado.plan if item.plan_asociado else None
+                )
+                servicio = plan.servicio if plan and plan.servicio else None
+                ot = item.ot_asociada
+                plan_label = ''
+                if plan:
+                    plan_label = plan.nombre
+                    if servicio:
+                        plan_label = f"{servicio.nombre} - {plan.nombre}"
+                yield [
+                    pago.fecha, str(pago.cliente), pago.cliente.dni,
+                    pago.tipo_comprobante, pago.serie_numero,
+                    pago.monto, pago.detalles,
+                    item.descripcion, item.monto_parcial,
+                    item.periodo_mes,
+                    plan_label,
+                    f"OT-{ot.id} {ot.concepto.nombre}" if ot else ''
+                ]
+
+    egresos_rows = (
+        [
+            egreso.fecha,
+            egreso.concepto.nombre,
+            egreso.monto,
+            egreso.tipo_comprobante,
+            egreso.numero_comprobante,
+            egreso.responsable,
+            egreso.observaciones,
+            egreso.created_at
+        ]
+        for egreso in egresos.iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    return (
+        'reporte_ingresos_egresos.xlsx',
+        [
+            {
+                'title': 'Ingresos',
+                'headers': [
+                    'Fecha', 'Cliente', 'DNI', 'Tipo comprobante',
+                    'Serie/Numero', 'Monto pago', 'Detalle pago',
+                    'Detalle item', 'Monto item', 'Periodo mes',
+                    'Plan', 'OT'
+                ],
+                'rows': ingresos_rows()
+            },
+            {
+                'title': 'Egresos',
+                'headers': [
+                    'Fecha', 'Concepto', 'Monto', 'Tipo comprobante',
+                    'Numero comprobante', 'Responsable',
+                    'Observaciones', 'Creado'
+                ],
+                'rows': egresos_rows
+            }
+        ]
+    )
+
+
+def hojas_clientes():
+    clientes = (
+        Cliente.objects.select_related(
+            'via__sector__distrito', 'mikrotik_vinculado'
+        )
+        .order_by('apellidos', 'nombres')
+    )
+
+    def rows():
+        for cliente in clientes.iterator(chunk_size=CHUNK_SIZE):
+            via = cliente.via
+            sector = via.sector if via else None
+            distrito = sector.distrito if sector else None
+            via_disp = ''
+            if via:
+                via_disp = (
+                    f"{cast(Any, via).get_tipo_display()} {via.nombre}"
+                )
+            yield [
+                cliente.apellidos,
+                cliente.nombres,
+                cliente.dni,
+                cliente.celular,
+                distrito.nombre if distrito else '',
+                sector.nombre if sector else '',
+                via_disp,
+                cliente.referencia or '',
+                cliente.estado_activo,
+                cliente.tipo_conexion,
+                cliente.usuario_pppoe or '',
+                cliente.ip_asignada or '',
+                (
+                    cliente.mikrotik_vinculado.nombre
+                    if cliente.mikrotik_vinculado else ''
+                ),
+                cliente.fecha_registro
+            ]
+
+    return (
+        'reporte_clientes.xlsx',
+        [
+            {
+                'title': 'Clientes',
+                'headers': [
+                    'Apellidos', 'Nombres', 'DNI', 'Celular',
+                    'Distrito', 'Sector', 'Via', 'Referencia',
+                    'Activo', 'Tipo conexion', 'Usuario PPPoE',
+                    'IP asignada', 'Mikrotik', 'Fecha registro'
+                ],
+                'rows': rows()
+            }
+        ]
+    )
+
+
+def hojas_ots():
+    ots = (
+        OrdenTecnica.objects.select_related(
+            'cliente', 'concepto', 'tecnico_asignado',
+            'servicio_afectado', 'plan_asociado__plan__servicio'
+        )
+        .order_by('-fecha_creacion')
+    )
+
+    def rows():
+        for ot in ots.iterator(chunk_size=CHUNK_SIZE):
+            plan = ot.plan_asociado.plan if ot.plan_asociado else None
+            servicio = plan.servicio if plan and plan.servicio else None
+            ot_id = cast(Any, ot).id
+            concepto = cast(Any, ot.concepto)
+            yield [
+                ot_id,
+                str(ot.cliente),
+                ot.cliente.dni,
+                concepto.nombre,
+                concepto.get_categoria_display(),
+                (
+                    servicio.nombre if servicio
+                    else (
+                        ot.servicio_afectado.nombre
+                        if ot.servicio_afectado else ''
+                    )
+                ),
+                plan.nombre if plan else '',
+                ot.monto,
+                ot.observaciones or '',
+                ot.completada,
+                ot.pagada,
+                ot.exonerada,
+                ot.fecha_creacion,
+                ot.fecha_finalizacion,
+                ot.tecnico_asignado.nombre if ot.tecnico_asignado else ''
+            ]
+
+    return (
+        'reporte_ots.xlsx',
+        [
+            {
+                'title': 'Ordenes Tecnicas',
+                'headers': [
+                    'OT', 'Cliente', 'DNI', 'Concepto', 'Categoria',
+                    'Servicio', 'Plan', 'Monto', 'Observaciones',
+                    'Completada', 'Pagada', 'Exonerada',
+                    'Fecha creacion', 'Fecha finalizacion', 'Tecnico'
+                ],
+                'rows': rows()
+            }
+        ]
+    )
+
+
+def hojas_clientes_planes():
+    planes = (
+        ClientePlan.objects.select_related(
+            'cliente__mikrotik_vinculado', 'plan__servicio'
+        )
+        .order_by('cliente__apellidos', 'cliente__nombres')
+    )
+
+    def rows():
+        for cliente_plan in planes.iterator(chunk_size=CHUNK_SIZE):
+            plan = cliente_plan.plan
+            servicio = plan.servicio if plan and plan.servicio else None
+            cliente = cliente_plan.cliente
+            yield [
+                str(cliente),
+                cliente.dni,
+                plan.nombre if plan else '',
+                servicio.nombre if servicio else '',
+                plan.precio if plan else '',
+                cliente_plan.fecha_inicio,
+                cliente_plan.fecha_cobranza,
+                cliente.estado_activo,
+                cliente.tipo_conexion,
+                cliente.usuario_pppoe or '',
+                cliente.ip_asignada or '',
+                (
+                    cliente.mikrotik_vinculado.nombre
+                    if cliente.mikrotik_vinculado else ''
+                )
+            ]
+
+    return (
+        'reporte_clientes_con_planes.xlsx',
+        [
+            {
+                'title': 'Clientes con planes',
+                'headers': [
+                    'Cliente', 'DNI', 'Plan', 'Servicio', 'Precio',
+                    'Fecha inicio', 'Dia cobranza', 'Activo',
+                    'Tipo conexion', 'Usuario PPPoE', 'IP asignada',
+                    'Mikrotik'
+                ],
+                'rows': rows()
+            }
+        ]
+    )
+
+
+def hojas_deuda():
+    estados = (
+        estados_cuenta()
+        .filter(saldo_total__gt=0)
+        .select_related('cliente')
+        .order_by('cliente__apellidos', 'cliente__nombres')
+    )
+    rows = (
+        [
+            str(estado.cliente),
+            estado.cliente.dni,
+            estado.cliente.celular,
+            estado.cliente.estado_activo,
+            estado.saldo_total
+        ]
+        for estado in estados.iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    return (
+        'reporte_deuda_pendiente.xlsx',
+        [
+            {
+                'title': 'Deuda pendiente',
+                'headers': [
+                    'Cliente', 'DNI', 'Celular', 'Activo', 'Deuda total'
+                ],
+                'rows': rows
+            }
+        ]
+    )
+
+
+REPORTES = {
+    'ingresos-egresos': ('Ingresos y egresos', hojas_ingresos_egresos),
+    'clientes': ('Clientes', hojas_clientes),
+    'ots': ('Ordenes tecnicas', hojas_ots),
+    'clientes-planes': ('Clientes con planes', hojas_clientes_planes),
+    'deuda': ('Deuda pendiente', hojas_deuda),
+}
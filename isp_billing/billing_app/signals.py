@@ -0,0 +1,151 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .busqueda import (
+    borrar_tokens, indexar_clientes, indexar_pagos, invalidar_autocompletar
+)
+from .cache_dashboard import invalidar_dashboard
+from .cache_deuda import invalidar_deuda_catalogo, invalidar_deuda_cliente
+from .cierres import reabrir_cliente
+from .comprobantes import invalidar_empresa
+from .cuentas import invalidar_cuenta_cliente, invalidar_cuentas
+from .models import (
+    CierreSaldo, Cliente, ClientePlan, CompanySettings, ComprobantePDF,
+    DeudaExcluida, Egreso, OrdenTecnica, OrdenTecnicaConcepto, Pago,
+    PagoDetalle, Plan, TokenBusqueda
+)
+
+GRUPOS_DASHBOARD = {
+    Pago: 'pagos',
+    Egreso: 'egresos',
+    Cliente: 'clientes',
+    ClientePlan: 'planes',
+    OrdenTecnica: 'ordenes',
+}
+
+
+@receiver(post_save, sender=Pago)
+@receiver(post_delete, sender=Pago)
+@receiver(post_save, sender=ClientePlan)
+@receiver(post_delete, sender=ClientePlan)
+@receiver(post_save, sender=OrdenTecnica)
+@receiver(post_delete, sender=OrdenTecnica)
+@receiver(post_save, sender=DeudaExcluida)
+@receiver(post_delete, sender=DeudaExcluida)
+def invalidar_deuda_por_cliente(sender, instance, **kwargs):
+    invalidar_deuda_cliente(instance.cliente_id)
+    invalidar_cuenta_cliente(instance.cliente_id)
+
+
+@receiver(post_save, sender=PagoDetalle)
+@receiver(post_delete, sender=PagoDetalle)
+def invalidar_deuda_por_detalle(sender, instance, **kwargs):
+    # En un borrado en cascada el Pago ya puede no existir
+    cliente_id = (
+        Pago.objects.filter(pk=instance.pago_id)
+        .values_list('cliente_id', flat=True)
+        .first()
+    )
+    invalidar_deuda_cliente(cliente_id)
+    invalidar_cuenta_cliente(cliente_id)
+
+
+@receiver(post_save, sender=Pago)
+@receiver(post_delete, sender=Pago)
+@receiver(post_save, sender=Egreso)
+@receiver(post_delete, sender=Egreso)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_save, sender=ClientePlan)
+@receiver(post_delete, sender=ClientePlan)
+@receiver(post_save, sender=OrdenTecnica)
+@receiver(post_delete, sender=OrdenTecnica)
+def invalidar_dashboard_por_modelo(sender, instance, **kwargs):
+    invalidar_dashboard(GRUPOS_DASHBOARD[sender])
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+@receiver(post_save, sender=OrdenTecnicaConcepto)
+@receiver(post_delete, sender=OrdenTecnicaConcepto)
+def invalidar_deuda_por_catalogo(sender, instance, **kwargs):
+    invalidar_deuda_catalogo()
+
+
+@receiver(post_save, sender=Plan)
+def invalidar_cuentas_por_precio(sender, instance, created, **kwargs):
+    # Al borrar un Plan sus ClientePlan caen en cascada y cada uno invalida
+    # a su cliente
+    if not created:
+        invalidar_cuentas(Cliente.objects.filter(planes__plan=instance))
+
+
+@receiver(post_save, sender=ClientePlan)
+def reabrir_cierres_por_plan(sender, instance, update_fields=None, **kwargs):
+    # Cambiar sólo el estado activo no altera los cargos
+    if update_fields and set(update_fields) <= {'activo'}:
+        return
+    desde = instance.fecha_inicio
+    congelado = (
+        CierreSaldo.objects.filter(plan_asociado_id=instance.pk)
+        .order_by('cierre__fecha_corte')
+        .values_list('cierre__fecha_corte', flat=True)
+        .first()
+    )
+    if congelado and (desde is None or congelado < desde):
+        desde = congelado
+    reabrir_cliente(instance.cliente_id, desde)
+
+
+@receiver(post_delete, sender=PagoDetalle)
+def reabrir_cierres_por_detalle(sender, instance, **kwargs):
+    pago = (
+        Pago.objects.filter(pk=instance.pago_id)
+        .values('cliente_id', 'fecha')
+        .first()
+    )
+    if pago:
+        reabrir_cliente(pago['cliente_id'], pago['fecha'])
+
+
+@receiver(post_delete, sender=Pago)
+@receiver(post_delete, sender=DeudaExcluida)
+def reabrir_cierres_por_borrado(sender, instance, **kwargs):
+    reabrir_cliente(instance.cliente_id, instance.fecha)
+
+
+@receiver(post_save, sender=Cliente)
+def indexar_busqueda_cliente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_clientes([instance])
+    invalidar_autocompletar()
+
+
+@receiver(post_save, sender=Pago)
+def indexar_busqueda_pago(sender, instance, raw=False, **kwargs):
+    if not raw:
+        indexar_pagos([instance])
+
+
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Pago)
+def borrar_busqueda(sender, instance, **kwargs):
+    tipo = (
+        TokenBusqueda.TIPO_CLIENTE if sender is Cliente
+        else TokenBusqueda.TIPO_PAGO
+    )
+    borrar_tokens(tipo, instance.pk)
+    if sender is Cliente:
+        invalidar_autocompletar()
+
+
+@receiver(post_save, sender=CompanySettings)
+def invalidar_empresa_comprobantes(sender, instance, **kwargs):
+    # Los PDF guardados se regeneran solos: su huella incluye
+    # fecha_actualizacion
+    invalidar_empresa()
+
+
+@receiver(post_delete, sender=ComprobantePDF)
+def borrar_archivo_comprobante(sender, instance, **kwargs):
+    if instance.archivo:
+        instance.archivo.delete(save=False)
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import csv
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from openpyxl import load_workbook
+from pypdf import PdfReader
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import JsonResponse
+from django.db import OperationalError, connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from .antiguedad import calcular_antiguedad
+from .cache_dashboard import (
+    estadisticas_dashboard_cacheadas, ultimos_registros_cacheados
+)
+from .cola_reportes import (
+    encolar_reporte, limpiar_reportes, procesar_trabajo, tomar_trabajo
+)
+from .cache_deuda import (
+    clave_deuda, estadisticas_cache_deuda, obtener_deuda_cacheada
+)
+from .cierres import cerrar_mes
+from .cuentas import (
+    estado_vigente, estados_cuenta, obtener_deuda_cliente,
+    obtener_deudas_clientes, sincronizar_cuenta_cliente, sincronizar_cuentas,
+    verificar_cuentas
+)
+from .correlativos import (
+    auditar, olvidar_bloques, recuperar_bloques, reservar_bloque,
+    tomar_correlativo
+)
+from .estadisticas import estadisticas_dashboard
+from .exportacion import ANCHO_MAXIMO, CONTENT_TYPE_XLSX
+from .historial import linea_de_tiempo
+from .management.commands import precalcular_deuda
+from .models import (
+    BloqueCorrelativo, CierreMensual, Cliente, ClientePlan, CompanySettings,
+    ComprobantePDF, CuentaPorCobrar, DeudaExcluida, Distrito, Egreso,
+    EgresoConcepto, EstadoCuenta, EventoCliente, EventoClienteArchivo,
+    MovimientoHistorial, OrdenTecnica, OrdenTecnicaConcepto, Pago, PagoDetalle,
+    Plan, Sector, SerieCorrelativo, SerieCorrelativoLibre, Servicio,
+    TokenBusqueda, TrabajoReporte, Via
+)
+from .payments_views import MAX_CLIENTES_LOTE
+from .utils import (
+    calcular_deuda_clientes, calcular_meses_deuda, registrar_movimiento
+)
 
-# Create your tests here.
+
+class DatosBaseMixin:
+    """Cartera mínima: una vía, un plan de S/ 50 y `n` clientes con el plan
+    contratado."""
+
+    @classmethod
+    def crear_cartera(cls, n=3):
+        distrito = Distrito.objects.create(nombre='Centro')
+        sector = Sector.objects.create(distrito=distrito, nombre='Sector 1')
+        cls.via = Via.objects.create(sector=sector, nombre='Lima')
+        servicio = Servicio.objects.create(nombre='Internet')
+        cls.plan = Plan.objects.create(
+            servicio=servicio, nombre='Plan 50', precio=Decimal('50')
+        )
+        cls.clientes = []
+        for i in range(n):
+            cliente = Cliente.objects.create(
+                apellidos='Pérez', nombres=f'Cliente {i}',
+                dni=f'{40000000 + i}', celular='999999999', via=cls.via,
+                estado_activo=i % 2 == 0
+            )
+            ClientePlan.objects.create(
+                cliente=cliente, plan=cls.plan,
+                fecha_inicio=date(2024, 1, 1), fecha_cobranza=5
+            )
+            cls.clientes.append(cliente)
+
+    def fijar_hoy(self, dia):
+        """timezone.now() devuelve el mediodía de `dia` hasta el final del
+        test (también para los auto_now_add)."""
+        ahora = timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+        reloj = mock.patch(
+            'django.utils.timezone.now',
+            return_value=ahora + timedelta(hours=12)
+        )
+        reloj.start()
+        self.addCleanup(reloj.stop)
+
+    def pagar(self, cliente, *items):
+        """Pago con un PagoDetalle por item: (ClientePlan, mes, monto) u
+        (OrdenTecnica, monto)."""
+        detalles = []
+        for item in items:
+            if isinstance(item[0], OrdenTecnica):
+                ot, monto = item
+                detalles.append(PagoDetalle(
+                    ot_asociada=ot, monto_parcial=Decimal(monto),
+                    descripcion='OT'
+                ))
+            else:
+                cliente_plan, mes, monto = item
+                detalles.append(PagoDetalle(
+                    plan_asociado=cliente_plan, periodo_mes=mes,
+                    monto_parcial=Decimal(monto), descripcion='Mes'
+                ))
+        pago = Pago.objects.create(
+            cliente=cliente,
+            monto=sum(detalle.monto_parcial for detalle in detalles),
+            tipo_comprobante='RECIBO'
+        )
+        for detalle in detalles:
+            detalle.pago = pago
+        PagoDetalle.objects.bulk_create(detalles)
+        return pago
+
+
+def _filas(periodos):
+    return [
+        (item['tipo'], item['id'], item['mes'], item['monto_original'],
+         item['pagado'], item['saldo'])
+        for item in periodos
+    ]
+
+
+class EstadisticasTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera()
+        concepto = OrdenTecnicaConcepto.objects.create(
+            categoria='INSTALACION', nombre='Instalación'
+        )
+        OrdenTecnica.objects.create(
+            cliente=cls.clientes[0], concepto=concepto, monto=Decimal('30'),
+            completada=True
+        )
+        OrdenTecnica.objects.create(
+            cliente=cls.clientes[1], concepto=concepto, monto=Decimal('0')
+        )
+        Pago.objects.create(cliente=cls.clientes[0], monto=Decimal('50'))
+        Pago.objects.create(cliente=cls.clientes[1], monto=Decimal('25.50'))
+        Egreso.objects.create(
+            fecha=timezone.localdate(), monto=Decimal('10'), responsable='Caja',
+            concepto=EgresoConcepto.objects.create(nombre='Movilidad')
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_contadores(self):
+        with self.assertNumQueries(5):
+            stats = estadisticas_dashboard()
+        self.assertEqual(stats.clientes.total, 3)
+        self.assertEqual(stats.clientes.activos, 2)
+        self.assertEqual(stats.planes.total, 3)
+        self.assertEqual(stats.planes.activos, 0)
+        self.assertEqual(stats.ordenes.pendientes, 1)
+        self.assertEqual(stats.ordenes.completadas, 1)
+        self.assertEqual(stats.ordenes.instalaciones, 2)
+        self.assertEqual(stats.pagos.hoy, Decimal('75.50'))
+        self.assertEqual(stats.pagos.total, Decimal('75.50'))
+        self.assertEqual(stats.balance_mes, Decimal('65.50'))
+
+    def test_consultas_dashboard(self):
+        self.client.get(reverse('dashboard'))
+        cache.clear()
+        # sesión + usuario, 5 contadores, empresa y 3 listados
+        with self.assertNumQueries(11):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        # Con el caché caliente sólo quedan sesión, usuario y empresa
+        with self.assertNumQueries(3):
+            self.client.get(reverse('dashboard'))
+
+    def test_consultas_reportes(self):
+        self.client.get(reverse('reportes-index'))
+        # sesión + usuario, 7 contadores, 6 de deuda y buenos pagadores,
+        # empresa y 2 de zonas
+        with self.assertNumQueries(18):
+            response = self.client.get(reverse('reportes-index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['instalaciones'], 2)
+        self.assertEqual(response.context['total_servicios'], 1)
+
+
+class CacheDashboardTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crear_cartera(n=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pago_solo_recalcula_pagos(self):
+        estadisticas_dashboard_cacheadas()
+        ultimos_registros_cacheados()
+        with self.captureOnCommitCallbacks(execute=True):
+            Pago.objects.create(cliente=self.clientes[0], monto=Decimal('20'))
+        # resumen de pagos y últimos pagos
+        with self.assertNumQueries(2):
+            stats = estadisticas_dashboard_cacheadas()
+            ultimos = ultimos_registros_cacheados()
+        self.assertEqual(stats.pagos.hoy, Decimal('20'))
+        self.assertEqual(len(ultimos['ultimos_pagos']), 1)
+        with self.assertNumQueries(0):
+            estadisticas_dashboard_cacheadas()
+            ultimos_registros_cacheados()
+
+
+class PaginacionTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=30)
+        for i, cliente in enumerate(cls.clientes):
+            Pago.objects.create(cliente=cliente, monto=Decimal(i + 1))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _ids(self, response):
+        return [pago.pk for pago in response.context['pagos']]
+
+    def test_recorrido_keyset(self):
+        url = reverse('pagos-lista')
+        esperado = list(
+            Pago.objects.order_by('-fecha', '-id').values_list('pk', flat=True)
+        )
+        primera = self.client.get(url, {'por_pagina': 25})
+        pagina = primera.context['pagina']
+        self.assertEqual(self._ids(primera), esperado[:25])
+        self.assertEqual(pagina.total_texto, '30')
+        self.assertIsNone(pagina.url_anterior)
+
+        segunda = self.client.get(url + pagina.url_siguiente)
+        self.assertEqual(self._ids(segunda), esperado[25:])
+        self.assertIsNone(segunda.context['pagina'].url_siguiente)
+
+        volver = self.client.get(url + segunda.context['pagina'].url_anterior)
+        self.assertEqual(self._ids(volver), esperado[:25])
+
+    def test_cursor_invalido_muestra_primera_pagina(self):
+        response = self.client.get(
+            reverse('pagos-lista'), {'despues': 'xx', 'por_pagina': 7}
+        )
+        pagina = response.context['pagina']
+        self.assertEqual(pagina.por_pagina, 50)
+        self.assertEqual(len(pagina), 30)
+        self.assertIsNone(pagina.url_anterior)
+
+    def test_clientes_con_conteos(self):
+        response = self.client.get(
+            reverse('index'), {'q': 'Cliente 1', 'por_pagina': 25}
+        )
+        clientes = list(response.context['clientes'])
+        self.assertEqual(len(clientes), 11)
+        self.assertTrue(all(c.num_planes == 1 for c in clientes))
+        self.assertTrue(all(c.num_ordenes == 0 for c in clientes))
+
+
+class BusquedaTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=2)
+        cls.nunez = Cliente.objects.create(
+            apellidos='Núñez García', nombres='José', dni='41111111',
+            celular='999999999', via=cls.via
+        )
+        cls.pago = Pago.objects.create(
+            cliente=cls.nunez, monto=Decimal('50'), tipo_comprobante='RECIBO',
+            serie_numero='R001-00000007'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_sin_tildes_y_por_prefijo(self):
+        response = self.client.get(reverse('index'), {'q': 'nunez jos'})
+        self.assertEqual(list(response.context['clientes']), [self.nunez])
+        response = self.client.get(reverse('pagos-lista'), {'q': 'NÚÑEZ'})
+        self.assertEqual(list(response.context['pagos']), [self.pago])
+        response = self.client.get(reverse('pagos-lista'), {'q': '00000007'})
+        self.assertEqual(list(response.context['pagos']), [self.pago])
+
+    def test_cambio_de_nombre_reindexa_pagos(self):
+        self.nunez.apellidos = 'Quispe'
+        self.nunez.save()
+        response = self.client.get(reverse('pagos-lista'), {'q': 'quispe'})
+        self.assertEqual(list(response.context['pagos']), [self.pago])
+        response = self.client.get(reverse('pagos-lista'), {'q': 'nunez'})
+        self.assertEqual(list(response.context['pagos']), [])
+
+    def test_migracion_rellena_filas_existentes(self):
+        migracion = import_module(
+            'billing_app.migrations.0031_rellenar_busqueda'
+        )
+        # Como quedan las filas al aplicar 0024 sobre una base con datos
+        Cliente.objects.update(busqueda='')
+        Pago.objects.update(busqueda='')
+        TokenBusqueda.objects.all().delete()
+        # Sólo usa la conexión del schema_editor
+        migracion.rellenar_busqueda(
+            django_apps, mock.Mock(connection=connection)
+        )
+        self.test_sin_tildes_y_por_prefijo()
+
+    def test_relevancia(self):
+        Cliente.objects.create(
+            apellidos='Ramos', nombres='Pérez', dni='42222222',
+            celular='999999999', via=self.via
+        )
+        response = self.client.get(reverse('index'), {'q': 'perez'})
+        clientes = list(response.context['clientes'])
+        self.assertEqual(len(clientes), 3)
+        # Los que empiezan por "perez" antes que el que sólo lo contiene
+        self.assertEqual(clientes[-1].apellidos, 'Ramos')
+
+    def test_autocompletar(self):
+        url = reverse('ajax_autocompletar_clientes')
+        response = self.client.get(url, {'q': '4111'})
+        self.assertEqual(response.json(), [{
+            'id': self.nunez.pk, 'dni': '41111111',
+            'nombre': 'Núñez García, José', 'activo': True,
+        }])
+        self.assertEqual(
+            [c['id'] for c in self.client.get(url, {'q': 'nunez'}).json()],
+            [self.nunez.pk]
+        )
+        # El prefijo corto queda en caché hasta que cambie un cliente
+        with self.assertNumQueries(2):
+            self.client.get(url, {'q': 'nunez'})
+        self.nunez.apellidos = 'Quispe'
+        self.nunez.save()
+        self.assertEqual(self.client.get(url, {'q': 'nunez'}).json(), [])
+
+
+class HistorialTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=1)
+        cls.cliente = cls.clientes[0]
+        concepto = OrdenTecnicaConcepto.objects.create(
+            categoria='CORTES', nombre='Corte por deuda'
+        )
+        for i in range(7):
+            Pago.objects.create(cliente=cls.cliente, monto=Decimal(i + 1))
+            OrdenTecnica.objects.create(
+                cliente=cls.cliente, concepto=concepto, monto=Decimal('0')
+            )
+        MovimientoHistorial.objects.create(
+            cliente=cls.cliente, tipo='Estado actualizado',
+            detalle='Cliente desactivado'
+        )
+        call_command('rellenar_eventos', stdout=StringIO())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_rellenar_es_idempotente(self):
+        self.assertEqual(EventoCliente.objects.count(), 16)
+        call_command('rellenar_eventos', stdout=StringIO())
+        self.assertEqual(EventoCliente.objects.count(), 16)
+
+    def test_migracion_rellena_el_historial(self):
+        migracion = import_module(
+            'billing_app.migrations.0033_rellenar_eventos'
+        )
+        EventoCliente.objects.all().delete()
+        migracion.rellenar_eventos(django_apps, None)
+        self.assertEqual(EventoCliente.objects.count(), 16)
+        migracion.rellenar_eventos(django_apps, None)
+        self.assertEqual(EventoCliente.objects.count(), 16)
+
+    def test_borrado_deja_evento(self):
+        ot = OrdenTecnica.objects.filter(cliente=self.cliente).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('ot-eliminar', args=[ot.pk]))
+        self.assertFalse(OrdenTecnica.objects.filter(pk=ot.pk).exists())
+        evento = EventoCliente.objects.get(referencia=f'ot:{ot.pk}:borrado')
+        self.assertEqual(evento.tipo, 'ot')
+        self.assertEqual(evento.datos['titulo'], 'OT eliminada')
+        # Los eventos anteriores de la OT se conservan
+        self.assertTrue(
+            EventoCliente.objects.filter(referencia=f'ot:{ot.pk}').exists()
+        )
+
+    def test_paginas_sin_huecos_ni_repetidos(self):
+        completo, siguiente = linea_de_tiempo(self.cliente, limite=100)
+        self.assertIsNone(siguiente)
+        self.assertEqual(len(completo), 16)
+        self.assertEqual(completo[-1]['tipo'], 'plan')
+        self.assertIn('Corte', {e['titulo'] for e in completo})
+
+        vistos = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                eventos, cursor = linea_de_tiempo(
+                    self.cliente, cursor=cursor, limite=4
+                )
+            vistos += eventos
+            if cursor is None:
+                break
+        self.assertEqual(
+            [e['clave'] for e in vistos], [e['clave'] for e in completo]
+        )
+
+    def test_movimiento_con_objeto(self):
+        pago = Pago.objects.create(cliente=self.cliente, monto=Decimal('9'))
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_movimiento(
+                self.cliente, 'Pago registrado', 'S/ 9', objeto=pago
+            )
+        eventos, _ = linea_de_tiempo(self.cliente, limite=2)
+        self.assertEqual(
+            {e['tipo'] for e in eventos}, {'movimiento', 'pago'}
+        )
+
+    def test_movimientos_en_lote_al_confirmar(self):
+        antes = EventoCliente.objects.count()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(0):
+                for i in range(3):
+                    registrar_movimiento(self.cliente, 'Nota', f'Nota {i}')
+            try:
+                with transaction.atomic():
+                    registrar_movimiento(self.cliente, 'Nota', 'revertida')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(len(callbacks), 1)
+        with self.assertNumQueries(1):
+            callbacks[0]()
+        self.assertEqual(EventoCliente.objects.count(), antes + 3)
+        self.assertFalse(
+            EventoCliente.objects.filter(datos__detalle='revertida').exists()
+        )
+
+    def test_cargar_anteriores(self):
+        response = self.client.get(
+            reverse('cliente-detalle', args=[self.cliente.pk])
+        )
+        self.assertIsNone(response.context['historial_siguiente'])
+        _, cursor = linea_de_tiempo(self.cliente, limite=10)
+        data = self.client.get(
+            reverse('cliente-historial', args=[self.cliente.pk]),
+            {'antes': cursor}
+        ).json()
+        self.assertEqual(len(data['eventos']), 6)
+        self.assertIsNone(data['siguiente'])
+        self.assertEqual(data['eventos'][-1]['tipo'], 'plan')
+        response = self.client.get(
+            reverse('cliente-historial', args=[self.cliente.pk]),
+            {'antes': 'xx'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_archivar(self):
+        EventoCliente.objects.filter(tipo='plan').update(
+            ocurrido=timezone.now() - timedelta(days=366 * 3)
+        )
+        call_command('archivar_eventos', anios=2, stdout=StringIO())
+        self.assertEqual(EventoCliente.objects.count(), 15)
+        self.assertEqual(
+            EventoClienteArchivo.objects.get().tipo, 'plan'
+        )
+
+
+class DeudaTests(DatosBaseMixin, TestCase):
+    """Filas de calcular_deuda_clientes al 15/04/2024."""
+
+    def setUp(self):
+        self.fijar_hoy(date(2024, 4, 15))
+        self.crear_cartera(n=0)
+        self.plan_30 = Plan.objects.create(
+            servicio=self.plan.servicio, nombre='Plan 30',
+            precio=Decimal('30')
+        )
+        concepto = OrdenTecnicaConcepto.objects.create(
+            categoria='AVERIAS', nombre='Avería'
+        )
+        self.ana = Cliente.objects.create(
+            apellidos='Ramos', nombres='Ana', dni='41000001',
+            celular='999999999', via=self.via
+        )
+        # 20 de 29 días de febrero
+        self.cp_ana = ClientePlan.objects.create(
+            cliente=self.ana, plan=self.plan,
+            fecha_inicio=date(2024, 2, 10), fecha_cobranza=10
+        )
+        self.ot = OrdenTecnica.objects.create(
+            cliente=self.ana, concepto=concepto, monto=Decimal('80')
+        )
+        OrdenTecnica.objects.create(
+            cliente=self.ana, concepto=concepto, monto=Decimal('40'),
+            exonerada=True
+        )
+        ot_excluida = OrdenTecnica.objects.create(
+            cliente=self.ana, concepto=concepto, monto=Decimal('25')
+        )
+        DeudaExcluida.objects.create(
+            cliente=self.ana, plan_asociado=self.cp_ana,
+            periodo_mes=date(2024, 3, 1)
+        )
+        DeudaExcluida.objects.create(cliente=self.ana, ot_asociada=ot_excluida)
+        self.pagar(
+            self.ana,
+            (self.cp_ana, date(2024, 2, 1), '40'),
+            (self.cp_ana, date(2024, 4, 1), '20'),
+            (self.ot, '30')
+        )
+
+        self.beto = Cliente.objects.create(
+            apellidos='Soto', nombres='Beto', dni='41000002',
+            celular='999999999', via=self.via
+        )
+        self.cp_beto = ClientePlan.objects.create(
+            cliente=self.beto, plan=self.plan,
+            fecha_inicio=date(2024, 3, 1), fecha_cobranza=5
+        )
+        self.cp_beto_30 = ClientePlan.objects.create(
+            cliente=self.beto, plan=self.plan_30,
+            fecha_inicio=date(2024, 4, 1), fecha_cobranza=5
+        )
+        self.pagar(self.beto, (self.cp_beto, date(2024, 3, 1), '50'))
+
+    def test_filas_por_periodo(self):
+        deudas = calcular_deuda_clientes(
+            Cliente.objects.filter(pk__in=[self.ana.pk, self.beto.pk])
+        )
+        # Febrero prorrateado (34.48) quedó sobrepagado, marzo excluido,
+        # abril pagado en parte; la OT exonerada y la excluida no figuran
+        self.assertEqual(_filas(deudas[self.ana.pk]), [
+            ('plan', self.cp_ana.pk, date(2024, 4, 1), Decimal('50'),
+             Decimal('20'), Decimal('30')),
+            ('OT', self.ot.pk, None, Decimal('80'), Decimal('30'),
+             Decimal('50')),
+        ])
+        self.assertEqual(_filas(deudas[self.beto.pk]), [
+            ('plan', self.cp_beto.pk, date(2024, 4, 1), Decimal('50'),
+             Decimal('0'), Decimal('50')),
+            ('plan', self.cp_beto_30.pk, date(2024, 4, 1), Decimal('30'),
+             Decimal('0'), Decimal('30')),
+        ])
+
+    def test_primer_mes_prorrateado(self):
+        PagoDetalle.objects.filter(periodo_mes=date(2024, 2, 1)).update(
+            monto_parcial=Decimal('10')
+        )
+        fila = calcular_meses_deuda(self.ana)[0]
+        self.assertEqual(
+            _filas([fila])[0],
+            ('plan', self.cp_ana.pk, date(2024, 2, 1), Decimal('34.48'),
+             Decimal('10'), Decimal('24.48'))
+        )
+
+    def test_un_cliente_igual_que_en_bloque(self):
+        deudas = calcular_deuda_clientes()
+        for cliente in (self.ana, self.beto):
+            self.assertEqual(calcular_meses_deuda(cliente), deudas[cliente.pk])
+
+    def test_antiguedad_suma_la_deuda(self):
+        # Febrero prorrateado queda con saldo y congelado en el cierre
+        PagoDetalle.objects.filter(periodo_mes=date(2024, 2, 1)).update(
+            monto_parcial=Decimal('10')
+        )
+        cerrar_mes(date(2024, 2, 1))
+        deudas = calcular_deuda_clientes()
+        for cliente in (self.ana, self.beto):
+            antiguedad = calcular_antiguedad(
+                clientes=Cliente.objects.filter(pk=cliente.pk)
+            )
+            deuda = sum(fila['saldo'] for fila in deudas[cliente.pk])
+            self.assertEqual(antiguedad['total'], deuda)
+            self.assertEqual(
+                sum(tramo['monto'] for tramo in antiguedad['resumen']), deuda
+            )
+        # Ana: febrero 24.48 y la OT 50 en 61-90 y 0-30; abril 30 en 0-30
+        self.assertEqual(
+            [tramo['monto'] for tramo in calcular_antiguedad(
+                clientes=Cliente.objects.filter(pk=self.ana.pk)
+            )['resumen']],
+            [Decimal('80.00'), Decimal('0.00'), Decimal('24.48'),
+             Decimal('0.00')]
+        )
+
+
+class CuentasTests(DatosBaseMixin, TestCase):
+    """Las cuentas materializadas siguen al cálculo tras cada escritura."""
+
+    def setUp(self):
+        self.fijar_hoy(date(2024, 4, 15))
+        self.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        self.client.force_login(self.user)
+        self.crear_cartera(n=2)
+        self.cliente = self.clientes[0]
+        self.cliente_plan = ClientePlan.objects.get(cliente=self.cliente)
+        SerieCorrelativo.objects.create(tipo='RECIBO', serie='R001')
+        OrdenTecnicaConcepto.objects.create(
+            categoria='CORTES', nombre='Corte', precio_sugerido=Decimal('20')
+        )
+        olvidar_bloques()
+        sincronizar_cuentas()
+
+    def assertCuentasAlDia(self):
+        self.assertEqual(verificar_cuentas(), [])
+        for cliente_id, periodos in obtener_deudas_clientes().items():
+            self.assertEqual(
+                EstadoCuenta.objects.get(cliente_id=cliente_id).saldo_total,
+                sum((item['saldo'] for item in periodos), Decimal('0'))
+            )
+
+    def _saldo(self):
+        clientes = Cliente.objects.filter(pk=self.cliente.pk)
+        return estados_cuenta(clientes).get().saldo_total
+
+    def test_rutas_de_escritura(self):
+        url_deuda = reverse('cliente-deuda-eliminar', args=[self.cliente.pk])
+        self.assertEqual(self._saldo(), Decimal('200'))
+
+        response = self.client.post(
+            reverse('api-pago-procesar'),
+            data={
+                'cliente_id': self.cliente.pk,
+                'items_pagados': [{
+                    'plan_id': self.cliente_plan.pk, 'tipo': 'PLAN',
+                    'mes_iso': '2024-01-01', 'monto_pagar': 50,
+                }],
+                'monto_total': 50,
+            },
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._saldo(), Decimal('150'))
+        self.assertCuentasAlDia()
+
+        self.client.post(url_deuda, {
+            'tipo': 'PLAN', 'plan_id': self.cliente_plan.pk,
+            'mes_iso': '2024-02-01',
+        })
+        self.assertEqual(self._saldo(), Decimal('100'))
+        self.assertCuentasAlDia()
+
+        self.client.post(
+            reverse('cliente-crear-ot', args=[self.cliente.pk]),
+            {'tipo_trabajo': 'CORTES',
+             'concepto': OrdenTecnicaConcepto.objects.get().pk}
+        )
+        ot = OrdenTecnica.objects.get(cliente=self.cliente)
+        self.assertEqual(self._saldo(), Decimal('120'))
+        self.assertCuentasAlDia()
+
+        self.client.post(
+            reverse('cliente-agregar-plan', args=[self.cliente.pk]),
+            {'plan': self.plan.pk, 'fecha_inicio': '2024-04-01',
+             'fecha_cobranza': 5}
+        )
+        nuevo = ClientePlan.objects.filter(cliente=self.cliente).latest('id')
+        self.assertEqual(self._saldo(), Decimal('170'))
+        self.assertCuentasAlDia()
+
+        self.client.post(reverse(
+            'cliente-plan-editar', args=[self.cliente.pk, nuevo.pk]
+        ), {
+            'plan': self.plan.pk, 'fecha_inicio': '2024-03-01',
+            'fecha_cobranza': 5,
+        })
+        self.assertEqual(self._saldo(), Decimal('220'))
+        self.assertCuentasAlDia()
+
+        self.client.post(reverse(
+            'cliente-plan-eliminar', args=[self.cliente.pk, nuevo.pk]
+        ))
+        self.assertEqual(self._saldo(), Decimal('120'))
+        self.assertCuentasAlDia()
+
+        self.client.post(
+            reverse('pago-eliminar', args=[Pago.objects.get().pk])
+        )
+        self.assertEqual(self._saldo(), Decimal('170'))
+        self.assertCuentasAlDia()
+
+        self.client.post(url_deuda, {'tipo': 'OT', 'plan_id': ot.pk})
+        self.assertEqual(self._saldo(), Decimal('150'))
+        self.assertCuentasAlDia()
+
+    def test_escrituras_fuera_de_las_vistas(self):
+        # Las señales invalidan también lo que se cambia desde el admin
+        DeudaExcluida.objects.create(
+            cliente=self.cliente, plan_asociado=self.cliente_plan,
+            periodo_mes=date(2024, 3, 1)
+        )
+        self.assertIsNone(estado_vigente(self.cliente))
+        self.assertEqual(self._saldo(), Decimal('150'))
+        self.pagar(self.cliente, (self.cliente_plan, date(2024, 1, 1), '50'))
+        self.assertEqual(self._saldo(), Decimal('100'))
+        self.assertCuentasAlDia()
+
+    def test_cambio_de_mes_lo_hace_el_precalculo(self):
+        self.fijar_hoy(date(2024, 5, 2))
+        # Leer no recalcula: mayo aparece cuando corre precalcular_deuda
+        self.assertEqual(self._saldo(), Decimal('200'))
+        self.assertEqual(len(obtener_deuda_cliente(self.cliente)), 4)
+        sincronizar_cuentas()
+        self.assertEqual(self._saldo(), Decimal('250'))
+        self.assertCuentasAlDia()
+
+    def test_precio_del_plan(self):
+        self.client.post(reverse('plan-editar', args=[self.plan.pk]), {
+            'servicio': self.plan.servicio_id, 'nombre': 'Plan 60',
+            'precio': '60',
+        })
+        # Las cuentas de sus clientes se recalculan en la siguiente lectura
+        self.assertFalse(EstadoCuenta.objects.exists())
+        deudas = obtener_deudas_clientes()
+        self.assertEqual(
+            sum(item['saldo'] for item in deudas[self.cliente.pk]),
+            Decimal('240')
+        )
+        self.assertCuentasAlDia()
+
+    def test_reconstruir_cuentas(self):
+        CuentaPorCobrar.objects.filter(cliente=self.cliente).update(
+            saldo=Decimal('1')
+        )
+        with self.assertRaisesMessage(CommandError, '1 clientes no coinciden'):
+            call_command(
+                'reconstruir_cuentas', '--solo-verificar', stdout=StringIO()
+            )
+        salida = StringIO()
+        call_command('reconstruir_cuentas', '--lote', '1', stdout=salida)
+        self.assertIn('Cuentas reconstruidas: 2 clientes', salida.getvalue())
+        self.assertIn('sin diferencias', salida.getvalue())
+        self.assertCuentasAlDia()
+
+    def test_precalcular_reanuda_los_lotes_pendientes(self):
+        tercero = Cliente.objects.create(
+            apellidos='Quispe', nombres='Luz', dni='40000050',
+            celular='999999999', via=self.via
+        )
+        EstadoCuenta.objects.all().delete()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        checkpoint = os.path.join(directorio, 'precalculo.json')
+        opciones = {
+            'lote': 1, 'workers': 1, 'checkpoint': checkpoint,
+            'stdout': StringIO(),
+        }
+        original = precalcular_deuda._sincronizar_lote
+        fallan = {self.clientes[1].pk}
+        lotes = []
+
+        def sincronizar(desde, hasta):
+            lotes.append(desde)
+            if desde in fallan:
+                raise OperationalError('conexión perdida')
+            return original(desde, hasta)
+
+        with mock.patch.object(
+            precalcular_deuda, '_sincronizar_lote', side_effect=sincronizar
+        ):
+            with self.assertRaisesMessage(CommandError, '1 lotes fallaron'):
+                call_command('precalcular_deuda', **opciones)
+            with open(checkpoint, encoding='utf-8') as archivo:
+                self.assertEqual(len(json.load(archivo)['completos']), 2)
+            self.assertEqual(
+                set(EstadoCuenta.objects.values_list('cliente_id', flat=True)),
+                {self.cliente.pk, tercero.pk}
+            )
+
+            fallan.clear()
+            lotes.clear()
+            call_command('precalcular_deuda', reanudar=True, **opciones)
+        # La segunda corrida sólo procesó el lote que había fallado
+        self.assertEqual(lotes, [self.clientes[1].pk])
+        self.assertFalse(os.path.exists(checkpoint))
+        self.assertCuentasAlDia()
+
+    def test_deuda_en_cache_de_otro_proceso(self):
+        self.addCleanup(cache.clear)
+        self.assertEqual(len(obtener_deuda_cacheada(self.cliente)), 4)
+        self.assertEqual(len(obtener_deuda_cacheada(self.cliente)), 4)
+        self.assertEqual(estadisticas_cache_deuda()['hits'], 1)
+
+        # Pago registrado por otro worker: su caché local incrementó la
+        # versión, éste sólo ve el nuevo estado de cuenta en la base
+        with mock.patch('billing_app.cache_deuda.incrementar_version'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.pagar(
+                    self.cliente, (self.cliente_plan, date(2024, 1, 1), '50')
+                )
+                sincronizar_cuenta_cliente(self.cliente)
+        self.assertEqual(len(obtener_deuda_cacheada(self.cliente)), 3)
+        self.assertEqual(len(obtener_deuda_cacheada(self.cliente)), 3)
+        self.assertEqual(estadisticas_cache_deuda()['hits'], 2)
+
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        compartido = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directorio,
+        }}
+        with override_settings(CACHES=compartido):
+            obtener_deuda_cacheada(self.cliente)
+            clave = clave_deuda(
+                self.cliente.pk, estado_vigente(self.cliente)
+            )
+            self.assertEqual(len(cache.get(clave)), 3)
+
+
+class CierreMensualTests(DatosBaseMixin, TestCase):
+    """La deuda que parte de un cierre coincide con recorrer todo el
+    historial."""
+
+    def setUp(self):
+        self.fijar_hoy(date(2024, 4, 15))
+        self.crear_cartera(n=1)
+        self.cliente = self.clientes[0]
+        self.cliente_plan = ClientePlan.objects.get(cliente=self.cliente)
+        self._pagar_el(date(2024, 2, 10), date(2024, 1, 1))
+        self.cierre = cerrar_mes(date(2024, 2, 1))
+
+    def _pagar_el(self, dia, mes):
+        pago = self.pagar(self.cliente, (self.cliente_plan, mes, '50'))
+        Pago.objects.filter(pk=pago.pk).update(
+            fecha=timezone.make_aware(datetime(dia.year, dia.month, dia.day))
+        )
+
+    def _sin_cierre(self, fecha_corte=None):
+        with mock.patch('billing_app.utils.ultimo_cierre', return_value=None):
+            return calcular_meses_deuda(self.cliente, fecha_corte)
+
+    def _meses(self, periodos):
+        return [(item['mes'], item['saldo']) for item in periodos]
+
+    def test_cierre(self):
+        self.assertEqual(self.cierre.fecha_corte, date(2024, 2, 29))
+        self.assertEqual(self.cierre.total_deuda, Decimal('50'))
+        saldo = self.cierre.saldos.get()
+        self.assertEqual(
+            (saldo.periodo_mes, saldo.saldo), (date(2024, 2, 1), Decimal('50'))
+        )
+        with self.assertRaisesMessage(ValueError, 'ya está cerrado'):
+            cerrar_mes(date(2024, 2, 1))
+        with self.assertRaisesMessage(ValueError, 'aún no termina'):
+            cerrar_mes(date(2024, 4, 1))
+
+    def test_pago_posterior_de_un_mes_cerrado(self):
+        self._pagar_el(date(2024, 3, 10), date(2024, 2, 1))
+        deuda = calcular_meses_deuda(self.cliente)
+        self.assertEqual(self._meses(deuda), [
+            (date(2024, 3, 1), Decimal('50')),
+            (date(2024, 4, 1), Decimal('50')),
+        ])
+        self.assertEqual(deuda, self._sin_cierre())
+
+        # Al 05/03 el pago de febrero todavía no existía
+        al_5_de_marzo = calcular_meses_deuda(self.cliente, date(2024, 3, 5))
+        self.assertEqual(self._meses(al_5_de_marzo), [
+            (date(2024, 2, 1), Decimal('50')),
+            (date(2024, 3, 1), Decimal('50')),
+        ])
+        self.assertEqual(al_5_de_marzo, self._sin_cierre(date(2024, 3, 5)))
+        # Antes del cierre sólo cuenta el historial
+        self.assertEqual(
+            self._meses(calcular_meses_deuda(self.cliente, date(2024, 2, 5))),
+            [(date(2024, 1, 1), Decimal('50')),
+             (date(2024, 2, 1), Decimal('50'))]
+        )
+
+    def test_plan_editado_reabre_al_cliente(self):
+        self._pagar_el(date(2024, 3, 10), date(2024, 2, 1))
+        self.cliente_plan.fecha_inicio = date(2023, 12, 1)
+        self.cliente_plan.save()
+        self.assertTrue(
+            self.cierre.reabiertos.filter(pk=self.cliente.pk).exists()
+        )
+        deuda = calcular_meses_deuda(self.cliente)
+        self.assertEqual(self._meses(deuda), [
+            (date(2023, 12, 1), Decimal('50')),
+            (date(2024, 3, 1), Decimal('50')),
+            (date(2024, 4, 1), Decimal('50')),
+        ])
+        self.assertEqual(deuda, self._sin_cierre())
+        self.assertEqual(
+            calcular_meses_deuda(self.cliente, date(2024, 3, 5)),
+            self._sin_cierre(date(2024, 3, 5))
+        )
+        # El estado activo no cambia los cargos: no reabre otro cierre
+        siguiente = cerrar_mes(date(2024, 3, 1))
+        self.cliente_plan.activo = True
+        self.cliente_plan.save(update_fields=['activo'])
+        self.assertFalse(siguiente.reabiertos.exists())
+        self.assertEqual(CierreMensual.objects.count(), 2)
+
+
+class ProcesarPagoTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=1)
+        cls.cliente = cls.clientes[0]
+        cls.cliente_plan = ClientePlan.objects.get(cliente=cls.cliente)
+        cls.serie = SerieCorrelativo.objects.create(
+            tipo='RECIBO', serie='R001'
+        )
+        concepto = OrdenTecnicaConcepto.objects.create(
+            categoria='INSTALACION', nombre='Instalación'
+        )
+        cls.ots = [
+            OrdenTecnica.objects.create(
+                cliente=cls.cliente, concepto=concepto, monto=Decimal('30')
+            )
+            for _ in range(4)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        olvidar_bloques()
+
+    def _pagar(self, meses, ots, **extra):
+        items = [
+            {
+                'plan_id': self.cliente_plan.pk, 'tipo': 'PLAN',
+                'mes_iso': date(2024, 1 + i % 12, 1).replace(
+                    year=2024 + i // 12
+                ).isoformat(),
+                'monto_pagar': 50,
+            }
+            for i in range(meses)
+        ]
+        items += [
+            {'plan_id': ot.pk, 'tipo': 'OT', 'monto_pagar': 30}
+            for ot in ots
+        ]
+        return self.client.post(
+            reverse('api-pago-procesar'),
+            data={
+                'cliente_id': self.cliente.pk,
+                'items_pagados': items,
+                'monto_total': 50 * meses + 30 * len(ots),
+            },
+            content_type='application/json',
+            **extra
+        )
+
+    def test_consultas_no_dependen_de_los_items(self):
+        reservar_bloque(self.serie)
+        with CaptureQueriesContext(connection) as pocos:
+            response = self._pagar(1, self.ots[:2])
+            self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as muchos:
+            response = self._pagar(24, self.ots[2:])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(pocos), len(muchos))
+        self.assertEqual(PagoDetalle.objects.count(), 25 + 4)
+        self.assertTrue(
+            all(ot.pagada for ot in OrdenTecnica.objects.all())
+        )
+
+    def test_reintento_con_la_misma_clave(self):
+        cabecera = {'Idempotency-Key': 'abc-123'}
+        primera = self._pagar(2, [], headers=cabecera).json()
+        # Sesión, usuario, cliente y la clave: nada más
+        with self.assertNumQueries(4):
+            response = self._pagar(2, [], headers=cabecera)
+        self.assertEqual(response.json(), primera)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pago.objects.count(), 1)
+        self.assertEqual(
+            self._pagar(3, [], headers=cabecera).status_code, 409
+        )
+        # Dos envíos simultáneos: el segundo no vio la clave al entrar y la
+        # restricción única lo detiene al insertarla
+        with mock.patch(
+            'billing_app.payments_views._respuesta_repetida',
+            side_effect=[None, JsonResponse(primera)]
+        ):
+            response = self._pagar(2, [], headers=cabecera)
+        self.assertEqual(response.json(), primera)
+        self.assertEqual(Pago.objects.count(), 1)
+        self.assertEqual(PagoDetalle.objects.count(), 2)
+
+
+class DeudaLoteTests(DatosBaseMixin, TestCase):
+    """api_deuda_lote devuelve lo mismo que api_get_deuda por cliente."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=3)
+        SerieCorrelativo.objects.create(tipo='RECIBO', serie='R001')
+        concepto = OrdenTecnicaConcepto.objects.create(
+            categoria='AVERIAS', nombre='Avería'
+        )
+        cls.ot = OrdenTecnica.objects.create(
+            cliente=cls.clientes[1], concepto=concepto, monto=Decimal('35')
+        )
+
+    def setUp(self):
+        self.fijar_hoy(date(2024, 4, 15))
+        self.client.force_login(self.user)
+        self.pagar(
+            self.clientes[1],
+            (ClientePlan.objects.get(cliente=self.clientes[1]),
+             date(2024, 1, 1), '20'),
+            (self.ot, '10')
+        )
+
+    def _lote(self, **params):
+        response = self.client.get(reverse('api-deuda-lote'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_igual_que_por_cliente(self):
+        # Bloques de 2 para que la respuesta se arme en varias partes
+        with mock.patch('billing_app.payments_views.BLOQUE_DEUDA_LOTE', 2):
+            lote = self._lote(sector=self.via.sector_id)
+        self.assertEqual(
+            [c['cliente_id'] for c in lote['clientes']],
+            [cliente.pk for cliente in self.clientes]
+        )
+        for cliente, datos in zip(self.clientes, lote['clientes']):
+            individual = self.client.get(
+                reverse('api-deuda', args=[cliente.pk])
+            ).json()
+            self.assertEqual(datos['items'], individual['items'])
+            self.assertEqual(datos['planes'], individual['planes'])
+            self.assertEqual(lote['correlativos'], individual['correlativos'])
+            self.assertEqual(
+                [(i['plan_id'], i['mes_iso'], i['monto'])
+                 for i in datos['items']],
+                [(d['id'], d['mes'].isoformat() if d['mes'] else '',
+                  float(d['saldo']))
+                 for d in obtener_deuda_cliente(cliente)]
+            )
+        self.assertEqual(lote['clientes'][1]['items'][0]['monto'], 30.0)
+        self.assertEqual(lote['clientes'][1]['items'][-1]['monto'], 25.0)
+
+    def test_ids_y_limite(self):
+        lote = self._lote(ids=f'{self.clientes[2].pk},{self.clientes[0].pk}')
+        self.assertEqual(
+            [c['cliente_id'] for c in lote['clientes']],
+            [self.clientes[0].pk, self.clientes[2].pk]
+        )
+
+        response = self.client.post(
+            reverse('api-deuda-lote'),
+            data={'ids': list(range(1, MAX_CLIENTES_LOTE + 2))},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['message'], 'Máximo 500 clientes por consulta'
+        )
+        self.assertEqual(
+            self.client.get(reverse('api-deuda-lote')).status_code, 400
+        )
+
+
+@override_settings(CORRELATIVOS_BLOQUE=5)
+class CorrelativoTests(DatosBaseMixin, TransactionTestCase):
+
+    def setUp(self):
+        self.crear_cartera(n=1)
+        self.serie = SerieCorrelativo.objects.create(
+            tipo='RECIBO', serie='R001'
+        )
+        olvidar_bloques()
+
+    def _emitir(self):
+        with transaction.atomic():
+            numero = tomar_correlativo(self.serie)
+            Pago.objects.create(
+                cliente=self.clientes[0], monto=Decimal('50'),
+                tipo_comprobante='Recibo', serie_numero=numero,
+                detalles='Prueba'
+            )
+        return numero
+
+    def test_bloques_libres_y_rollback(self):
+        self.assertEqual(
+            [self._emitir() for _ in range(3)],
+            ['R001-00000001', 'R001-00000002', 'R001-00000003']
+        )
+        self.serie.refresh_from_db()
+        self.assertEqual(self.serie.ultimo_numero, 5)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                tomar_correlativo(self.serie)
+                raise ValueError
+        self.assertEqual(self._emitir(), 'R001-00000004')
+        SerieCorrelativoLibre.objects.create(
+            serie_correlativo=self.serie, numero=2
+        )
+        Pago.objects.filter(serie_numero='R001-00000002').delete()
+        self.assertEqual(self._emitir(), 'R001-00000002')
+        self.assertEqual(
+            [self._emitir() for _ in range(2)],
+            ['R001-00000005', 'R001-00000006']
+        )
+        self.serie.refresh_from_db()
+        self.assertEqual(self.serie.ultimo_numero, 10)
+        self.assertEqual(
+            auditar(self.serie), {'huecos': [], 'duplicados': []}
+        )
+
+    def test_recuperar_bloque_abandonado(self):
+        self._emitir()
+        # Worker caído: su bloque queda abierto y sin uso
+        olvidar_bloques()
+        self.assertEqual(recuperar_bloques(), 0)
+        BloqueCorrelativo.objects.update(
+            actualizado=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(recuperar_bloques(), 4)
+        self.assertEqual(
+            auditar(self.serie), {'huecos': [], 'duplicados': []}
+        )
+        self.assertEqual(self._emitir(), 'R001-00000002')
+
+    def test_hilos_sin_huecos_ni_duplicados(self):
+        errores = []
+
+        def cajero():
+            try:
+                for _ in range(15):
+                    # SQLite bloquea tablas enteras: cada choque revierte el
+                    # pago y se reintenta, lo que además ejercita el rollback
+                    for _ in range(500):
+                        try:
+                            reservar_bloque(self.serie)
+                            self._emitir()
+                            break
+                        except OperationalError:
+                            time.sleep(0.001)
+                    else:
+                        errores.append('sin reintentos')
+            except Exception as exc:
+                errores.append(repr(exc))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=cajero) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+        self.assertEqual(Pago.objects.count(), 8 * 15)
+        self.serie.refresh_from_db()
+        self.assertEqual(
+            auditar(self.serie), {'huecos': [], 'duplicados': []}
+        )
+        recuperar_bloques(minutos=0)
+        self.assertEqual(
+            self.serie.libres.count(),
+            self.serie.ultimo_numero - Pago.objects.count()
+        )
+
+
+class ExportacionTests(DatosBaseMixin, TestCase):
+    """Descargas de reportes (exportacion.py) al 15/04/2024."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=3)
+        cls.apellido_largo = Cliente.objects.create(
+            apellidos='Huamán' * 10, nombres='Rosa', dni='40000099',
+            celular='999999999', via=cls.via
+        )
+        ClientePlan.objects.create(
+            cliente=cls.apellido_largo, plan=cls.plan,
+            fecha_inicio=date(2024, 4, 1), fecha_cobranza=5
+        )
+
+    def setUp(self):
+        self.fijar_hoy(date(2024, 4, 15))
+        self.client.force_login(self.user)
+
+    def test_deuda_en_xlsx(self):
+        response = self.client.get(reverse('reportes-deuda'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE_XLSX)
+        libro = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        hoja = libro['Deuda pendiente']
+
+        filas = list(hoja.iter_rows(values_only=True))
+        self.assertEqual(
+            filas[0], ('Cliente', 'DNI', 'Celular', 'Activo', 'Deuda total')
+        )
+        self.assertEqual(len(filas), 5)
+        self.assertEqual(
+            filas[1], ('Huamán' * 10 + ', Rosa', '40000099', '999999999',
+                       True, 50)
+        )
+        self.assertEqual(
+            [fila[4] for fila in filas[2:]], [200, 200, 200]
+        )
+        # Largo máximo + 2, con tope en ANCHO_MAXIMO
+        self.assertEqual(
+            [hoja.column_dimensions[letra].width for letra in 'ABCDE'],
+            [ANCHO_MAXIMO, 10, 11, 8, 13]
+        )
+
+    def _descargar(self, nombre, formato):
+        response = self.client.get(reverse(nombre), {'format': formato})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_deuda_en_csv(self):
+        response, contenido = self._descargar('reportes-deuda', 'csv')
+        self.assertIn(
+            'reporte_deuda_pendiente.csv', response['Content-Disposition']
+        )
+        # BOM para que Excel lea las tildes
+        self.assertTrue(contenido.startswith('\ufeff'))
+        filas = list(csv.reader(StringIO(contenido[1:])))
+        self.assertEqual(
+            filas[0], ['Cliente', 'DNI', 'Celular', 'Activo', 'Deuda total']
+        )
+        self.assertEqual(len(filas), 5)
+        self.assertEqual(
+            filas[1], ['Huamán' * 10 + ', Rosa', '40000099', '999999999',
+                       'True', '50.00']
+        )
+        self.assertEqual(
+            [fila[4] for fila in filas[2:]], ['200.00', '200.00', '200.00']
+        )
+
+    def test_ndjson_una_fila_por_linea(self):
+        _, contenido = self._descargar('reportes-deuda', 'ndjson')
+        lineas = contenido.splitlines()
+        self.assertEqual(len(lineas), 4)
+        registros = [json.loads(linea) for linea in lineas]
+        self.assertEqual(registros[1], {
+            'Cliente': 'Pérez, Cliente 0', 'DNI': '40000000',
+            'Celular': '999999999', 'Activo': True, 'Deuda total': '200.00'
+        })
+
+        # Con varias hojas cada línea dice de cuál viene
+        self.pagar(
+            self.clientes[0],
+            (ClientePlan.objects.get(cliente=self.clientes[0]),
+             date(2024, 1, 1), '50')
+        )
+        _, contenido = self._descargar('reportes-ingresos-egresos', 'ndjson')
+        [registro] = [json.loads(linea) for linea in contenido.splitlines()]
+        self.assertEqual(registro['hoja'], 'Ingresos')
+        self.assertEqual(registro['Fecha'], '2024-04-15T12:00:00')
+        self.assertEqual(registro['Monto item'], '50.00')
+        self.assertEqual(registro['Periodo mes'], '2024-01-01')
+
+
+class ColaReportesTests(TestCase):
+    """Cola de TrabajoReporte sin broker (cola_reportes.py)."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_pedidos_identicos_comparten_trabajo(self):
+        trabajo = encolar_reporte('clientes', formato='csv')
+        self.assertEqual(encolar_reporte('clientes', formato='csv'), trabajo)
+        self.assertEqual(TrabajoReporte.objects.count(), 1)
+
+        self.assertEqual(tomar_trabajo(), trabajo)
+        self.assertIsNone(tomar_trabajo())
+        # Mientras se procesa sigue siendo el mismo pedido
+        self.assertEqual(encolar_reporte('clientes', formato='csv'), trabajo)
+
+    def test_solo_se_reencolan_los_abandonados(self):
+        vivo = encolar_reporte('clientes', formato='csv')
+        abandonado = encolar_reporte('ots', formato='csv')
+        tomar_trabajo()
+        tomar_trabajo()
+        # El worker de `vivo` lleva dos horas pero sigue latiendo
+        TrabajoReporte.objects.filter(pk=vivo.pk).update(
+            iniciado=timezone.now() - timedelta(hours=2)
+        )
+        TrabajoReporte.objects.filter(pk=abandonado.pk).update(
+            latido=timezone.now() - timedelta(minutes=10)
+        )
+        limpiar_reportes()
+        vivo.refresh_from_db()
+        abandonado.refresh_from_db()
+        self.assertEqual(vivo.estado, 'PROCESANDO')
+        self.assertEqual(abandonado.estado, 'PENDIENTE')
+        self.assertEqual(tomar_trabajo(), abandonado)
+
+    def test_vencidos_se_borran_con_su_archivo(self):
+        encolar_reporte('clientes', formato='csv')
+        trabajo = procesar_trabajo(tomar_trabajo())
+        self.assertEqual(trabajo.estado, 'LISTO')
+        ruta = trabajo.archivo.path
+        self.assertTrue(os.path.exists(ruta))
+
+        self.assertEqual(limpiar_reportes(), 0)
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(
+            expira=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(limpiar_reportes(), 1)
+        self.assertFalse(os.path.exists(ruta))
+        self.assertFalse(TrabajoReporte.objects.exists())
+
+
+class ComprobantePDFTests(DatosBaseMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        cls.crear_cartera(n=1)
+        cls.pago = Pago.objects.create(
+            cliente=cls.clientes[0], monto=Decimal('50'),
+            tipo_comprobante='Recibo', serie_numero='R001-00000001',
+            detalles='Enero 2024'
+        )
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('pago-pdf', args=[self.pago.pk])
+
+    def test_se_genera_una_vez_y_se_revalida(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'
+        ))
+        comprobante = ComprobantePDF.objects.get()
+        self.assertEqual(response['ETag'], f'"{comprobante.huella}"')
+        self.pago.refresh_from_db()
+        self.assertEqual(self.pago.pdf_comprobante.name,
+                         comprobante.archivo.name)
+
+        with mock.patch('billing_app.comprobantes.pisa') as pisa:
+            response = self.client.get(
+                self.url, headers={'If-None-Match': response['ETag']}
+            )
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            pisa.assert_not_called()
+
+    def test_cambios_de_empresa_o_pago_regeneran(self):
+        self.client.get(self.url)
+        anterior = ComprobantePDF.objects.get()
+        empresa = CompanySettings.get_settings()
+        empresa.nombre_empresa = 'Otra empresa'
+        with self.captureOnCommitCallbacks(execute=True):
+            empresa.save()
+        self.client.get(self.url)
+        actual = ComprobantePDF.objects.get()
+        self.assertNotEqual(actual.huella, anterior.huella)
+        self.assertFalse(
+            actual.archivo.storage.exists(anterior.archivo.name)
+        )
+        Pago.objects.filter(pk=self.pago.pk).update(monto=Decimal('60'))
+        self.client.get(self.url, {'formato': 'a4'})
+        self.assertEqual(ComprobantePDF.objects.count(), 2)
+
+    @override_settings(COMPROBANTES_PRERENDER=True)
+    def test_prerender_al_confirmar_el_pago(self):
+        SerieCorrelativo.objects.create(tipo='RECIBO', serie='R001')
+        cliente_plan = ClientePlan.objects.get(cliente=self.clientes[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api-pago-procesar'),
+                data={
+                    'cliente_id': self.clientes[0].pk,
+                    'items_pagados': [{
+                        'plan_id': cliente_plan.pk, 'tipo': 'PLAN',
+                        'mes_iso': '2024-02-01', 'monto_pagar': 50,
+                    }],
+                    'monto_total': 50,
+                },
+                content_type='application/json'
+            )
+        pago_id = response.json()['pago_id']
+        self.assertFalse(ComprobantePDF.objects.filter(pago_id=pago_id))
+        trabajo = procesar_trabajo(tomar_trabajo())
+        self.assertEqual(trabajo.estado, 'LISTO')
+        self.assertTrue(
+            ComprobantePDF.objects.filter(pago_id=pago_id, formato='a5')
+        )
+
+    def test_impresion_en_lote(self):
+        for i in range(2, 11):
+            Pago.objects.create(
+                cliente=self.clientes[0], monto=Decimal('50'),
+                tipo_comprobante='Recibo', serie_numero=f'R001-{i:08d}',
+                detalles=f'Mes {i}'
+            )
+        self.client.get(self.url)
+        ids = list(Pago.objects.values_list('pk', flat=True)[:3])
+        response = self.client.get(
+            reverse('pagos-imprimir'),
+            {'ids': ','.join(str(pk) for pk in ids)}
+        )
+        self.assertEqual(response.status_code, 200)
+        lector = PdfReader(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(lector.pages), 3)
+        self.assertIn('00000001', lector.pages[0].extract_text())
+        self.assertEqual(ComprobantePDF.objects.count(), 3)
+        self.assertEqual(
+            self.client.get(reverse('pagos-imprimir')).status_code, 400
+        )
+
+        # Los 7 pendientes alcanzan para repartirlos en procesos
+        salida = f'{self.media}/lote.pdf'
+        with mock.patch('billing_app.impresion.MINIMO_POOL', 7):
+            call_command(
+                'imprimir_comprobantes', salida=salida,
+                desde=timezone.localdate(), procesos=2, stdout=StringIO()
+            )
+        lector = PdfReader(salida)
+        self.assertEqual(len(lector.pages), 10)
+        self.assertIn('00000010', lector.pages[-1].extract_text())
+        self.assertEqual(ComprobantePDF.objects.count(), 10)
+
+    def test_lote_grande_va_a_la_cola(self):
+        for i in range(2, 8):
+            Pago.objects.create(
+                cliente=self.clientes[0], monto=Decimal('50'),
+                tipo_comprobante='Recibo', serie_numero=f'R001-{i:08d}',
+                detalles=f'Mes {i}'
+            )
+        seleccion = {
+            'desde': timezone.localdate().isoformat(), 'formato': 'a4'
+        }
+        with mock.patch('billing_app.payments_views.MAXIMO_IMPRESION_WEB', 5):
+            response = self.client.get(reverse('pagos-imprimir'), seleccion)
+            self.assertContains(
+                response, 'Son 7 comprobantes', status_code=202
+            )
+            # El mismo pedido mientras tanto reusa el trabajo
+            self.client.get(reverse('pagos-imprimir'), seleccion)
+        trabajo = TrabajoReporte.objects.get()
+        self.assertEqual((trabajo.tipo, trabajo.formato), ('impresion', 'a4'))
+        self.assertFalse(ComprobantePDF.objects.exists())
+
+        with mock.patch('billing_app.impresion.MINIMO_POOL', 100):
+            trabajo = procesar_trabajo(tomar_trabajo())
+        self.assertEqual(trabajo.estado, 'LISTO')
+        with trabajo.archivo.open('rb') as archivo:
+            self.assertEqual(len(PdfReader(archivo).pages), 7)
+        response = self.client.get(
+            reverse('reporte-descargar', args=[trabajo.pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        # Otro usuario no ve ni descarga el lote ajeno
+        otro = User.objects.create_user('cajero', password='x')
+        self.client.force_login(otro)
+        for nombre in ('reporte-estado', 'reporte-descargar'):
+            response = self.client.get(reverse(nombre, args=[trabajo.pk]))
+            self.assertEqual(response.status_code, 404)
+
+
+class ArranqueTests(SimpleTestCase):
+    """Lo que importa cada worker al arrancar (ver dependencias.py)."""
+
+    DIFERIDOS = (
+        'xhtml2pdf', 'reportlab', 'html5lib', 'openpyxl', 'routeros_api',
+        'pypdf', 'numpy'
+    )
+
+    def test_arranque_sin_dependencias_pesadas(self):
+        # En otro intérprete: este proceso ya importó pypdf para los tests
+        codigo = (
+            'import json, sys, django; django.setup(); '
+            'from django.urls import resolve; resolve("/pagos/"); '
+            'print(json.dumps(sorted(sys.modules)))'
+        )
+        proceso = subprocess.run(
+            [sys.executable, '-c', codigo],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'isp_billing.settings'},
+            capture_output=True, text=True, check=True
+        )
+        cargados = [
+            nombre for nombre in json.loads(proceso.stdout.splitlines()[-1])
+            if nombre.split('.')[0] in self.DIFERIDOS
+        ]
+        self.assertEqual(cargados, [])
@@ -0,0 +1,12 @@
+"""Normalización de texto para búsquedas y comparaciones."""
+import re
+import unicodedata
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def normalizar(texto):
+    """'Núñez-García, Juan' -> 'nunez garcia juan'"""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
@@ -1,7 +1,8 @@
 from django.urls import path
 from . import views
 from .payments_views import (
-    api_get_deuda, procesar_pago, generar_pdf_pago, generar_ticket_pago,
+    api_get_deuda, api_deuda_cache_stats, api_deuda_lote, procesar_pago,
+    generar_pdf_pago, generar_ticket_pago, imprimir_comprobantes_lote,
     pago_eliminar
 )
 
@@ -35,9 +36,39 @@ urlpatterns = [
         views.reportes_deuda,
         name='reportes-deuda'
     ),
+    path(
+        'reportes/trabajos/<str:tipo>/encolar/',
+        views.reporte_encolar,
+        name='reporte-encolar'
+    ),
+    path(
+        'reportes/trabajos/<int:pk>/',
+        views.reporte_estado,
+        name='reporte-estado'
+    ),
+    path(
+        'reportes/trabajos/<int:pk>/descargar/',
+        views.reporte_descargar,
+        name='reporte-descargar'
+    ),
+    path(
+        'reportes/antiguedad/',
+        views.reportes_antiguedad,
+        name='reportes-antiguedad'
+    ),
+    path(
+        'reportes/antiguedad/excel/',
+        views.reportes_antiguedad_excel,
+        name='reportes-antiguedad-excel'
+    ),
     path('clientes/', views.cliente_lista, name='index'),
     path('cliente/nuevo/', views.cliente_crear, name='cliente-crear'),
     path('cliente/<int:pk>/', views.cliente_detalle, name='cliente-detalle'),
+    path(
+        'cliente/<int:pk>/historial/',
+        views.cliente_historial,
+        name='cliente-historial'
+    ),
     path(
         'cliente/<int:pk>/editar/',
         views.cliente_editar,
@@ -371,6 +402,16 @@ urlpatterns = [
         api_get_deuda,
         name='api-deuda'
     ),
+    path(
+        'api/deuda/lote/',
+        api_deuda_lote,
+        name='api-deuda-lote'
+    ),
+    path(
+        'api/deuda/cache/',
+        api_deuda_cache_stats,
+        name='api-deuda-cache'
+    ),
     path(
         'api/pago/procesar/',
         procesar_pago,
@@ -381,6 +422,11 @@ urlpatterns = [
         generar_pdf_pago,
         name='pago-pdf'
     ),
+    path(
+        'pagos/imprimir/',
+        imprimir_comprobantes_lote,
+        name='pagos-imprimir'
+    ),
     path(
         'pago/<int:pago_id>/ticket/',
         generar_ticket_pago,
@@ -408,4 +454,9 @@ urlpatterns = [
         views.ajax_load_vias,
         name='ajax_load_vias'
     ),
+    path(
+        'ajax/clientes/autocompletar/',
+        views.ajax_autocompletar_clientes,
+        name='ajax_autocompletar_clientes'
+    ),
 ]
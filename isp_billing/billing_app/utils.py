@@ -1,9 +1,17 @@
 import logging
 import calendar
+from collections import defaultdict
+from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 from django.utils import timezone
-from .models import DeudaExcluida, MovimientoHistorial, PagoDetalle
-from django.db.models import Sum
+from .eventos import (
+    encolar_eventos, evento_borrado, evento_de, evento_movimiento
+)
+from .models import (
+    CierreMensual, CierreSaldo, Cliente, ClientePlan, DeudaExcluida,
+    OrdenTecnica, PagoDetalle
+)
+from django.db.models import Q, Sum
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +21,406 @@ MESES_ES = [
 ]
 
 
-def calcular_meses_deuda(cliente):
+def _indice_mes(fecha):
+    return fecha.year * 12 + fecha.month - 1
+
+
+def meses_facturables(fecha_inicio, hasta, excluidos=(), despues_de=None):
+    """
+    Meses a cobrar de un plan, calculados aritméticamente.
+
+    Args:
+        fecha_inicio: Fecha de inicio del plan (se cobra desde ese mes)
+        hasta: Fecha límite; se incluye el mes que la contiene
+        excluidos: Primeros días de mes excluidos (DeudaExcluida)
+        despues_de: Si se indica, sólo meses posteriores al de esa fecha
+
+    Returns:
+        list: Primer día de cada mes facturable, en orden ascendente
+    """
+    desde = _indice_mes(fecha_inicio)
+    if despues_de is not None:
+        desde = max(desde, _indice_mes(despues_de) + 1)
+    fin = _indice_mes(hasta)
+    if fin < desde:
+        return []
+    indices = range(desde, fin + 1)
+    if excluidos:
+        indices = sorted(
+            set(indices) - {_indice_mes(mes) for mes in excluidos}
+        )
+    return [date(indice // 12, indice % 12 + 1, 1) for indice in indices]
+
+
+def monto_primer_mes(precio, fecha_inicio):
+    """Prorratea el precio del plan por los días restantes del mes de
+    inicio; si el plan empieza el día 1 se cobra el mes completo."""
+    if fecha_inicio.day <= 1:
+        return precio
+    dias_mes = calendar.monthrange(fecha_inicio.year, fecha_inicio.month)[1]
+    dias_restantes = dias_mes - fecha_inicio.day + 1
+    return (
+        precio * Decimal(dias_restantes) / Decimal(dias_mes)
+    ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def nombre_mes(mes):
+    """Nombre legible de un periodo mensual, p. ej. 'Marzo 2024'."""
+    return f"{MESES_ES[mes.month]} {mes.year}"
+
+
+def nombre_deuda_ot(ot):
+    """Etiqueta con la que se muestra una OT en el estado de cuenta."""
+    if ot.concepto.categoria == 'INSTALACION' and ot.observaciones:
+        return ot.observaciones
+    return f"OT: {ot.concepto.nombre}"
+
+
+def ultimo_cierre(hasta):
+    """Último CierreMensual cuya fecha de corte no supera `hasta`."""
+    return (
+        CierreMensual.objects.filter(fecha_corte__lte=hasta)
+        .order_by('-fecha_corte')
+        .first()
+    )
+
+
+def _cargar_datos_deuda(clientes=None, fecha_corte=None):
+    """
+    Carga en bloque todo lo necesario para calcular la deuda de varios
+    clientes con un número fijo de consultas.
+
+    Si existe un cierre mensual anterior a la fecha de corte, los clientes
+    no reabiertos parten de sus saldos de cierre: sólo se cargan los pagos
+    posteriores al cierre y los meses y OTs nuevos.
+
+    Args:
+        clientes: QuerySet de Cliente o None para toda la cartera
+        fecha_corte: Fecha a la que se calcula la deuda (None = hoy); sólo
+            cuentan pagos, OTs y exclusiones registrados hasta ese día
+
+    Returns:
+        dict: Datos agrupados por cliente y totales pagados agrupados por
+            (plan_asociado_id, periodo_mes) y por ot_asociada_id
+    """
+    if clientes is None:
+        clientes = Cliente.objects.all()
+    hoy = fecha_corte or timezone.now().date()
+    cliente_ids = list(clientes.order_by().values_list('id', flat=True))
+    cliente_filtro = clientes.order_by().values('id')
+
+    cierre = ultimo_cierre(hoy)
+    reabiertos = set()
+    if cierre:
+        reabiertos = set(
+            cierre.reabiertos.filter(id__in=cliente_filtro)
+            .values_list('id', flat=True)
+        )
+
+    exclusiones = DeudaExcluida.objects.filter(cliente_id__in=cliente_filtro)
+    ots_qs = OrdenTecnica.objects.filter(
+        cliente_id__in=cliente_filtro, exonerada=False
+    )
+    pagos_qs = PagoDetalle.objects.all()
+    if fecha_corte:
+        exclusiones = exclusiones.filter(fecha__date__lte=fecha_corte)
+        ots_qs = ots_qs.filter(fecha_creacion__date__lte=fecha_corte)
+        pagos_qs = pagos_qs.filter(pago__fecha__date__lte=fecha_corte)
+
+    exclusiones_plan = defaultdict(lambda: defaultdict(set))
+    exclusiones_ot = defaultdict(set)
+    for cliente_id, plan_id, periodo, ot_id in exclusiones.values_list(
+        'cliente_id', 'plan_asociado_id', 'periodo_mes', 'ot_asociada_id'
+    ):
+        if plan_id is not None and periodo is not None:
+            exclusiones_plan[cliente_id][plan_id].add(periodo)
+        if ot_id is not None:
+            exclusiones_ot[cliente_id].add(ot_id)
+
+    planes = defaultdict(list)
+    for cp in (
+        ClientePlan.objects.filter(cliente_id__in=cliente_filtro)
+        .select_related('plan')
+        .order_by('id')
+    ):
+        planes[cp.cliente_id].append(cp)
+
+    pagos_plan_qs = pagos_qs.filter(
+        plan_asociado__cliente_id__in=cliente_filtro
+    )
+    pagos_ot_qs = pagos_qs.filter(ot_asociada__cliente_id__in=cliente_filtro)
+    saldos_cierre = defaultdict(list)
+    pagos_plan_posteriores = {}
+    pagos_ot_posteriores = {}
+    if cierre:
+        # Clientes que parten del cierre: sólo OTs creadas y meses
+        # posteriores; los reabiertos se recalculan completos.
+        ots_qs = ots_qs.filter(
+            Q(cliente_id__in=reabiertos)
+            | Q(fecha_creacion__date__gt=cierre.fecha_corte)
+        )
+        pagos_plan_qs = pagos_plan_qs.filter(
+            Q(plan_asociado__cliente_id__in=reabiertos)
+            | Q(periodo_mes__gt=cierre.periodo)
+        )
+        pagos_ot_qs = pagos_ot_qs.filter(
+            Q(ot_asociada__cliente_id__in=reabiertos)
+            | Q(ot_asociada__fecha_creacion__date__gt=cierre.fecha_corte)
+        )
+        for saldo in (
+            CierreSaldo.objects.filter(
+                cierre=cierre, cliente_id__in=cliente_filtro
+            )
+            .exclude(cliente_id__in=reabiertos)
+            .select_related('plan_asociado__plan', 'ot_asociada__concepto')
+            .order_by('id')
+        ):
+            saldos_cierre[saldo.cliente_id].append(saldo)
+        posteriores = pagos_qs.filter(
+            pago__fecha__date__gt=cierre.fecha_corte
+        ).exclude(pago__cliente_id__in=reabiertos)
+        pagos_plan_posteriores = {
+            (row['plan_asociado_id'], row['periodo_mes']): row['total']
+            for row in (
+                posteriores.filter(
+                    plan_asociado__cliente_id__in=cliente_filtro,
+                    periodo_mes__lte=cierre.periodo
+                )
+                .values('plan_asociado_id', 'periodo_mes')
+                .annotate(total=Sum('monto_parcial'))
+                .order_by()
+            )
+        }
+        pagos_ot_posteriores = {
+            row['ot_asociada_id']: row['total']
+            for row in (
+                posteriores.filter(
+                    ot_asociada__cliente_id__in=cliente_filtro,
+                    ot_asociada__fecha_creacion__date__lte=cierre.fecha_corte
+                )
+                .values('ot_asociada_id')
+                .annotate(total=Sum('monto_parcial'))
+                .order_by()
+            )
+        }
+
+    ots = defaultdict(list)
+    for ot in ots_qs.select_related('concepto').order_by('id'):
+        ots[ot.cliente_id].append(ot)
+
+    pagos_plan = {
+        (row['plan_asociado_id'], row['periodo_mes']): row['total']
+        for row in (
+            pagos_plan_qs
+            .values('plan_asociado_id', 'periodo_mes')
+            .annotate(total=Sum('monto_parcial'))
+            .order_by()
+        )
+    }
+    pagos_ot = {
+        row['ot_asociada_id']: row['total']
+        for row in (
+            pagos_ot_qs
+            .values('ot_asociada_id')
+            .annotate(total=Sum('monto_parcial'))
+            .order_by()
+        )
+    }
+
+    return {
+        'hoy': hoy,
+        'cliente_ids': cliente_ids,
+        'exclusiones_plan': exclusiones_plan,
+        'exclusiones_ot': exclusiones_ot,
+        'planes': planes,
+        'ots': ots,
+        'pagos_plan': pagos_plan,
+        'pagos_ot': pagos_ot,
+        'cierre': cierre,
+        'reabiertos': reabiertos,
+        'saldos_cierre': saldos_cierre,
+        'pagos_plan_posteriores': pagos_plan_posteriores,
+        'pagos_ot_posteriores': pagos_ot_posteriores,
+    }
+
+
+def _periodo_plan(cp, mes, monto_mes, pagado, plan_nombre):
+    """Fila de deuda de un mes de plan, o None si no hay saldo."""
+    pagado_decimal = Decimal(str(pagado or 0))
+    # Solo añadimos si hay deuda real y el plan tiene monto > 0
+    if monto_mes > 0 and pagado_decimal < monto_mes:
+        return {
+            'id': cp.id,
+            'plan_nombre': plan_nombre,
+            'mes': mes,
+            'mes_nombre': nombre_mes(mes),
+            'monto_original': monto_mes,
+            'pagado': pagado_decimal,
+            'saldo': monto_mes - pagado_decimal,
+            'tipo': 'plan'
+        }
+    return None
+
+
+def _periodo_ot(ot, monto, pagado):
+    """Fila de deuda de una OT, o None si no hay saldo."""
+    if not monto or monto <= 0:
+        return None
+    saldo_ot = monto - pagado
+    if saldo_ot <= 0:
+        return None
+    return {
+        'id': ot.id,
+        'plan_nombre': nombre_deuda_ot(ot),
+        'mes': None,
+        'mes_nombre': "Costo ?nico",
+        'monto_original': monto,
+        'pagado': pagado,
+        'saldo': saldo_ot,
+        'tipo': 'OT'
+    }
+
+
+def _periodos_deuda_cliente(cliente_id, datos, hoy):
+    """Arma las filas de deuda de un cliente a partir de datos precargados."""
+    periodos_deuda = []
+    exclusiones_plan = datos['exclusiones_plan'].get(cliente_id, {})
+    exclusiones_ot = datos['exclusiones_ot'].get(cliente_id, set())
+    pagos_plan = datos['pagos_plan']
+    pagos_ot = datos['pagos_ot']
+
+    cierre = datos.get('cierre')
+    if cierre and cliente_id in datos['reabiertos']:
+        cierre = None
+    saldos_plan = defaultdict(list)
+    saldos_ot = []
+    if cierre:
+        for saldo in datos['saldos_cierre'].get(cliente_id, []):
+            if saldo.ot_asociada_id:
+                saldos_ot.append(saldo)
+            else:
+                saldos_plan[saldo.plan_asociado_id].append(saldo)
+
+    # Procesamos planes activos del cliente
+    for cp in datos['planes'].get(cliente_id, []):
+        if not cp.fecha_inicio:
+            logger.warning(
+                "Cliente %s tiene plan %s sin fecha_inicio",
+                cliente_id,
+                cp.id
+            )
+            continue
+        plan_nombre = cp.plan.nombre
+        precio = Decimal(str(cp.plan.precio))
+        excluidos = exclusiones_plan.get(cp.id, ())
+
+        # Meses hasta el cierre: saldo congelado menos pagos posteriores
+        for saldo in sorted(
+            saldos_plan.get(cp.id, []), key=lambda x: x.periodo_mes
+        ):
+            if saldo.periodo_mes in excluidos:
+                continue
+            posterior = datos['pagos_plan_posteriores'].get(
+                (cp.id, saldo.periodo_mes)
+            ) or 0
+            fila = _periodo_plan(
+                cp, saldo.periodo_mes, saldo.monto_cargado,
+                saldo.monto_pagado + posterior, plan_nombre
+            )
+            if fila:
+                periodos_deuda.append(fila)
+
+        # Cobranza inicia en el mismo mes de la fecha de instalacion; sólo
+        # ese primer mes se prorratea.
+        primer_mes = cp.fecha_inicio.replace(day=1)
+        monto_inicial = monto_primer_mes(precio, cp.fecha_inicio)
+
+        for mes_inicio in meses_facturables(
+            cp.fecha_inicio, hoy, excluidos,
+            despues_de=cierre.periodo if cierre else None
+        ):
+            monto_mes = monto_inicial if mes_inicio == primer_mes else precio
+            # Pagos registrados para este mes (agregados en bloque)
+            fila = _periodo_plan(
+                cp, mes_inicio, monto_mes,
+                pagos_plan.get((cp.id, mes_inicio)), plan_nombre
+            )
+            if fila:
+                periodos_deuda.append(fila)
+
+    # Procesamos ?rdenes t?cnicas no pagadas
+    try:
+        filas_ot = []
+        for saldo in saldos_ot:
+            ot = saldo.ot_asociada
+            if ot.exonerada or ot.id in exclusiones_ot:
+                continue
+            posterior = datos['pagos_ot_posteriores'].get(ot.id) or 0
+            fila = _periodo_ot(
+                ot, saldo.monto_cargado, saldo.monto_pagado + posterior
+            )
+            if fila:
+                filas_ot.append(fila)
+        for ot in datos['ots'].get(cliente_id, []):
+            if ot.id in exclusiones_ot:
+                continue
+            fila = _periodo_ot(ot, ot.monto, pagos_ot.get(ot.id) or 0)
+            if fila:
+                filas_ot.append(fila)
+        periodos_deuda.extend(sorted(filas_ot, key=lambda x: x['id']))
+    except Exception as e:
+        logger.warning(
+            f"Error al procesar OTs para cliente {cliente_id}: {e}"
+        )
+
+    return periodos_deuda
+
+
+def calcular_deuda_clientes(clientes=None, fecha_corte=None):
+    """
+    Calcula la deuda de muchos clientes a la vez.
+
+    Exclusiones, planes, OTs y los montos de PagoDetalle (agrupados por
+    plan y periodo, y por OT) se cargan en un número fijo de consultas,
+    sin importar cuántos clientes o meses haya.
+
+    Args:
+        clientes: QuerySet de Cliente; None calcula toda la cartera
+        fecha_corte: Calcula la deuda a esa fecha (None = hoy)
+
+    Returns:
+        dict: {cliente_id: lista de periodos}, con la misma estructura que
+            devuelve calcular_meses_deuda. Todo cliente del queryset tiene
+            su entrada, aunque no deba nada.
+    """
+    datos = _cargar_datos_deuda(clientes, fecha_corte)
+    hoy = datos['hoy']
+    resultado = {}
+    for cliente_id in datos['cliente_ids']:
+        try:
+            resultado[cliente_id] = _periodos_deuda_cliente(
+                cliente_id, datos, hoy
+            )
+        except Exception:
+            logger.exception(
+                'Error calculando deuda para cliente %s',
+                cliente_id
+            )
+            resultado[cliente_id] = []
+    logger.info(
+        "Deuda calculada en bloque para %s clientes", len(resultado)
+    )
+    return resultado
+
+
+def calcular_meses_deuda(cliente, fecha_corte=None):
     """
     Calcula los meses de deuda para un cliente basándose en sus planes activos.
     
     Args:
         cliente: Instancia de Cliente
+        fecha_corte: Fecha a la que se calcula la deuda (None = hoy); sólo
+            cuentan los pagos con Pago.fecha hasta ese día
         
     Returns:
         list: Lista de dicts con estructura:
@@ -35,155 +437,13 @@ def calcular_meses_deuda(cliente):
         ValueError: Si hay problemas con los datos del cliente
     """
     try:
-        hoy = timezone.now().date()
-        periodos_deuda = []
-        
-        # Exclusiones registradas
-        exclusiones_plan = set(
-            DeudaExcluida.objects.filter(
-                cliente=cliente,
-                plan_asociado__isnull=False,
-                periodo_mes__isnull=False
-            ).values_list('plan_asociado_id', 'periodo_mes')
+        datos = _cargar_datos_deuda(
+            Cliente.objects.filter(pk=cliente.pk), fecha_corte
         )
-        exclusiones_ot = set(
-            DeudaExcluida.objects.filter(
-                cliente=cliente,
-                ot_asociada__isnull=False
-            ).values_list('ot_asociada_id', flat=True)
+        periodos_deuda = _periodos_deuda_cliente(
+            cliente.id, datos, datos['hoy']
         )
 
-        # Procesamos planes activos del cliente
-        planes = cliente.planes.select_related('plan').all()
-        for cp in planes:
-            fecha_eval = cp.fecha_inicio
-            if not fecha_eval:
-                logger.warning(
-                    "Cliente %s tiene plan %s sin fecha_inicio",
-                    cliente.id,
-                    cp.id
-                )
-                continue
-            # Cobranza inicia en el mismo mes de la fecha de instalacion
-            fecha_eval = fecha_eval.replace(day=1)
-            if fecha_eval > hoy:
-                continue
-            
-            # Iteramos mes a mes desde la fecha de inicio hasta hoy
-            max_iter = 600
-            iter_count = 0
-            while fecha_eval <= hoy:
-                iter_count += 1
-                if iter_count > max_iter:
-                    logger.error(
-                        "Loop demasiado largo al calcular deuda para plan %s",
-                        cp.id
-                    )
-                    break
-                mes_inicio = fecha_eval.replace(day=1)
-
-                if (cp.id, mes_inicio) in exclusiones_plan:
-                    continue
-
-                # Verificamos pagos registrados para este mes
-                try:
-                    pagado = PagoDetalle.objects.filter(
-                        plan_asociado=cp,
-                        periodo_mes=mes_inicio
-                    ).aggregate(total=Sum('monto_parcial'))['total'] or 0
-                except Exception as e:
-                    logger.warning(
-                        f"Error al calcular pagos para plan {cp.id}: {e}"
-                    )
-                    pagado = 0
-                monto_mes = Decimal(str(cp.plan.precio))
-                if (
-                    cp.fecha_inicio
-                    and mes_inicio.year == cp.fecha_inicio.year
-                    and mes_inicio.month == cp.fecha_inicio.month
-                    and cp.fecha_inicio.day > 1
-                ):
-                    dias_mes = calendar.monthrange(
-                        mes_inicio.year, mes_inicio.month
-                    )[1]
-                    dias_restantes = dias_mes - cp.fecha_inicio.day + 1
-                    if dias_restantes > 0:
-                        monto_mes = (
-                            monto_mes * Decimal(dias_restantes)
-                            / Decimal(dias_mes)
-                        ).quantize(
-                            Decimal('0.01'), rounding=ROUND_HALF_UP
-                        )
-
-                pagado_decimal = Decimal(str(pagado or 0))
-
-                # Solo añadimos si hay deuda real y el plan tiene monto > 0
-                if monto_mes > 0 and pagado_decimal < monto_mes:
-                    saldo = monto_mes - pagado_decimal
-                    if saldo <= 0:
-                        continue
-                    mes_nombre_es = (
-                        f"{MESES_ES[mes_inicio.month]} {mes_inicio.year}"
-                    )
-                    periodos_deuda.append({
-                        'id': cp.id,
-                        'plan_nombre': cp.plan.nombre,
-                        'mes': mes_inicio,
-                        'mes_nombre': mes_nombre_es,
-                        'monto_original': monto_mes,
-                        'pagado': pagado_decimal,
-                        'saldo': saldo,
-                        'tipo': 'plan'
-                    })
-
-                # Avanzar al siguiente mes de forma segura
-                try:
-                    if fecha_eval.month == 12:
-                        fecha_eval = fecha_eval.replace(
-                            year=fecha_eval.year + 1, month=1, day=1
-                        )
-                    else:
-                        fecha_eval = fecha_eval.replace(
-                            month=fecha_eval.month + 1, day=1
-                        )
-                except ValueError as e:
-                    logger.error(f"Error al calcular fecha siguiente: {e}")
-                    break
-
-        # Procesamos ?rdenes t?cnicas no pagadas
-        try:
-            ots = cliente.ordenes_tecnicas.filter(exonerada=False)
-            if exclusiones_ot:
-                ots = ots.exclude(id__in=exclusiones_ot)
-            for ot in ots:
-                if ot.monto and ot.monto > 0:
-                    pagado_ot = PagoDetalle.objects.filter(
-                        ot_asociada=ot
-                    ).aggregate(total=Sum('monto_parcial'))['total'] or 0
-                    saldo_ot = ot.monto - pagado_ot
-                    if saldo_ot <= 0:
-                        continue
-                    nombre_ot = f"OT: {ot.concepto.nombre}"
-                    if (
-                        ot.concepto.categoria == 'INSTALACION'
-                        and ot.observaciones
-                    ):
-                        nombre_ot = ot.observaciones
-                    periodos_deuda.append({
-                        'id': ot.id,
-                        'plan_nombre': nombre_ot,
-                        'mes': None,
-                        'mes_nombre': "Costo ?nico",
-                        'monto_original': ot.monto,
-                        'pagado': pagado_ot,
-                        'saldo': saldo_ot,
-                        'tipo': 'OT'
-                    })
-        except Exception as e:
-            logger.warning(
-                f"Error al procesar OTs para cliente {cliente.id}: {e}"
-            )
-
         logger.info(
             f"Deuda calculada para cliente {cliente.id}: "
             f"{len(periodos_deuda)} periodos"
@@ -206,19 +466,28 @@ def registrar_movimiento(
     tipo,
     detalle,
     icono='fa-info-circle',
-    clase='secondary'
+    clase='secondary',
+    objeto=None,
+    borrado=False
 ):
+    """Agrega el movimiento al historial del cliente y, si se indica
+    `objeto` (ClientePlan, Pago u OrdenTecnica), también su evento. Con
+    `borrado` el movimiento se guarda como el borrado de `objeto`, así que
+    hay que llamarla antes de delete(). Dentro de una transacción se
+    guardan al confirmarla (ver eventos.py)."""
     try:
-        MovimientoHistorial.objects.create(
-            cliente=cliente,
-            tipo=tipo,
-            detalle=detalle,
-            icono=icono,
-            clase=clase
-        )
+        if borrado:
+            eventos = [evento_borrado(objeto, tipo, detalle, icono, clase)]
+        else:
+            eventos = [
+                evento_movimiento(cliente, tipo, detalle, icono, clase)
+            ]
+            if objeto is not None:
+                eventos.append(evento_de(objeto))
     except Exception:
         logger.exception(
             "No se pudo registrar movimiento para cliente %s",
             cliente.pk if cliente else 'N/A'
         )
-
+        return
+    encolar_eventos(eventos)
\ No newline at end of file
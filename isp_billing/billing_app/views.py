@@ -2,7 +2,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.db.models import Q, Sum, Count
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponse
+from django.http import (
+    FileResponse, Http404, JsonResponse, HttpResponseForbidden, HttpResponse
+)
+from django.urls import reverse
 from django.forms import (
     modelformset_factory,
     ModelChoiceField,
@@ -14,17 +17,19 @@ from django.contrib.auth.decorators import (
 from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.cache import never_cache
-from datetime import datetime, date, time
-from io import BytesIO
+from django.db import transaction
+from datetime import datetime, date
 from decimal import Decimal, InvalidOperation
 import logging
+import os
 import random
 from typing import Any, cast
+from . import dependencias
 from .models import (
     Cliente, Distrito, Sector, Via, Plan, ClientePlan, Pago,
     SerieCorrelativo, Servicio, OrdenTecnicaConcepto, OrdenTecnica,
     MikrotikConfig, Tecnico, DeudaExcluida, EgresoConcepto, Egreso,
-    AppRole, UserRole, CompanySettings
+    AppRole, UserRole, CompanySettings, TrabajoReporte
 )
 from django.contrib.auth import get_user_model
 from .forms import (
@@ -35,7 +40,25 @@ from .forms import (
     AppRoleForm, UserRoleForm, UserCreateForm, UserEditForm,
     CompanySettingsForm
 )
-from .utils import calcular_meses_deuda, registrar_movimiento
+from .utils import registrar_movimiento
+from .cola_reportes import encolar_reporte
+from .antiguedad import calcular_antiguedad
+from .estadisticas import estadisticas_reportes
+from .exportacion import respuesta_reporte, respuesta_xlsx
+from .historial import linea_de_tiempo
+from .paginacion import paginar
+from .reportes import (
+    REPORTES, hojas_clientes, hojas_clientes_planes, hojas_deuda,
+    hojas_ingresos_egresos, hojas_ots
+)
+from .busqueda import (
+    autocompletar_clientes, buscar_clientes, buscar_pagos
+)
+from .cache_dashboard import (
+    estadisticas_dashboard_cacheadas, ultimos_registros_cacheados
+)
+from .cuentas import estados_cuenta
+from .cache_deuda import obtener_deuda_cacheada
 from .permissions import (
     can_delete_cliente,
     can_manage_ajustes,
@@ -78,19 +101,6 @@ def _cliente_servicios_qs(cliente):
     ).distinct().order_by('nombre')
 
 
-def _to_aware_datetime(value):
-    """Convierte date/datetime a datetime aware para ordenar con seguridad."""
-    if value is None:
-        return None
-    if isinstance(value, datetime):
-        if timezone.is_aware(value):
-            return value
-        return timezone.make_aware(value)
-    if isinstance(value, date):
-        return timezone.make_aware(datetime.combine(value, time.min))
-    return None
-
-
 def _to_decimal(value):
     try:
         return Decimal(str(value))
@@ -98,14 +108,6 @@ def _to_decimal(value):
         return Decimal('0')
 
 
-def _normalize_excel_value(value):
-    if isinstance(value, datetime):
-        if timezone.is_aware(value):
-            return timezone.localtime(value).replace(tzinfo=None)
-        return value
-    return value
-
-
 def _clean_text(value):
     if value is None:
         return ''
@@ -174,13 +176,11 @@ def _get_or_create_via(sector, nombre):
 
 def _import_clientes_con_calles_xlsx(file_obj):
     try:
-        from openpyxl import load_workbook
-    except ImportError:
-        return {
-            'import_error': 'Falta instalar openpyxl para leer XLSX.'
-        }
+        openpyxl = dependencias.openpyxl('leer XLSX')
+    except dependencias.DependenciaFaltante as exc:
+        return {'import_error': str(exc)}
 
-    wb = load_workbook(file_obj, data_only=True)
+    wb = openpyxl.load_workbook(file_obj, data_only=True)
     ws = wb.active
     if ws is None:
         return {
@@ -272,110 +272,24 @@ def _import_clientes_con_calles_xlsx(file_obj):
     }
 
 
-def _write_excel_sheet(ws, headers, rows):
-    from openpyxl.utils import get_column_letter
-
-    ws.append(headers)
-    for row in rows:
-        ws.append([_normalize_excel_value(cell) for cell in row])
-
-    for idx, col in enumerate(ws.columns, start=1):
-        max_len = 0
-        for cell in col:
-            if cell.value is None:
-                continue
-            max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[get_column_letter(idx)].width = (
-            min(max_len + 2, 50) if max_len else 12
-        )
-
-
-def _excel_response(filename, sheets):
-    from openpyxl import Workbook
-
-    wb = Workbook()
-    first = sheets[0]
-    ws = cast(Any, wb.active)
-    ws.title = first['title']
-    _write_excel_sheet(ws, first['headers'], first['rows'])
-    for sheet in sheets[1:]:
-        ws = wb.create_sheet(title=sheet['title'])
-        _write_excel_sheet(ws, sheet['headers'], sheet['rows'])
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    response = HttpResponse(
-        output.getvalue(),
-        content_type=(
-            'application/vnd.openxmlformats-officedocument.'
-            'spreadsheetml.sheet'
-        )
-    )
-    response['Content-Disposition'] = (
-        f'attachment; filename="{filename}"'
-    )
-    return response
-
-
 @login_required(login_url='admin:login')
 def dashboard(request):
     """Dashboard principal con estadísticas"""
-    hoy = timezone.localdate()
-    week_start = hoy - timezone.timedelta(days=hoy.weekday())
-    month_start = hoy.replace(day=1)
-
-    pagos_hoy = Pago.objects.filter(
-        fecha__date=hoy
-    ).aggregate(Sum('monto'))['monto__sum'] or 0
-    pagos_semana = (
-        Pago.objects.filter(
-            fecha__date__gte=week_start,
-            fecha__date__lte=hoy
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-    )
-    pagos_mes = (
-        Pago.objects.filter(
-            fecha__date__gte=month_start,
-            fecha__date__lte=hoy
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-    )
-    egresos_mes = (
-        Egreso.objects.filter(
-            fecha__gte=month_start,
-            fecha__lte=hoy
-        ).aggregate(Sum('monto'))['monto__sum'] or 0
-    )
-    balance_mes = _to_decimal(pagos_mes) - _to_decimal(egresos_mes)
-
-    ots_pendientes = OrdenTecnica.objects.filter(completada=False).count()
-    ots_completadas = OrdenTecnica.objects.filter(completada=True).count()
-    ots_pagadas = OrdenTecnica.objects.filter(pagada=True).count()
+    stats = estadisticas_dashboard_cacheadas()
 
     context = {
-        'total_clientes': Cliente.objects.count(),
-        'clientes_activos': Cliente.objects.filter(estado_activo=True).count(),
-        'total_planes': ClientePlan.objects.filter(activo=True).count(),
-        'ots_pendientes': ots_pendientes,
-        'ots_completadas': ots_completadas,
-        'ots_pagadas': ots_pagadas,
-        'pagos_hoy': pagos_hoy,
-        'pagos_semana': pagos_semana,
-        'pagos_mes': pagos_mes,
-        'egresos_mes': egresos_mes,
-        'balance_mes': balance_mes,
-        'ultimos_clientes': (
-            Cliente.objects.all().order_by('-fecha_registro')[:5]
-        ),
-        'ultimos_pagos': (
-            Pago.objects.select_related('cliente')
-            .order_by('-fecha')[:5]
-        ),
-        'ultimas_ots': (
-            OrdenTecnica.objects.select_related('cliente', 'concepto')
-            .order_by('-fecha_creacion')[:5]
-        ),
+        'total_clientes': stats.clientes.total,
+        'clientes_activos': stats.clientes.activos,
+        'total_planes': stats.planes.activos,
+        'ots_pendientes': stats.ordenes.pendientes,
+        'ots_completadas': stats.ordenes.completadas,
+        'ots_pagadas': stats.ordenes.pagadas,
+        'pagos_hoy': stats.pagos.hoy,
+        'pagos_semana': stats.pagos.semana,
+        'pagos_mes': stats.pagos.mes,
+        'egresos_mes': stats.egresos.mes,
+        'balance_mes': stats.balance_mes,
+        **ultimos_registros_cacheados(),
     }
     return render(request, 'billing_app/dashboard.html', context)
 
@@ -482,52 +396,28 @@ def pagos_lista(request):
         return HttpResponseForbidden('Acceso no autorizado')
 
     query = (request.GET.get('q') or '').strip()
-    pagos = (
-        Pago.objects.select_related('cliente')
-        .order_by('-fecha')
-    )
-    if query:
-        pagos = pagos.filter(
-            Q(cliente__nombres__icontains=query)
-            | Q(cliente__apellidos__icontains=query)
-            | Q(cliente__dni__icontains=query)
-            | Q(serie_numero__icontains=query)
-            | Q(tipo_comprobante__icontains=query)
-        )
+    pagos = buscar_pagos(Pago.objects.select_related('cliente'), query)
+    orden = ('-fecha', '-id')
+    if 'relevancia' in pagos.query.annotations:
+        orden = ('-relevancia',) + orden
 
+    pagina = paginar(request, pagos, orden, filtrado=bool(query))
     return render(
         request,
         'billing_app/pagos/lista.html',
         {
-            'pagos': pagos,
+            'pagos': pagina,
+            'pagina': pagina,
             'query': query,
+            'sectores': Sector.objects.select_related('distrito')
+            .order_by('nombre'),
         }
     )
 
 
 @login_required(login_url='admin:login')
 def reportes_index(request):
-    ingresos_total = (
-        Pago.objects.aggregate(total=Sum('monto'))['total'] or 0
-    )
-    egresos_total = (
-        Egreso.objects.aggregate(total=Sum('monto'))['total'] or 0
-    )
-    total_clientes = Cliente.objects.count()
-    total_planes = ClientePlan.objects.count()
-    total_servicios = Servicio.objects.count()
-    total_nodos = MikrotikConfig.objects.count()
-
-    instalaciones = OrdenTecnica.objects.filter(
-        concepto__categoria='INSTALACION'
-    ).count()
-    cortes = OrdenTecnica.objects.filter(
-        concepto__categoria='CORTES'
-    ).count()
-    averias = OrdenTecnica.objects.filter(
-        concepto__categoria='AVERIAS'
-    ).count()
-    ots_completadas = OrdenTecnica.objects.filter(completada=True).count()
+    stats = estadisticas_reportes()
 
     clientes_por_zona = (
         Distrito.objects.annotate(total=Count('sectores__vias__clientes'))
@@ -538,33 +428,23 @@ def reportes_index(request):
         .order_by('-total')
     )
 
-    deuda_rows = []
-    deuda_total = Decimal('0')
-    for cliente in Cliente.objects.all():
-        cliente_id = cast(Any, cliente).id
-        try:
-            deuda = calcular_meses_deuda(cliente)
-        except Exception:
-            logger.exception(
-                'Error calculando deuda para cliente %s',
-                cliente_id
-            )
-            deuda = []
-        total_cliente = sum(
-            (_to_decimal(item.get('saldo')) for item in deuda),
-            Decimal('0')
+    estados = estados_cuenta()
+    deuda_total = (
+        estados.aggregate(total=Sum('saldo_total'))['total']
+        or Decimal('0')
+    )
+    top_deudores = [
+        {'cliente': estado.cliente, 'total': estado.saldo_total}
+        for estado in (
+            estados.filter(saldo_total__gt=0)
+            .select_related('cliente')
+            .order_by('-saldo_total')[:10]
         )
-        if total_cliente > 0:
-            deuda_rows.append({
-                'cliente': cliente,
-                'total': total_cliente
-            })
-        deuda_total += total_cliente
-
-    top_deudores = sorted(
-        deuda_rows, key=lambda x: x['total'], reverse=True
-    )[:10]
-    deuda_ids = {row['cliente'].id for row in deuda_rows}
+    ]
+    deuda_ids = set(
+        estados.filter(saldo_total__gt=0)
+        .values_list('cliente_id', flat=True)
+    )
 
     good_payers = (
         Pago.objects.values('cliente')
@@ -592,16 +472,16 @@ def reportes_index(request):
         request,
         'billing_app/reportes/index.html',
         {
-            'ingresos_total': ingresos_total,
-            'egresos_total': egresos_total,
-            'total_clientes': total_clientes,
-            'total_planes': total_planes,
-            'total_servicios': total_servicios,
-            'total_nodos': total_nodos,
-            'instalaciones': instalaciones,
-            'cortes': cortes,
-            'averias': averias,
-            'ots_completadas': ots_completadas,
+            'ingresos_total': stats.pagos.total,
+            'egresos_total': stats.egresos.total,
+            'total_clientes': stats.clientes.total,
+            'total_planes': stats.planes.total,
+            'total_servicios': stats.servicios,
+            'total_nodos': stats.nodos,
+            'instalaciones': stats.ordenes.instalaciones,
+            'cortes': stats.ordenes.cortes,
+            'averias': stats.ordenes.averias,
+            'ots_completadas': stats.ordenes.completadas,
             'clientes_por_zona': clientes_por_zona,
             'zonas_por_sector': zonas_por_sector,
             'deuda_total': deuda_total,
@@ -613,307 +493,164 @@ def reportes_index(request):
 
 @login_required(login_url='admin:login')
 def reportes_ingresos_egresos(request):
-    pagos = (
-        Pago.objects.select_related('cliente')
-        .prefetch_related(
-            'items__plan_asociado__plan__servicio',
-            'items__ot_asociada__concepto'
-        )
-        .order_by('-fecha')
-    )
-    egresos = (
-        Egreso.objects.select_related('concepto')
-        .order_by('-fecha')
-    )
+    return respuesta_reporte(request, *hojas_ingresos_egresos())
 
-    ingresos_rows = []
-    for pago in pagos:
-        items = list(cast(Any, pago).items.all())
-        if not items:
-            ingresos_rows.append([
-                pago.fecha, str(pago.cliente), pago.cliente.dni,
-                pago.tipo_comprobante, pago.serie_numero,
-                pago.monto, pago.detalles, '', '', '', '', ''
-            ])
-            continue
-        for item in items:
-            plan = item.plan_asociado.plan if item.plan_asociado else None
-            servicio = plan.servicio if plan and plan.servicio else None
-            ot = item.ot_asociada
-            plan_label = ''
-            if plan:
-                plan_label = plan.nombre
-                if servicio:
-                    plan_label = f"{servicio.nombre} - {plan.nombre}"
-            ingresos_rows.append([
-                pago.fecha, str(pago.cliente), pago.cliente.dni,
-                pago.tipo_comprobante, pago.serie_numero,
-                pago.monto, pago.detalles,
-                item.descripcion, item.monto_parcial,
-                item.periodo_mes,
-                plan_label,
-                f"OT-{ot.id} {ot.concepto.nombre}" if ot else ''
-            ])
-
-    egresos_rows = [
-        [
-            egreso.fecha,
-            egreso.concepto.nombre,
-            egreso.monto,
-            egreso.tipo_comprobante,
-            egreso.numero_comprobante,
-            egreso.responsable,
-            egreso.observaciones,
-            egreso.created_at
-        ]
-        for egreso in egresos
-    ]
 
-    return _excel_response(
-        'reporte_ingresos_egresos.xlsx',
-        [
-            {
-                'title': 'Ingresos',
-                'headers': [
-                    'Fecha', 'Cliente', 'DNI', 'Tipo comprobante',
-                    'Serie/Numero', 'Monto pago', 'Detalle pago',
-                    'Detalle item', 'Monto item', 'Periodo mes',
-                    'Plan', 'OT'
-                ],
-                'rows': ingresos_rows
-            },
-            {
-                'title': 'Egresos',
-                'headers': [
-                    'Fecha', 'Concepto', 'Monto', 'Tipo comprobante',
-                    'Numero comprobante', 'Responsable',
-                    'Observaciones', 'Creado'
-                ],
-                'rows': egresos_rows
-            }
-        ]
-    )
+@login_required(login_url='admin:login')
+def reportes_clientes(request):
+    return respuesta_reporte(request, *hojas_clientes())
 
 
 @login_required(login_url='admin:login')
-def reportes_clientes(request):
-    clientes = (
-        Cliente.objects.select_related(
-            'via__sector__distrito', 'mikrotik_vinculado'
-        )
-        .order_by('apellidos', 'nombres')
-    )
-
-    rows = []
-    for cliente in clientes:
-        via = cliente.via
-        sector = via.sector if via else None
-        distrito = sector.distrito if sector else None
-        via_disp = ''
-        if via:
-            via_disp = f"{cast(Any, via).get_tipo_display()} {via.nombre}"
-        rows.append([
-            cliente.apellidos,
-            cliente.nombres,
-            cliente.dni,
-            cliente.celular,
-            distrito.nombre if distrito else '',
-            sector.nombre if sector else '',
-            via_disp,
-            cliente.referencia or '',
-            cliente.estado_activo,
-            cliente.tipo_conexion,
-            cliente.usuario_pppoe or '',
-            cliente.ip_asignada or '',
-            (
-                cliente.mikrotik_vinculado.nombre
-                if cliente.mikrotik_vinculado else ''
-            ),
-            cliente.fecha_registro
-        ])
+def reportes_ots(request):
+    return respuesta_reporte(request, *hojas_ots())
 
-    return _excel_response(
-        'reporte_clientes.xlsx',
-        [
-            {
-                'title': 'Clientes',
-                'headers': [
-                    'Apellidos', 'Nombres', 'DNI', 'Celular',
-                    'Distrito', 'Sector', 'Via', 'Referencia',
-                    'Activo', 'Tipo conexion', 'Usuario PPPoE',
-                    'IP asignada', 'Mikrotik', 'Fecha registro'
-                ],
-                'rows': rows
-            }
-        ]
-    )
+
+@login_required(login_url='admin:login')
+def reportes_clientes_planes(request):
+    return respuesta_reporte(request, *hojas_clientes_planes())
 
 
 @login_required(login_url='admin:login')
-def reportes_ots(request):
-    ots = (
-        OrdenTecnica.objects.select_related(
-            'cliente', 'concepto', 'tecnico_asignado',
-            'servicio_afectado', 'plan_asociado__plan__servicio'
+def reportes_deuda(request):
+    return respuesta_reporte(request, *hojas_deuda())
+
+
+def _trabajo_json(trabajo):
+    data = {
+        'id': trabajo.pk,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'url_estado': reverse('reporte-estado', args=[trabajo.pk]),
+    }
+    if trabajo.estado == TrabajoReporte.ESTADO_LISTO:
+        data['url_descarga'] = reverse(
+            'reporte-descargar', args=[trabajo.pk]
         )
-        .order_by('-fecha_creacion')
-    )
-
-    rows = []
-    for ot in ots:
-        plan = ot.plan_asociado.plan if ot.plan_asociado else None
-        servicio = plan.servicio if plan and plan.servicio else None
-        ot_id = cast(Any, ot).id
-        concepto = cast(Any, ot.concepto)
-        rows.append([
-            ot_id,
-            str(ot.cliente),
-            ot.cliente.dni,
-            concepto.nombre,
-            concepto.get_categoria_display(),
-            (
-                servicio.nombre if servicio
-                else (
-                    ot.servicio_afectado.nombre
-                    if ot.servicio_afectado else ''
-                )
-            ),
-            plan.nombre if plan else '',
-            ot.monto,
-            ot.observaciones or '',
-            ot.completada,
-            ot.pagada,
-            ot.exonerada,
-            ot.fecha_creacion,
-            ot.fecha_finalizacion,
-            ot.tecnico_asignado.nombre if ot.tecnico_asignado else ''
-        ])
-
-    return _excel_response(
-        'reporte_ots.xlsx',
-        [
-            {
-                'title': 'Ordenes Tecnicas',
-                'headers': [
-                    'OT', 'Cliente', 'DNI', 'Concepto', 'Categoria',
-                    'Servicio', 'Plan', 'Monto', 'Observaciones',
-                    'Completada', 'Pagada', 'Exonerada',
-                    'Fecha creacion', 'Fecha finalizacion', 'Tecnico'
-                ],
-                'rows': rows
-            }
-        ]
-    )
+    if trabajo.estado == TrabajoReporte.ESTADO_ERROR:
+        data['error'] = trabajo.error
+    return data
 
 
 @login_required(login_url='admin:login')
-def reportes_clientes_planes(request):
-    planes = (
-        ClientePlan.objects.select_related(
-            'cliente', 'plan__servicio'
+@require_http_methods(['POST'])
+def reporte_encolar(request, tipo):
+    """Encola el reporte para run_report_worker y responde con el id del
+    trabajo; un pedido idéntico en curso devuelve el mismo trabajo."""
+    try:
+        hoja = int(request.POST.get('hoja') or 0)
+    except ValueError:
+        hoja = 0
+    try:
+        trabajo = encolar_reporte(
+            tipo,
+            formato=(request.POST.get('format') or 'xlsx').lower(),
+            hoja=hoja,
+            usuario=request.user
         )
-        .order_by('cliente__apellidos', 'cliente__nombres')
-    )
-
-    rows = []
-    for cliente_plan in planes:
-        plan = cliente_plan.plan
-        servicio = plan.servicio if plan and plan.servicio else None
-        cliente = cliente_plan.cliente
-        rows.append([
-            str(cliente),
-            cliente.dni,
-            plan.nombre if plan else '',
-            servicio.nombre if servicio else '',
-            plan.precio if plan else '',
-            cliente_plan.fecha_inicio,
-            cliente_plan.fecha_cobranza,
-            cliente.estado_activo,
-            cliente.tipo_conexion,
-            cliente.usuario_pppoe or '',
-            cliente.ip_asignada or '',
-            (
-                cliente.mikrotik_vinculado.nombre
-                if cliente.mikrotik_vinculado else ''
-            )
-        ])
+    except ValueError as exc:
+        return JsonResponse(
+            {'status': 'error', 'message': str(exc)}, status=400
+        )
+    return JsonResponse(_trabajo_json(trabajo), status=202)
 
-    return _excel_response(
-        'reporte_clientes_con_planes.xlsx',
-        [
-            {
-                'title': 'Clientes con planes',
-                'headers': [
-                    'Cliente', 'DNI', 'Plan', 'Servicio', 'Precio',
-                    'Fecha inicio', 'Dia cobranza', 'Activo',
-                    'Tipo conexion', 'Usuario PPPoE', 'IP asignada',
-                    'Mikrotik'
-                ],
-                'rows': rows
-            }
-        ]
+
+def _trabajos_visibles(usuario):
+    """Los reportes de REPORTES son los mismos para todos; los lotes de
+    comprobantes y los PDF de un pago sólo los ve quien los pidió."""
+    return TrabajoReporte.objects.filter(
+        Q(tipo__in=REPORTES) | Q(solicitado_por=usuario)
     )
 
 
 @login_required(login_url='admin:login')
-def reportes_deuda(request):
-    rows = []
-    for cliente in Cliente.objects.all().order_by('apellidos', 'nombres'):
-        cliente_id = cast(Any, cliente).id
-        try:
-            deuda = calcular_meses_deuda(cliente)
-        except Exception:
-            logger.exception(
-                'Error calculando deuda para cliente %s',
-                cliente_id
-            )
-            deuda = []
-        total_cliente = sum(
-            (_to_decimal(item.get('saldo')) for item in deuda),
-            Decimal('0')
-        )
-        if total_cliente <= 0:
-            continue
-        rows.append([
-            str(cliente),
-            cliente.dni,
-            cliente.celular,
-            cliente.estado_activo,
-            total_cliente
-        ])
-
-    return _excel_response(
-        'reporte_deuda_pendiente.xlsx',
-        [
-            {
-                'title': 'Deuda pendiente',
-                'headers': [
-                    'Cliente', 'DNI', 'Celular', 'Activo', 'Deuda total'
-                ],
-                'rows': rows
-            }
-        ]
+def reporte_estado(request, pk):
+    trabajo = get_object_or_404(_trabajos_visibles(request.user), pk=pk)
+    return JsonResponse(_trabajo_json(trabajo))
+
+
+@login_required(login_url='admin:login')
+def reporte_descargar(request, pk):
+    trabajo = get_object_or_404(
+        _trabajos_visibles(request.user),
+        pk=pk, estado=TrabajoReporte.ESTADO_LISTO
+    )
+    if not trabajo.archivo:
+        raise Http404('El reporte ya no está disponible')
+    return FileResponse(
+        trabajo.archivo.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(trabajo.archivo.name)
     )
 
 
+def _antiguedad_o_error():
+    try:
+        return calcular_antiguedad(), None
+    except RuntimeError as exc:
+        return None, str(exc)
+
+
+@login_required(login_url='admin:login')
+def reportes_antiguedad(request):
+    antiguedad, error = _antiguedad_o_error()
+    return render(
+        request,
+        'billing_app/reportes/antiguedad.html',
+        {'antiguedad': antiguedad, 'error': error}
+    )
+
+
+@login_required(login_url='admin:login')
+def reportes_antiguedad_excel(request):
+    antiguedad, error = _antiguedad_o_error()
+    if error:
+        return HttpResponse(error, status=500)
+    headers = (
+        ['Grupo']
+        + [f'{tramo} dias' for tramo in antiguedad['tramos']]
+        + ['Total', 'Clientes']
+    )
+    sheets = []
+    for dimension in antiguedad['dimensiones'].values():
+        sheets.append({
+            'title': dimension['titulo'],
+            'headers': headers,
+            'rows': [
+                [fila['nombre']] + fila['tramos']
+                + [fila['total'], fila['clientes']]
+                for fila in dimension['filas']
+            ]
+        })
+    return respuesta_xlsx('reporte_antiguedad_deuda.xlsx', sheets)
+
+
 @login_required(login_url='admin:login')
 def cliente_lista(request):
     """Lista de clientes con búsqueda y filtros"""
     search_query = request.GET.get('q', '')
-    clientes = (
-        Cliente.objects.all()
-        .prefetch_related('planes', 'ordenes_tecnicas')
-    )
-    if search_query:
-        clientes = clientes.filter(
-            Q(apellidos__icontains=search_query) |
-            Q(nombres__icontains=search_query) |
-            Q(dni__icontains=search_query)
-        )
+    clientes = buscar_clientes(
+        Cliente.objects.select_related('via'), search_query
+    )
+    orden = ('apellidos', 'nombres', 'id')
+    if 'relevancia' in clientes.query.annotations:
+        orden = ('-relevancia',) + orden
+    pagina = paginar(
+        request, clientes, orden,
+        filtrado=bool(search_query),
+        anotaciones={
+            'num_planes': Count('planes', distinct=True),
+            'num_ordenes': Count('ordenes_tecnicas', distinct=True),
+        }
+    )
     return render(
         request,
         'billing_app/index.html',
-        {'clientes': clientes, 'search_query': search_query}
+        {
+            'clientes': pagina,
+            'pagina': pagina,
+            'search_query': search_query,
+        }
     )
 
 
@@ -965,96 +702,13 @@ def cliente_eliminar(request, pk):
     return redirect('index')
 
 
-def _construir_historial_cliente(cliente):
-    """Lista de eventos (cortes, planes, instalación, pagos) ordenados
-    por fecha desc."""
-    eventos = []
-    for mov in (
-        cliente.movimientos_historial.all()
-        .order_by('-fecha')[:200]
-    ):
-        eventos.append({
-            'fecha': mov.fecha.date(),
-            'fecha_dt': mov.fecha,
-            'tipo': 'movimiento',
-            'titulo': mov.tipo,
-            'detalle': mov.detalle,
-            'icono': mov.icono,
-            'clase': mov.clase
-        })
-    for cp in _cliente_planes_qs(cliente).all().select_related('plan'):
-        fd = _to_aware_datetime(cp.fecha_inicio)
-        eventos.append({
-            'fecha': cp.fecha_inicio,
-            'fecha_dt': fd,
-            'tipo': 'plan',
-            'titulo': 'Plan asignado / Instalación',
-            'detalle': (
-                f"{cp.plan.nombre} (S/ {cp.plan.precio}), "
-                f"cobranza día {cp.fecha_cobranza}"
-            ),
-            'icono': 'fa-wifi',
-            'clase': 'success'
-        })
-    for p in cliente.pagos.all().order_by('-fecha')[:200]:
-        fecha_dt = _to_aware_datetime(p.fecha)
-        eventos.append({
-            'fecha': p.fecha.date() if hasattr(p.fecha, 'date') else p.fecha,
-            'fecha_dt': fecha_dt,
-            'tipo': 'pago',
-            'titulo': 'Pago',
-            'detalle': f"{p.tipo_comprobante} {p.serie_numero} - S/ {p.monto}",
-            'icono': 'fa-money-bill-wave',
-            'clase': 'primary'
-        })
-    for ot in (
-        cliente.ordenes_tecnicas.all()
-        .select_related('concepto')
-        .order_by('-fecha_creacion')
-    ):
-        f = ot.fecha_finalizacion or ot.fecha_creacion
-        fecha_dt = _to_aware_datetime(f)
-        nombre = (ot.concepto.nombre or '').lower()
-        if 'corte' in nombre or ot.concepto.categoria == 'CORTES':
-            tipo_label = 'Corte'
-            icono = 'fa-ban'
-            clase = 'danger'
-        elif 'reconexion' in nombre or 'reconexi?n' in nombre:
-            tipo_label = 'Reconexión'
-            icono = 'fa-plug'
-            clase = 'success'
-        else:
-            tipo_label = 'Orden técnica'
-            icono = 'fa-tools'
-            clase = 'warning'
-        status_label = (
-            ' (completada)' if ot.completada else ' (pendiente)'
-        )
-        eventos.append({
-            'fecha': f.date() if hasattr(f, 'date') else f,
-            'fecha_dt': fecha_dt,
-            'tipo': 'ot',
-            'titulo': tipo_label,
-            'detalle': (
-                f"{ot.concepto.nombre} - S/ {ot.monto}{status_label}"
-            ),
-            'icono': icono,
-            'clase': clase
-        })
-    eventos.sort(
-        key=lambda x: x['fecha_dt'] or timezone.now(),
-        reverse=True
-    )
-    return eventos[:150]
-
-
 @login_required(login_url='admin:login')
 def cliente_detalle(request, pk):
     """Detalle completo del cliente con deuda, OTs e historial de
     movimientos."""
     cliente = get_object_or_404(Cliente, pk=pk)
     try:
-        deuda = calcular_meses_deuda(cliente)
+        deuda = obtener_deuda_cacheada(cliente)
     except Exception:
         deuda = []
         logger.exception("Error calculando deuda para cliente %s", cliente.pk)
@@ -1068,7 +722,7 @@ def cliente_detalle(request, pk):
     ).select_related('concepto', 'tecnico_asignado').order_by(
         '-fecha_creacion'
     )
-    historial = _construir_historial_cliente(cliente)
+    historial, historial_siguiente = linea_de_tiempo(cliente)
     mikrotik_id = None
     if cliente.mikrotik_vinculado:
         mikrotik_id = cast(Any, cliente.mikrotik_vinculado).id
@@ -1086,11 +740,42 @@ def cliente_detalle(request, pk):
         'deuda': deuda,
         'total_deuda': total_deuda,
         'historial': historial,
+        'historial_siguiente': historial_siguiente,
         'mikrotik_id': mikrotik_id,
         'mikrotik_connected': mikrotik_connected
     })
 
 
+@login_required(login_url='admin:login')
+def cliente_historial(request, pk):
+    """AJAX: Eventos anteriores al cursor ?antes= del historial"""
+    cliente = get_object_or_404(Cliente, pk=pk)
+    try:
+        eventos, siguiente = linea_de_tiempo(
+            cliente, cursor=request.GET.get('antes') or None
+        )
+    except ValueError as exc:
+        return JsonResponse(
+            {'status': 'error', 'message': str(exc)}, status=400
+        )
+    return JsonResponse({
+        'eventos': [
+            {
+                'fecha': timezone.localtime(ev['fecha_dt']).strftime(
+                    '%d/%m/%Y' if ev['tipo'] == 'plan' else '%d/%m/%Y %H:%M'
+                ),
+                'tipo': ev['tipo'],
+                'titulo': ev['titulo'],
+                'detalle': ev['detalle'],
+                'icono': ev['icono'],
+                'clase': ev['clase'],
+            }
+            for ev in eventos
+        ],
+        'siguiente': siguiente,
+    })
+
+
 @login_required(login_url='admin:login')
 @require_http_methods(["POST"])
 def cliente_status_toggle(request, pk):
@@ -1139,6 +824,21 @@ def ajax_load_vias(request):
     return JsonResponse(vias_list, safe=False)
 
 
+@login_required(login_url='admin:login')
+def ajax_autocompletar_clientes(request):
+    """AJAX: Sugerencias de clientes por prefijo de DNI o de nombre"""
+    consulta = (request.GET.get('q') or '').strip()
+    if len(consulta) < 2:
+        return JsonResponse([], safe=False)
+    try:
+        limite = int(request.GET.get('limite', 10))
+    except ValueError:
+        limite = 10
+    return JsonResponse(
+        autocompletar_clientes(consulta, limite), safe=False
+    )
+
+
 @login_required(login_url='admin:login')
 def cliente_agregar_plan(request, pk):
     """Agrega un nuevo plan a un cliente; muestra catálogo de planes."""
@@ -1157,7 +857,8 @@ def cliente_agregar_plan(request, pk):
                 'Plan creado',
                 f"Se asignó el plan {cliente_plan.plan.nombre}",
                 icono='fa-wifi',
-                clase='success'
+                clase='success',
+                objeto=cliente_plan
             )
             return redirect('cliente-detalle', pk=cliente.pk)
     else:
@@ -1192,7 +893,8 @@ def cliente_editar_plan(request, pk, plan_id):
                 'Plan actualizado',
                 f"Plan actualizado: {actualizado.plan.nombre}",
                 icono='fa-pen',
-                clase='info'
+                clase='info',
+                objeto=actualizado
             )
             return redirect('cliente-detalle', pk=cliente.pk)
     else:
@@ -1216,15 +918,16 @@ def cliente_eliminar_plan(request, pk, plan_id):
     cliente_plan = get_object_or_404(
         ClientePlan, pk=plan_id, cliente=cliente
     )
-    plan_nombre = cliente_plan.plan.nombre
-    cliente_plan.delete()
     registrar_movimiento(
         cliente,
         'Plan eliminado',
-        f"Se eliminó el plan {plan_nombre}",
+        f"Se eliminó el plan {cliente_plan.plan.nombre}",
         icono='fa-trash-alt',
-        clase='danger'
+        clase='danger',
+        objeto=cliente_plan,
+        borrado=True
     )
+    cliente_plan.delete()
     return redirect('cliente-detalle', pk=cliente.pk)
 
 
@@ -1243,7 +946,9 @@ def cliente_deuda_eliminar(request, pk):
             'Deuda OT eliminada',
             f"OT eliminada desde estado de cuenta: {ot.concepto.nombre}",
             icono='fa-trash-alt',
-            clase='danger'
+            clase='danger',
+            objeto=ot,
+            borrado=True
         )
         ot.delete()
         return redirect('cliente-detalle', pk=cliente.pk)
@@ -1283,6 +988,7 @@ def api_generar_id_pppoe(request):
 
 
 @login_required(login_url='admin:login')
+@transaction.atomic
 def cliente_crear_ot(request, pk):
     """Crea orden tecnica para un cliente (panel lateral)."""
     cliente = get_object_or_404(Cliente, pk=pk)
@@ -1376,7 +1082,8 @@ def cliente_crear_ot(request, pk):
                             'Plan creado',
                             f"Se asignó el plan {plan.nombre}",
                             icono='fa-wifi',
-                            clase='success'
+                            clase='success',
+                            objeto=cliente_plan
                         )
                     ot = OrdenTecnica.objects.create(
                         cliente=cliente,
@@ -1490,7 +1197,8 @@ def cliente_crear_ot(request, pk):
                     'OT creada',
                     f"{ot.concepto.nombre} - S/ {ot.monto}",
                     icono='fa-tools',
-                    clase='warning'
+                    clase='warning',
+                    objeto=ot
                 )
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'ok': True})
@@ -1564,6 +1272,7 @@ def cliente_crear_ot(request, pk):
 
 
 @login_required(login_url='admin:login')
+@transaction.atomic
 def cliente_ot_crear(request, pk):
     """Crea orden técnica para cliente (GET: datos, POST: crear OT)"""
     cliente = get_object_or_404(Cliente, pk=pk)
@@ -1685,7 +1394,8 @@ def cliente_ot_crear(request, pk):
                     'OT creada',
                     f"{ot.concepto.nombre}",
                     icono='fa-tools',
-                    clase='warning'
+                    clase='warning',
+                    objeto=ot
                 )
 
             return JsonResponse({
@@ -1694,6 +1404,7 @@ def cliente_ot_crear(request, pk):
                 'message': f'{len(creadas)} OT(s) creada(s) correctamente'
             })
         except Exception as e:
+            transaction.set_rollback(True)
             return JsonResponse({
                 'ok': False,
                 'error': f'Error en servidor: {str(e)}'
@@ -1885,7 +1596,8 @@ def ot_completar(request, pk):
         'OT completada',
         f"{ot.concepto.nombre} - S/ {ot.monto}",
         icono='fa-check',
-        clase='success'
+        clase='success',
+        objeto=ot
     )
     return redirect(request.META.get('HTTP_REFERER', 'tecnico-lista'))
 
@@ -1901,7 +1613,9 @@ def ot_eliminar(request, pk):
         'OT eliminada',
         f"{ot.concepto.nombre} - S/ {ot.monto}",
         icono='fa-trash-alt',
-        clase='danger'
+        clase='danger',
+        objeto=ot,
+        borrado=True
     )
     ot.delete()
     return redirect('cliente-detalle', pk=cliente_id)
@@ -2004,13 +1718,13 @@ def mikrotik_sync(request):
                 error = 'Clave requerida'
             else:
                 try:
-                    from routeros_api import RouterOsApiPool
-                except ImportError:
-                    error = 'Falta instalar routeros-api'
+                    routeros_api = dependencias.routeros_api()
+                except dependencias.DependenciaFaltante as exc:
+                    error = str(exc)
                 else:
                     api_pool = None
                     try:
-                        api_pool = RouterOsApiPool(
+                        api_pool = routeros_api.RouterOsApiPool(
                             selected.ip_host,
                             username=selected.usuario,
                             password=password,
@@ -2123,16 +1837,13 @@ def mikrotik_status(request, pk):
         return JsonResponse({'ok': False, 'error': 'Clave requerida'})
 
     try:
-        from routeros_api import RouterOsApiPool
-    except ImportError:
-        return JsonResponse({
-            'ok': False,
-            'error': 'Falta instalar routeros-api'
-        })
+        routeros_api = dependencias.routeros_api()
+    except dependencias.DependenciaFaltante as exc:
+        return JsonResponse({'ok': False, 'error': str(exc)})
 
     api_pool = None
     try:
-        api_pool = RouterOsApiPool(
+        api_pool = routeros_api.RouterOsApiPool(
             config.ip_host,
             username=config.usuario,
             password=password,
@@ -2202,16 +1913,13 @@ def mikrotik_traffic(request, pk):
         })
 
     try:
-        from routeros_api import RouterOsApiPool
-    except ImportError:
-        return JsonResponse({
-            'ok': False,
-            'error': 'Falta instalar routeros-api'
-        })
+        routeros_api = dependencias.routeros_api()
+    except dependencias.DependenciaFaltante as exc:
+        return JsonResponse({'ok': False, 'error': str(exc)})
 
     api_pool = None
     try:
-        api_pool = RouterOsApiPool(
+        api_pool = routeros_api.RouterOsApiPool(
             config.ip_host,
             username=config.usuario,
             password=stored['password'],
@@ -2280,14 +1988,12 @@ def egreso_concepto_lista(request):
 def egreso_lista(request):
     if not (can_manage_caja(request.user) or can_manage_ajustes(request.user)):
         return HttpResponseForbidden('Acceso no autorizado')
-    egresos = (
-        Egreso.objects.select_related('concepto')
-        .order_by('-fecha', '-created_at')
-    )
+    egresos = Egreso.objects.select_related('concepto')
+    pagina = paginar(request, egresos, ('-fecha', '-id'))
     return render(
         request,
         'billing_app/ajustes/egreso_lista.html',
-        {'egresos': egresos}
+        {'egresos': pagina, 'pagina': pagina}
     )
 
 
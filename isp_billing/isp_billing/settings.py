@@ -115,6 +115,21 @@ else:
     }
 
 
+# Cache (memoria local por defecto). La deuda cacheada se valida contra la
+# base en cada lectura; las demás entradas (dashboard) pueden ir por detrás
+# de otros procesos, así que con varios workers de gunicorn conviene un
+# backend compartido (FileBasedCache, Redis o DatabaseCache)
+CACHES = {
+    'default': {
+        'BACKEND': getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': getenv('CACHE_LOCATION', 'isp-billing'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 